@@ -1,19 +1,118 @@
+import codecs
+import json
+import os
 import re
 
+# Phrase -> penalty added to the risk score when the phrase appears
+DEFAULT_RED_FLAGS = {
+    "auditor resignation": 25,
+    "delayed filing": 25,
+    "restatement": 25,
+    "sec probe": 25,
+    "short seller report": 25,
+    "accounting irregularities": 25,
+    "material weakness": 25,
+    "going concern": 25,
+}
+RED_FLAGS_PATH = os.getenv("FORENSIC_RED_FLAGS_PATH")
+
+# Carry-over between streamed chunks; must exceed the longest possible match
+STREAM_OVERLAP = 512
+MAX_POSITIONS_PER_FLAG = 1000
+
+def _normalize_phrase(text):
+    return " ".join(text.lower().split())
+
+class ForensicStream:
+    """Incremental scanner: feed() chunks of a document, then result()."""
+
+    def __init__(self, agent, encoding="utf-8"):
+        self.agent = agent
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._tail = ""
+        self._offset = 0  # absolute position of the start of _tail
+        self._hits = {}
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        buffer = self._tail + chunk
+        boundary = len(self._tail)
+        for match in self.agent.pattern.finditer(buffer):
+            # Matches wholly inside the carried tail were counted by the previous feed
+            if match.end() <= boundary:
+                continue
+            self.agent._record(self._hits, match, self._offset)
+        keep = min(len(buffer), STREAM_OVERLAP)
+        self._offset += len(buffer) - keep
+        self._tail = buffer[len(buffer) - keep:]
+
+    def feed_bytes(self, data):
+        self.feed(self._decoder.decode(data))
+
+    def result(self):
+        self.feed(self._decoder.decode(b"", final=True))
+        return self.agent._summarize(self._hits)
+
 class ForensicAgent:
+    def __init__(self, red_flags=None):
+        if red_flags is None and RED_FLAGS_PATH:
+            with open(RED_FLAGS_PATH) as f:
+                red_flags = json.load(f)
+        self.set_red_flags(red_flags or DEFAULT_RED_FLAGS)
+
+    def set_red_flags(self, red_flags):
+        """Compiles the weighted dictionary into a single case-insensitive automaton."""
+        self.red_flags = {_normalize_phrase(flag): weight for flag, weight in red_flags.items()}
+        # Longest phrases first so overlapping flags prefer the most specific one;
+        # words may be separated by any whitespace (line breaks in filings).
+        alternatives = sorted(self.red_flags, key=len, reverse=True)
+        self.pattern = re.compile(
+            "|".join(r"\s+".join(re.escape(word) for word in flag.split()) for flag in alternatives),
+            re.IGNORECASE
+        )
+
+    def _record(self, hits, match, offset=0):
+        flag = _normalize_phrase(match.group())
+        entry = hits.setdefault(flag, {"count": 0, "positions": []})
+        entry["count"] += 1
+        if len(entry["positions"]) < MAX_POSITIONS_PER_FLAG:
+            entry["positions"].append(offset + match.start())
+
+    def _summarize(self, hits):
+        matches = {
+            flag: {"weight": self.red_flags[flag], **entry}
+            for flag, entry in hits.items()
+        }
+        # Each distinct flag is penalized once, however often it repeats
+        risk_score = sum(self.red_flags[flag] for flag in hits)
+        return {
+            "risk_score": min(risk_score, 100),
+            "total_matches": sum(entry["count"] for entry in hits.values()),
+            "matches": matches
+        }
+
+    def scan(self, text):
+        """Full scan report: score, per-flag counts and character positions."""
+        hits = {}
+        for match in self.pattern.finditer(text):
+            self._record(hits, match)
+        return self._summarize(hits)
+
     def scan_risk(self, text):
-        risk_score = 0
-        red_flags = [
-            "auditor resignation", "delayed filing", "restatement", 
-            "sec probe", "short seller report", "accounting irregularities",
-            "material weakness", "going concern"
-        ]
-        
-        text_lower = text.lower()
-        for flag in red_flags:
-            if flag in text_lower:
-                risk_score += 25 # High penalty per flag
-                
-        return min(risk_score, 100)
+        return self.scan(text)["risk_score"]
+
+    def scan_batch(self, texts):
+        return [self.scan(text) for text in texts]
+
+    def stream(self, encoding="utf-8"):
+        return ForensicStream(self, encoding)
+
+    def scan_bytes_stream(self, chunks, encoding="utf-8"):
+        """Scans an iterable of byte chunks in one pass, decoding incrementally."""
+        stream = self.stream(encoding)
+        for chunk in chunks:
+            stream.feed_bytes(chunk)
+        return stream.result()
 
 forensic_agent = ForensicAgent()
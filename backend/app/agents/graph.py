@@ -1,10 +1,17 @@
 from typing import TypedDict, List, Optional
 from langgraph.graph import StateGraph, END
-from app.agents.nodes import deduplication_node, entity_extraction_node, impact_analysis_node, storage_node, trader_node
+from app.agents.nodes import entity_extraction_node, impact_analysis_node
+from app.agents.nodes import deduplication_node_async, storage_node_async, trader_node_async
+from app.agents.nodes import (
+    batch_entity_extraction_node, batch_impact_analysis_node,
+    batch_deduplication_node_async, batch_storage_node_async, batch_trader_node_async
+)
 
 class AgentState(TypedDict):
     news_item: dict
     is_duplicate: Optional[bool]
+    duplicate_of: Optional[str]
+    embedding: Optional[List[float]]
     entities: Optional[List[str]]
     sentiment_score: Optional[float]
     market_impact: Optional[str]
@@ -12,14 +19,27 @@ class AgentState(TypedDict):
     forensic_score: Optional[int]
     trade_result: Optional[dict]
 
-def create_graph():
+class BatchState(TypedDict):
+    # One AgentState per news item, processed together
+    items: List[AgentState]
+
+def _add_nodes(workflow, nodes, wrap=None):
+    # `wrap(name, fn)` lets tools (e.g. the load generator) instrument nodes
+    for name, fn in nodes:
+        workflow.add_node(name, wrap(name, fn) if wrap else fn)
+
+def create_graph(wrap=None):
+    # Dedup/storage/trader are async variants that push model and DB work
+    # off the event loop; entity/impact are cheap enough to run inline.
     workflow = StateGraph(AgentState)
     
-    workflow.add_node("dedup", deduplication_node)
-    workflow.add_node("entity", entity_extraction_node)
-    workflow.add_node("impact", impact_analysis_node)
-    workflow.add_node("storage", storage_node)
-    workflow.add_node("trader", trader_node)
+    _add_nodes(workflow, [
+        ("dedup", deduplication_node_async),
+        ("entity", entity_extraction_node),
+        ("impact", impact_analysis_node),
+        ("storage", storage_node_async),
+        ("trader", trader_node_async),
+    ], wrap)
     
     workflow.set_entry_point("dedup")
     
@@ -40,3 +60,35 @@ def create_graph():
     workflow.add_edge("trader", END)
     
     return workflow.compile()
+
+def create_batch_graph(wrap=None):
+    """Same pipeline as create_graph, but each node handles a list of items at once."""
+    workflow = StateGraph(BatchState)
+
+    _add_nodes(workflow, [
+        ("dedup", batch_deduplication_node_async),
+        ("entity", batch_entity_extraction_node),
+        ("impact", batch_impact_analysis_node),
+        ("storage", batch_storage_node_async),
+        ("trader", batch_trader_node_async),
+    ], wrap)
+
+    workflow.set_entry_point("dedup")
+
+    def should_continue(batch):
+        if all(s.get("is_duplicate") for s in batch["items"]):
+            return END
+        return "entity"
+
+    workflow.add_conditional_edges(
+        "dedup",
+        should_continue,
+        {END: END, "entity": "entity"}
+    )
+
+    workflow.add_edge("entity", "impact")
+    workflow.add_edge("impact", "storage")
+    workflow.add_edge("storage", "trader")
+    workflow.add_edge("trader", END)
+
+    return workflow.compile()
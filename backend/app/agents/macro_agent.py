@@ -1,20 +1,166 @@
+import csv
+import json
+import os
 import random
+import threading
+import time
 
-class MacroAgent:
-    def analyze_regime(self):
-        # Mock Logic: Randomly switch regimes or base on time
-        # In real app, check VIX, Bond Yields, etc.
-        
-        indicators = {
+import numpy as np
+
+INDICATORS = ("VIX", "10Y_Yield", "Oil")
+# Regime snapshot lifetime; the scheduler refreshes it before it expires
+MACRO_TTL_SECONDS = float(os.getenv("MACRO_TTL_SECONDS", "60"))
+MACRO_REFRESH_SECONDS = float(os.getenv("MACRO_REFRESH_SECONDS", str(MACRO_TTL_SECONDS / 2)))
+MACRO_HISTORY_SIZE = int(os.getenv("MACRO_HISTORY_SIZE", "2880"))
+# Retry delay after a failed provider fetch: doubles per consecutive failure, capped
+MACRO_BACKOFF_SECONDS = float(os.getenv("MACRO_BACKOFF_SECONDS", "5"))
+MACRO_BACKOFF_MAX_SECONDS = float(os.getenv("MACRO_BACKOFF_MAX_SECONDS", "300"))
+MACRO_PROVIDER = os.getenv("MACRO_PROVIDER", "mock")
+MACRO_FIXTURE_PATH = os.getenv("MACRO_FIXTURE_PATH")
+
+REGIME_CODES = {"Risk-On": 0, "Risk-Off": 1}
+REGIME_NAMES = {code: name for name, code in REGIME_CODES.items()}
+
+class MockIndicatorProvider:
+    """Random draws in plausible ranges (the original mock)."""
+    name = "mock"
+
+    def fetch(self):
+        return {
             "VIX": random.uniform(15, 35),
             "10Y_Yield": random.uniform(3.5, 5.0),
             "Oil": random.uniform(70, 95)
         }
-        
-        # Simple Rule
-        if indicators["VIX"] > 25 or indicators["10Y_Yield"] > 4.5:
-            return "Risk-Off"
-        else:
-            return "Risk-On"
+
+class FixtureIndicatorProvider:
+    """
+    Replays a local fixture (JSON list of objects, or CSV with one column
+    per indicator), advancing one row per fetch and wrapping around.
+    """
+    name = "fixture"
+
+    def __init__(self, path=MACRO_FIXTURE_PATH):
+        with open(path, newline="") as f:
+            if path.endswith(".json"):
+                rows = json.load(f)
+            else:
+                rows = list(csv.DictReader(f))
+        self.rows = [{k: float(row[k]) for k in INDICATORS} for row in rows]
+        self._position = 0
+
+    def fetch(self):
+        row = self.rows[self._position % len(self.rows)]
+        self._position += 1
+        return row
+
+class MarketDataIndicatorProvider:
+    """Latest daily closes of ^VIX, ^TNX and crude futures from the price store."""
+    name = "market"
+    SYMBOLS = {"VIX": "^VIX", "10Y_Yield": "^TNX", "Oil": "CL=F"}
+
+    def fetch(self):
+        from app.services.price_store import price_store
+        values = {}
+        for indicator, symbol in self.SYMBOLS.items():
+            closes = price_store.get_closes(symbol, "5d")
+            if not len(closes):
+                raise ValueError(f"No data for {symbol}")
+            values[indicator] = float(closes[-1])
+        return values
+
+def default_indicator_provider():
+    if MACRO_PROVIDER == "fixture" and MACRO_FIXTURE_PATH:
+        return FixtureIndicatorProvider()
+    if MACRO_PROVIDER == "market":
+        return MarketDataIndicatorProvider()
+    return MockIndicatorProvider()
+
+def classify_regime(indicators):
+    # Simple Rule
+    if indicators["VIX"] > 25 or indicators["10Y_Yield"] > 4.5:
+        return "Risk-Off"
+    return "Risk-On"
+
+class MacroAgent:
+    """
+    Shared regime snapshot. A scheduled refresh pulls indicators from the
+    provider; readers get the cached snapshot (O(1)) until its TTL lapses.
+    Every refresh is appended to a fixed-size numpy ring buffer. When the
+    provider fails, the stale snapshot is served and the next fetch is
+    delayed by an exponential backoff instead of retrying on every read.
+    """
+
+    def __init__(self, provider=None, ttl=MACRO_TTL_SECONDS, history_size=MACRO_HISTORY_SIZE,
+                 backoff=MACRO_BACKOFF_SECONDS, max_backoff=MACRO_BACKOFF_MAX_SECONDS):
+        self.provider = provider or default_indicator_provider()
+        self.ttl = ttl
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._failures = 0
+        self._snapshot = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # Columns: timestamp, regime code, then one per indicator
+        self._history = np.full((history_size, 2 + len(INDICATORS)), np.nan)
+        self._head = 0
+        self._count = 0
+
+    def refresh(self):
+        """Fetches indicators, reclassifies and records them. Keeps the old snapshot on failure."""
+        ttl = self.ttl
+        try:
+            indicators = self.provider.fetch()
+            self._failures = 0
+        except Exception as e:
+            self._failures += 1
+            ttl = min(self.backoff * 2 ** (self._failures - 1), self.max_backoff)
+            print(f"Macro indicator refresh failed ({self.provider.name}): {e}; retrying in {ttl:.0f}s")
+            with self._lock:
+                if self._snapshot is not None:
+                    self._expires_at = time.time() + ttl
+                    return self._snapshot
+            # Nothing cached yet: fall back to the mock so the pipeline can trade
+            indicators = MockIndicatorProvider().fetch()
+        regime = classify_regime(indicators)
+        now = time.time()
+        snapshot = {
+            "regime": regime,
+            "indicators": {k: float(indicators[k]) for k in INDICATORS},
+            "as_of": now,
+            "provider": self.provider.name
+        }
+        with self._lock:
+            self._history[self._head] = (now, REGIME_CODES[regime], *(indicators[k] for k in INDICATORS))
+            self._head = (self._head + 1) % len(self._history)
+            self._count = min(self._count + 1, len(self._history))
+            self._snapshot = snapshot
+            self._expires_at = now + ttl
+        return snapshot
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() < self._expires_at:
+            return snapshot
+        # Only one caller refreshes an expired snapshot; the rest reuse its result
+        with self._refresh_lock:
+            if self._snapshot is not None and time.time() < self._expires_at:
+                return self._snapshot
+            return self.refresh()
+
+    def analyze_regime(self):
+        return self.snapshot()["regime"]
+
+    def history(self, limit=None):
+        """Recorded snapshots, oldest first (at most `limit` of the newest)."""
+        with self._lock:
+            count = self._count if limit is None else max(0, min(limit, self._count))
+            index = (self._head - count + np.arange(count)) % len(self._history)
+            rows = self._history[index].copy()
+        return {
+            "timestamps": rows[:, 0].tolist(),
+            "regimes": [REGIME_NAMES[int(code)] for code in rows[:, 1]],
+            "indicators": {name: rows[:, 2 + i].tolist() for i, name in enumerate(INDICATORS)}
+        }
 
 macro_agent = MacroAgent()
@@ -1,75 +1,88 @@
 import random
 import json
-from app.core.database import get_chroma_client, get_db_connection
+from app.core.database import db_session
+from app.services.dedup import news_deduplicator
 from app.services.local_rag import local_rag_service
+from app.services.graph_analytics import supply_chain_graph
+from app.services.market import knowledge_graph
+
+NEWS_INSERT_SQL = """
+    INSERT INTO news (id, ticker, headline, source, timestamp, sentiment_score, market_impact, summary, entities)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _mark_duplicate(state, duplicate_of, reason):
+    state["is_duplicate"] = duplicate_of is not None
+    if duplicate_of is not None:
+        state["duplicate_of"] = duplicate_of
+        print(f"Duplicate of {duplicate_of} ({reason}), skipping.")
+    return state
+
+def _register(state, embedding):
+    duplicate_of, reason = news_deduplicator.check_and_register(state["news_item"], embedding)
+    state["embedding"] = embedding
+    return _mark_duplicate(state, duplicate_of, reason)
 
 def deduplication_node(state):
     print("--- DEDUPLICATION NODE ---")
     news_item = state["news_item"]
-    client = get_chroma_client()
-    collection = client.get_collection("news_embeddings")
-    
-    # In a real app, we would generate an embedding for the headline
-    # and query the collection.
-    # results = collection.query(query_embeddings=[embedding], n_results=1)
-    
-    # For this mock, we'll assume it's unique
-    state["is_duplicate"] = False
-    return state
 
-def entity_extraction_node(state):
-    print("--- ENTITY EXTRACTION NODE ---")
-    if state.get("is_duplicate"):
-        return state
-        
+    # 1. Cheap pass: exact / near-exact headline copies (no model call)
+    duplicate_of = news_deduplicator.match_headline(news_item)
+    if duplicate_of is not None:
+        return _mark_duplicate(state, duplicate_of, "headline")
+
+    # 2. Semantic pass: embed once, reused by storage_node for Chroma
+    embedding = local_rag_service.embed_text(local_rag_service.build_document(news_item))
+    return _register(state, embedding)
+
+def _extract_entities(state):
     news_item = state["news_item"]
     # In a real app, use an LLM to extract entities
     entities = [news_item["ticker"]]
     state["entities"] = entities
     return state
 
-def impact_analysis_node(state):
-    print("--- IMPACT ANALYSIS NODE ---")
+def entity_extraction_node(state):
+    print("--- ENTITY EXTRACTION NODE ---")
     if state.get("is_duplicate"):
         return state
-        
+    return _extract_entities(state)
+
+def _analyze_impact(state):
     headline = state["news_item"]["headline"]
-    
+
     # Mock sentiment logic
     sentiment_score = random.uniform(-0.2, 0.2) # Default neutral-ish
-    
+
     positive_keywords = ["beat", "upgrade", "rally", "jump", "acquire", "revolutionary"]
     negative_keywords = ["scrutiny", "resignation", "issues", "hit", "weigh"]
-    
+
     if any(k in headline.lower() for k in positive_keywords):
         sentiment_score = random.uniform(0.5, 0.9)
     elif any(k in headline.lower() for k in negative_keywords):
         sentiment_score = random.uniform(-0.9, -0.5)
-        
+
     if abs(sentiment_score) > 0.6:
         impact_label = "High"
     elif abs(sentiment_score) > 0.3:
         impact_label = "Medium"
     else:
         impact_label = "Low"
-        
+
     state["sentiment_score"] = sentiment_score
     state["market_impact"] = impact_label
     return state
 
-def storage_node(state):
-    print("--- STORAGE NODE ---")
+def impact_analysis_node(state):
+    print("--- IMPACT ANALYSIS NODE ---")
     if state.get("is_duplicate"):
         return state
-        
+    return _analyze_impact(state)
+
+def _news_row(state):
     news_item = state["news_item"]
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO news (id, ticker, headline, source, timestamp, sentiment_score, market_impact, summary, entities)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+    return (
         news_item["id"],
         news_item["ticker"],
         news_item["headline"],
@@ -79,40 +92,190 @@ def storage_node(state):
         state["market_impact"],
         news_item["headline"], # Using headline as summary for now
         json.dumps(state["entities"])
-    ))
-    conn.commit()
-    conn.close()
-    
+    )
+
+def storage_node(state):
+    print("--- STORAGE NODE ---")
+    if state.get("is_duplicate"):
+        return state
+
+    news_item = state["news_item"]
+    try:
+        with db_session() as conn:
+            conn.execute(NEWS_INSERT_SQL, _news_row(state))
+    except Exception:
+        # Not persisted: release the dedup entry reserved by the dedup node
+        news_deduplicator.unregister(news_item["id"])
+        raise
+
     # Store in Chroma via Local RAG
-    local_rag_service.store_news(news_item)
-    
+    local_rag_service.store_news(news_item, embedding=state.get("embedding"))
+    supply_chain_graph.record(news_item, state["sentiment_score"])
+    knowledge_graph.record(news_item["ticker"])
+
     return state
 
 from app.agents.macro_agent import macro_agent
 from app.agents.forensic_agent import forensic_agent
 from app.agents.trader_agent import trader_agent
 
-def trader_node(state):
-    print("--- TRADER NODE ---")
-    if state.get("is_duplicate"):
-        return state
-        
+def _report_trade(state):
+    trade_result = state["trade_result"]
+    if trade_result["action"] != "SKIP":
+        print(f"👻 GHOST TRADER EXECUTED: {trade_result['action']} {state['news_item']['ticker']}")
+
+def _trade(state):
     news_item = state["news_item"]
     sentiment_score = state["sentiment_score"]
-    
-    # 1. Macro Check
+
+    # 1. Macro Check (cached snapshot, refreshed by the scheduler)
     market_regime = macro_agent.analyze_regime()
     state["market_regime"] = market_regime
-    
+
     # 2. Forensic Check
     forensic_score = forensic_agent.scan_risk(news_item["headline"])
     state["forensic_score"] = forensic_score
-    
+
     # 3. Trade Execution
     trade_result = trader_agent.evaluate_trade(news_item, sentiment_score, market_regime, forensic_score)
     state["trade_result"] = trade_result
-    
-    if trade_result["action"] != "SKIP":
-        print(f"👻 GHOST TRADER EXECUTED: {trade_result['action']} {news_item['ticker']}")
-    
+    _report_trade(state)
+
     return state
+
+def trader_node(state):
+    print("--- TRADER NODE ---")
+    if state.get("is_duplicate"):
+        return state
+    return _trade(state)
+
+# --- Batch variants ---
+# These operate on {"items": [AgentState, ...]} and amortize the model call,
+# the SQLite transaction and the Chroma write across the whole batch.
+
+def _unique(batch):
+    return [s for s in batch["items"] if not s.get("is_duplicate")]
+
+def _batch_headline_pass(batch):
+    """Marks headline copies; returns the states that still need an embedding."""
+    pending = []
+    for state in batch["items"]:
+        duplicate_of = news_deduplicator.match_headline(state["news_item"])
+        if duplicate_of is not None:
+            _mark_duplicate(state, duplicate_of, "headline")
+        else:
+            pending.append(state)
+    return pending
+
+def _batch_documents(pending):
+    return [local_rag_service.build_document(s["news_item"]) for s in pending]
+
+def _batch_register(pending, embeddings):
+    # Registered in order, so copies inside the same batch are caught too
+    for state, embedding in zip(pending, embeddings):
+        _register(state, embedding)
+
+def batch_deduplication_node(batch):
+    print(f"--- BATCH DEDUPLICATION NODE ({len(batch['items'])} items) ---")
+    pending = _batch_headline_pass(batch)
+    if pending:
+        # One encode call for every item that survived the headline pass
+        _batch_register(pending, local_rag_service.embed_texts(_batch_documents(pending)))
+    return batch
+
+def batch_entity_extraction_node(batch):
+    print("--- BATCH ENTITY EXTRACTION NODE ---")
+    for state in _unique(batch):
+        _extract_entities(state)
+    return batch
+
+def batch_impact_analysis_node(batch):
+    print("--- BATCH IMPACT ANALYSIS NODE ---")
+    for state in _unique(batch):
+        _analyze_impact(state)
+    return batch
+
+def batch_storage_node(batch):
+    print("--- BATCH STORAGE NODE ---")
+    states = _unique(batch)
+    if not states:
+        return batch
+
+    try:
+        with db_session() as conn:
+            conn.executemany(NEWS_INSERT_SQL, [_news_row(s) for s in states])
+    except Exception:
+        # The whole batch rolled back: release every reserved dedup entry
+        for s in states:
+            news_deduplicator.unregister(s["news_item"]["id"])
+        raise
+
+    local_rag_service.store_news_batch(
+        [s["news_item"] for s in states],
+        embeddings=[s.get("embedding") for s in states]
+    )
+    for s in states:
+        supply_chain_graph.record(s["news_item"], s["sentiment_score"])
+        knowledge_graph.record(s["news_item"]["ticker"])
+    return batch
+
+def batch_trader_node(batch):
+    print("--- BATCH TRADER NODE ---")
+    states = _unique(batch)
+    if not states:
+        return batch
+    # One shared regime snapshot for the whole batch
+    market_regime = macro_agent.analyze_regime()
+    for state in states:
+        state["market_regime"] = market_regime
+        state["forensic_score"] = forensic_agent.scan_risk(state["news_item"]["headline"])
+
+    # One decision pass and one transaction for the whole batch
+    results = trader_agent.evaluate_trades(
+        [s["news_item"] for s in states],
+        [s["sentiment_score"] for s in states],
+        [s["market_regime"] for s in states],
+        [s["forensic_score"] for s in states]
+    )
+    for state, trade_result in zip(states, results):
+        state["trade_result"] = trade_result
+        _report_trade(state)
+    return batch
+
+# --- Async variants ---
+# Used by the compiled graphs under the asyncio scheduler: blocking SQLite /
+# Chroma work goes to the I/O pool and MiniLM encoding to the encode pool, so
+# the event loop (shared with uvicorn) only does cheap bookkeeping.
+
+from app.core.executors import run_io, run_encode
+
+async def deduplication_node_async(state):
+    print("--- DEDUPLICATION NODE ---")
+    news_item = state["news_item"]
+
+    duplicate_of = news_deduplicator.match_headline(news_item)
+    if duplicate_of is not None:
+        return _mark_duplicate(state, duplicate_of, "headline")
+
+    embedding = await run_encode(local_rag_service.embed_text, local_rag_service.build_document(news_item))
+    return _register(state, embedding)
+
+async def storage_node_async(state):
+    return await run_io(storage_node, state)
+
+async def trader_node_async(state):
+    return await run_io(trader_node, state)
+
+async def batch_deduplication_node_async(batch):
+    print(f"--- BATCH DEDUPLICATION NODE ({len(batch['items'])} items) ---")
+    pending = _batch_headline_pass(batch)
+    if pending:
+        embeddings = await run_encode(local_rag_service.embed_texts, _batch_documents(pending))
+        _batch_register(pending, embeddings)
+    return batch
+
+async def batch_storage_node_async(batch):
+    return await run_io(batch_storage_node, batch)
+
+async def batch_trader_node_async(batch):
+    return await run_io(batch_trader_node, batch)
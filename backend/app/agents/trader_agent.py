@@ -1,80 +1,182 @@
-import json
+import os
 from datetime import datetime
-from app.core.database import get_db_connection
+import numpy as np
+from app.core.database import db_read, db_session
+from app.services.portfolio_state import portfolio_state
+
+RISK_PER_TRADE = 0.02 # 2% risk
+MOCK_PRICE = 100.0 # Sizing price until live quotes are wired in
+FORENSIC_LIMIT = 50
+MIN_CONFIDENCE = 0.5
+
+# Action codes produced by decide_trades
+SKIP, BUY, SELL = 0, 1, -1
+ACTION_NAMES = {SKIP: "SKIP", BUY: "BUY", SELL: "SELL"}
+
+# Reason codes for skipped decisions
+REASON_TRADE, REASON_MACRO, REASON_FORENSIC, REASON_CONFIDENCE, REASON_CAPITAL = range(5)
+FORWARDED_REASON = "Queued for the worker that owns the portfolio."
+# Forwarded decisions applied per drain by the portfolio owner
+FORWARDED_BATCH = int(os.getenv("TRADE_FORWARD_BATCH", "500"))
+
+def decide_trades(sentiment, risk_off, forensic, cash, risk_per_trade=RISK_PER_TRADE, price=MOCK_PRICE):
+    """
+    Pure decision kernel: no I/O, no shared state. Takes arrays of
+    sentiment scores, Risk-Off flags and forensic scores (one entry per
+    news item, in order), the starting cash and the sizing price (scalar
+    or per item). Returns arrays action, shares, reason and cash_after.
+
+    The filters are evaluated for the whole batch at once. Sizing is
+    cash-dependent (2% of the balance left by earlier trades, floored to
+    whole shares), so it is a running scan over the accepted items only.
+    """
+    sentiment = np.asarray(sentiment, dtype=float)
+    risk_off = np.asarray(risk_off, dtype=bool)
+    forensic = np.asarray(forensic, dtype=float)
+    price = np.broadcast_to(np.asarray(price, dtype=float), sentiment.shape)
+
+    reason = np.full(sentiment.shape, REASON_TRADE, dtype=np.int8)
+    # Later filters must not overwrite an earlier skip reason, so apply in reverse
+    reason[np.abs(sentiment) < MIN_CONFIDENCE] = REASON_CONFIDENCE
+    reason[forensic > FORENSIC_LIMIT] = REASON_FORENSIC
+    # Macro Filter: If Risk-Off, block Buys
+    reason[risk_off & (sentiment > 0)] = REASON_MACRO
+
+    action = np.where(reason == REASON_TRADE, np.where(sentiment > 0, BUY, SELL), SKIP).astype(np.int8)
+    shares = np.zeros(sentiment.shape, dtype=np.int64)
+    cash_after = np.empty(sentiment.shape)
+
+    balance = float(cash)
+    candidates = np.flatnonzero(action != SKIP)
+    previous = 0
+    for i in candidates:
+        cash_after[previous:i] = balance
+        size = int(balance * risk_per_trade / price[i])
+        if size == 0:
+            action[i], reason[i] = SKIP, REASON_CAPITAL
+        else:
+            shares[i] = size
+            # BUY adds to the position, SELL (Short) reduces it
+            balance -= int(action[i]) * size * price[i]
+        cash_after[i] = balance
+        previous = i + 1
+    cash_after[previous:] = balance
+    return {"action": action, "shares": shares, "reason": reason, "cash_after": cash_after}
+
+def describe_reason(code, forensic_score=None):
+    if code == REASON_MACRO:
+        return "Macro Regime is Risk-Off. Longs blocked."
+    if code == REASON_FORENSIC:
+        return f"Forensic Risk too high ({forensic_score})."
+    if code == REASON_CONFIDENCE:
+        return "Confidence too low."
+    if code == REASON_CAPITAL:
+        return "Insufficient capital for position sizing."
+    return None
 
 class TraderAgent:
-    def __init__(self):
-        self.risk_per_trade = 0.02 # 2% risk
+    def __init__(self, portfolio=None):
+        self.risk_per_trade = RISK_PER_TRADE
+        self.portfolio = portfolio or portfolio_state
 
     def evaluate_trade(self, news_item, sentiment_score, market_regime, forensic_score):
-        # 1. Macro Filter: If Risk-Off, only allow Shorts (or block Buys)
-        if market_regime == "Risk-Off" and sentiment_score > 0:
-            return {"action": "SKIP", "reason": "Macro Regime is Risk-Off. Longs blocked."}
-        
-        # 2. Forensic Filter: If Risk Score > 50, Block Trade
-        if forensic_score > 50:
-            return {"action": "SKIP", "reason": f"Forensic Risk too high ({forensic_score})."}
-
-        # 3. Trade Logic
-        confidence = abs(sentiment_score) # Simplified confidence
-        if confidence < 0.5:
-             return {"action": "SKIP", "reason": "Confidence too low."}
-
-        action = "BUY" if sentiment_score > 0 else "SELL"
-        
-        # 4. Execute (Simulated)
-        return self._execute_trade(news_item['ticker'], action, news_item['headline'])
-
-    def _execute_trade(self, ticker, action, reason):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get Portfolio
-        cursor.execute("SELECT * FROM portfolio LIMIT 1")
-        row = cursor.fetchone()
-        portfolio = dict(row)
-        cash = portfolio['cash_balance']
-        holdings = json.loads(portfolio['holdings_json'])
-        history = json.loads(portfolio['trade_history_json'])
-        
-        # Sizing (Mock Price $100 for simplicity)
-        price = 100.0 
-        amount = cash * self.risk_per_trade
-        shares = int(amount / price)
-        
-        if shares == 0:
-             conn.close()
-             return {"action": "SKIP", "reason": "Insufficient capital for position sizing."}
-
-        # Update Holdings
-        if action == "BUY":
-            cash -= shares * price
-            holdings[ticker] = holdings.get(ticker, 0) + shares
-        else: # SELL (Short)
-            cash += shares * price
-            holdings[ticker] = holdings.get(ticker, 0) - shares
-            
-        # Update History
-        trade_record = {
-            "ticker": ticker,
-            "action": action,
-            "shares": shares,
-            "price": price,
-            "reason": reason,
-            "timestamp": datetime.now().isoformat()
-        }
-        history.insert(0, trade_record)
-        
-        # Save DB
-        cursor.execute("""
-            UPDATE portfolio 
-            SET cash_balance = ?, holdings_json = ?, trade_history_json = ?, last_updated = ?
-            WHERE id = ?
-        """, (cash, json.dumps(holdings), json.dumps(history), datetime.now().isoformat(), portfolio['id']))
-        
-        conn.commit()
-        conn.close()
-        
-        return {"action": action, "details": trade_record}
+        return self.evaluate_trades([news_item], [sentiment_score], [market_regime], [forensic_score])[0]
+
+    def evaluate_trades(self, news_items, sentiment_scores, market_regimes, forensic_scores):
+        """Decides a batch against the live portfolio and applies it under the portfolio lock."""
+        if not news_items:
+            return []
+        with self.portfolio.transaction() as portfolio:
+            if portfolio.owned:
+                return self._decide_and_apply(portfolio, news_items, sentiment_scores,
+                                              market_regimes, forensic_scores)
+        # Another worker holds the portfolio: hand the decisions over rather than drop them
+        return self.forward_trades(news_items, sentiment_scores, market_regimes, forensic_scores)
+
+    def _decide_and_apply(self, portfolio, news_items, sentiment_scores, market_regimes, forensic_scores):
+        decisions = decide_trades(
+            sentiment_scores,
+            [regime == "Risk-Off" for regime in market_regimes],
+            forensic_scores,
+            portfolio.cash,
+            self.risk_per_trade
+        )
+        return self.apply_trades(portfolio, news_items, decisions, forensic_scores)
+
+    def forward_trades(self, news_items, sentiment_scores, market_regimes, forensic_scores):
+        """Queues decisions for the portfolio owner (read-only workers)."""
+        queued_at = datetime.now().isoformat()
+        with db_session() as conn:
+            conn.executemany("""
+                INSERT INTO trade_decision_queue
+                    (ticker, headline, sentiment_score, market_regime, forensic_score, queued_at, queued_by)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (item["ticker"], item["headline"], float(sentiment), regime, float(forensic),
+                 queued_at, self.portfolio.owner)
+                for item, sentiment, regime, forensic
+                in zip(news_items, sentiment_scores, market_regimes, forensic_scores)
+            ])
+        print(f"Forwarded {len(news_items)} trade decision(s) to the portfolio owner.")
+        return [{"action": "SKIP", "reason": FORWARDED_REASON, "forwarded": True} for _ in news_items]
+
+    def drain_forwarded(self, limit=FORWARDED_BATCH):
+        """
+        Owner only: decides and applies queued decisions against the live
+        portfolio, then deletes them once journaled (at-least-once).
+        """
+        if not self.portfolio.owned:
+            return 0
+        with db_read() as conn:
+            rows = conn.execute(
+                "SELECT * FROM trade_decision_queue ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        if not rows:
+            return 0
+        with self.portfolio.transaction() as portfolio:
+            if not portfolio.owned:
+                return 0
+            self._decide_and_apply(
+                portfolio,
+                [{"ticker": r["ticker"], "headline": r["headline"]} for r in rows],
+                [r["sentiment_score"] for r in rows],
+                [r["market_regime"] for r in rows],
+                [r["forensic_score"] for r in rows]
+            )
+        self.portfolio.flush()
+        with db_session() as conn:
+            conn.executemany("DELETE FROM trade_decision_queue WHERE id = ?", [(r["id"],) for r in rows])
+        return len(rows)
+
+    def replay(self, sentiment_scores, market_regimes, forensic_scores, cash, price=MOCK_PRICE):
+        """What-if run of the decision logic over historical inputs; never touches the database."""
+        return decide_trades(
+            sentiment_scores,
+            [regime == "Risk-Off" for regime in market_regimes],
+            forensic_scores,
+            cash,
+            self.risk_per_trade,
+            price
+        )
+
+    def apply_trades(self, portfolio, news_items, decisions, forensic_scores, price=MOCK_PRICE):
+        """
+        Execution step: records every accepted decision on the in-memory
+        portfolio, whose journal persists them in the background. Returns
+        one result dict per news item.
+        """
+        timestamp = datetime.now().isoformat()
+        results = []
+        for i, news_item in enumerate(news_items):
+            action = int(decisions["action"][i])
+            if action == SKIP:
+                results.append({"action": "SKIP", "reason": describe_reason(decisions["reason"][i], forensic_scores[i])})
+                continue
+            trade_record = portfolio.record_trade(
+                news_item['ticker'], ACTION_NAMES[action], int(decisions["shares"][i]),
+                price, news_item['headline'], timestamp
+            )
+            results.append({"action": trade_record["action"], "details": trade_record})
+        return results
 
 trader_agent = TraderAgent()
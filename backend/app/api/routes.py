@@ -1,11 +1,13 @@
-from fastapi import APIRouter, HTTPException
-from app.core.database import get_db_connection, get_chroma_client
+from fastapi import APIRouter, HTTPException, Request, Response
+from app.core.database import db_read
+from app.services.portfolio_state import portfolio_state
 from app.services.local_rag import local_rag_service
 import sqlite3
 from pydantic import BaseModel
 from typing import List, Optional
 import json
 import random
+import time
 
 router = APIRouter()
 
@@ -20,14 +22,54 @@ class NewsItem(BaseModel):
     summary: Optional[str]
     entities: Optional[str]
 
+class NewsPage(BaseModel):
+    items: List[NewsItem]
+    next_before: Optional[str]
+
+NEWS_PAGE_COLUMNS = "id, ticker, headline, source, timestamp, sentiment_score, market_impact, summary, entities"
+
+def _news_page(limit, before, ticker):
+    """One newest-first page of news and the cursor for the next one (None on the last page)."""
+    clauses, params = [], []
+    if ticker:
+        clauses.append("ticker = ?")
+        params.append(ticker)
+    if before:
+        try:
+            before_ts, before_id = before.rsplit(",", 1)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="before must be '<timestamp>,<id>'")
+        clauses.append("(timestamp, id) < (?, ?)")
+        params.extend([before_ts, before_id])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    # idx_news_timestamp / idx_news_ticker_timestamp supply the order and the
+    # cursor/ticker filter, so there is no sort step; they don't cover the
+    # selected columns, so each returned row (at most `limit`) is one table lookup
+    with db_read() as conn:
+        rows = conn.execute(
+            f"SELECT {NEWS_PAGE_COLUMNS} FROM news {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+    next_before = f"{rows[-1]['timestamp']},{rows[-1]['id']}" if rows and len(rows) == limit else None
+    return [dict(row) for row in rows], next_before
+
 @router.get("/latest-news", response_model=List[NewsItem])
-def get_latest_news(limit: int = 50):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM news ORDER BY timestamp DESC LIMIT ?", (limit,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+def get_latest_news(response: Response, limit: int = 50, before: Optional[str] = None, ticker: Optional[str] = None):
+    """
+    Newest-first news feed. Pass `before=<timestamp>,<id>` (from the
+    X-Next-Before header) to fetch the next page; `ticker` filters to one symbol.
+    """
+    items, next_before = _news_page(limit, before, ticker)
+    if next_before:
+        response.headers["X-Next-Before"] = next_before
+    return items
+
+@router.get("/latest-news/page", response_model=NewsPage)
+def get_latest_news_page(limit: int = 50, before: Optional[str] = None, ticker: Optional[str] = None):
+    """Same feed with the cursor in the body, like /portfolio's next_before."""
+    items, next_before = _news_page(limit, before, ticker)
+    return {"items": items, "next_before": next_before}
 
 class ChatRequest(BaseModel):
     query: str
@@ -42,9 +84,9 @@ class ChatResponse(BaseModel):
     citations: Optional[List[Citation]] = []
 
 @router.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest):
     try:
-        result = local_rag_service.answer_query(request.query)
+        result = await local_rag_service.answer_query_async(request.query)
         if isinstance(result, dict):
             return result
         return {"answer": result, "citations": []}
@@ -52,98 +94,284 @@ def chat(request: ChatRequest):
         print(f"Error in chat: {e}")
         return {"answer": "I'm having trouble accessing the market data right now.", "citations": []}
 
-from app.services.market import fetch_price_history, generate_knowledge_graph
+@router.get("/chat/cache-stats")
+def chat_cache_stats():
+    return local_rag_service.cache_stats()
+
+from app.services.market import fetch_price_history, knowledge_graph
 
 @router.get("/market-data/{ticker}")
 def get_market_data(ticker: str):
     return fetch_price_history(ticker)
 
 @router.get("/knowledge-graph")
-def get_knowledge_graph():
-    # Get recent news to build graph
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM news ORDER BY timestamp DESC LIMIT 20")
-    rows = cursor.fetchall()
-    conn.close()
-    news_items = [dict(row) for row in rows]
-    return generate_knowledge_graph(news_items)
-
-from app.services.graph_analytics import build_supply_chain_graph
+def get_knowledge_graph(request: Request, response: Response, since: Optional[int] = None):
+    """Graph over the latest news; `since=<version>` returns only the changes."""
+    version = knowledge_graph.version
+    etag = f'"kg-{version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    if since is not None:
+        return knowledge_graph.delta(since)
+    return knowledge_graph.snapshot()
+
+from app.services.graph_analytics import supply_chain_graph
 
 @router.get("/supply-chain-graph")
 def get_supply_chain_graph():
-    # Get recent news to build graph
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM news ORDER BY timestamp DESC LIMIT 50")
-    rows = cursor.fetchall()
-    conn.close()
-    news_items = [dict(row) for row in rows]
-    return build_supply_chain_graph(news_items)
+    # Aggregates over the latest news are maintained as items are stored
+    return supply_chain_graph.snapshot()
 
 @router.get("/portfolio")
-def get_portfolio():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM portfolio LIMIT 1")
-    row = cursor.fetchone()
-    conn.close()
-    
-    if row:
-        data = dict(row)
-        # Parse JSON fields
-        data['holdings'] = json.loads(data['holdings_json'])
-        data['trade_history'] = json.loads(data['trade_history_json'])
-        return data
-    return {}
+def get_portfolio(limit: int = 50, before: Optional[int] = None):
+    """Cash, holdings and one page of trade history (newest first; `before` = last trade id seen)."""
+    limit = max(1, min(limit, 500))
+    # Cash and holdings are authoritative in memory; trades not yet journaled come first
+    data = portfolio_state.snapshot()
+    if data['id'] is None:
+        return {}
+    trades = portfolio_state.pending_trades(before, limit)
+    if len(trades) < limit:
+        cursor = trades[-1]['id'] if trades else before
+        with db_read() as conn:
+            if cursor is None:
+                rows = conn.execute("""
+                    SELECT id, ticker, action, shares, price, reason, timestamp FROM trades
+                    WHERE portfolio_id = ? ORDER BY id DESC LIMIT ?
+                """, (data['id'], limit - len(trades))).fetchall()
+            else:
+                rows = conn.execute("""
+                    SELECT id, ticker, action, shares, price, reason, timestamp FROM trades
+                    WHERE portfolio_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+                """, (data['id'], cursor, limit - len(trades))).fetchall()
+        trades += [dict(t) for t in rows]
+
+    data['trade_history'] = trades
+    data['next_before'] = trades[-1]['id'] if len(trades) == limit else None
+    return data
 
 from app.services.butterfly_effect import knowledge_graph_engine
 from app.services.darwinian_breeder import strategy_breeder
 
 @router.get("/butterfly-effect/graph")
-def get_butterfly_graph():
-    return knowledge_graph_engine.get_graph_json()
+def get_butterfly_graph(node_id: Optional[str] = None, hops: int = 2, offset: int = 0, limit: int = 2000):
+    graph = knowledge_graph_engine.get_graph_json(node_id, hops, offset, limit)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return graph
+
+class CausalRelationshipRequest(BaseModel):
+    source: str
+    target: str
+    relationship: str = "Impacts"
+    weight: float = 0.5
+    source_type: Optional[str] = None
+    target_type: Optional[str] = None
+
+@router.post("/butterfly-effect/edges")
+def add_causal_edge(request: CausalRelationshipRequest):
+    return knowledge_graph_engine.add_relationship(
+        request.source, request.target, request.relationship, request.weight,
+        request.source_type, request.target_type
+    )
+
+@router.delete("/butterfly-effect/edges")
+def remove_causal_edge(source: str, target: str):
+    if not knowledge_graph_engine.remove_relationship(source, target):
+        raise HTTPException(status_code=404, detail="Relationship not found")
+    return {"status": "deleted"}
+
+@router.get("/butterfly-effect/downstream/{node_id}")
+def get_downstream(node_id: str):
+    reach = knowledge_graph_engine.downstream(node_id)
+    if reach is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return {"node_id": node_id, "count": len(reach), "downstream": sorted(reach)}
 
 @router.post("/butterfly-effect/shock")
 def propagate_shock(node_id: str, magnitude: float):
     return knowledge_graph_engine.propagate_shock(node_id, magnitude)
 
+class ShockScenarioRequest(BaseModel):
+    # Each scenario maps shocked nodes to their initial magnitude
+    scenarios: List[dict]
+    top: Optional[int] = None
+
+@router.post("/butterfly-effect/shock/batch")
+def propagate_shock_batch(request: ShockScenarioRequest):
+    return knowledge_graph_engine.propagate_shocks(request.scenarios, request.top)
+
 @router.get("/darwinian/evolve")
 def evolve_strategies():
     return strategy_breeder.evolve()
 
-from app.services.fed_whisperer import fed_whisperer
+from app.services.evolution_jobs import evolution_jobs
+from fastapi.responses import StreamingResponse
+import asyncio
+
+class EvolutionJobRequest(BaseModel):
+    population_size: int = 1000
+    generations: int = 20
+
+@router.post("/darwinian/jobs")
+def start_evolution_job(request: EvolutionJobRequest):
+    return evolution_jobs.start(request.population_size, request.generations)
+
+@router.get("/darwinian/jobs")
+def list_evolution_jobs(limit: int = 20):
+    return evolution_jobs.list(limit)
+
+@router.get("/darwinian/jobs/{job_id}")
+def get_evolution_job(job_id: str):
+    job = evolution_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/darwinian/jobs/{job_id}/cancel")
+def cancel_evolution_job(job_id: str):
+    if not evolution_jobs.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not running in this worker")
+    return {"status": "cancelling"}
+
+@router.get("/darwinian/jobs/{job_id}/stream")
+async def stream_evolution_job(job_id: str, interval: float = 0.5):
+    """Server-sent events: one event per completed generation until the job ends."""
+    if await asyncio.to_thread(evolution_jobs.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last = None
+        while True:
+            job = await asyncio.to_thread(evolution_jobs.get, job_id)
+            progress = (job["generation"], job["status"])
+            if progress != last:
+                last = progress
+                yield f"data: {json.dumps({k: v for k, v in job.items() if k != 'history'})}\n\n"
+            if job["status"] not in ("queued", "running"):
+                break
+            await asyncio.sleep(max(interval, 0.1))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+from app.services.fed_whisperer_jobs import fed_whisperer_jobs
 from app.services.multiverse import multiverse_simulator
 from fastapi import UploadFile, File
-import shutil
-import os
+
+async def _save_upload(file: UploadFile):
+    return await asyncio.to_thread(fed_whisperer_jobs.spool, file.file, file.filename)
 
 @router.post("/fed-whisperer/analyze")
 async def analyze_audio(file: UploadFile = File(...)):
-    temp_file = f"temp_{file.filename}"
-    with open(temp_file, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
+    # Runs as a job on the worker pools; the event loop only awaits the result
+    job = fed_whisperer_jobs.submit(await _save_upload(file), file.filename)
     try:
-        result = fed_whisperer.analyze_audio(temp_file)
-    finally:
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
-            
-    return result
+        return await asyncio.wrap_future(job.future)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Audio analysis failed: {e}")
+
+@router.post("/fed-whisperer/jobs")
+async def submit_audio_job(file: UploadFile = File(...)):
+    job = fed_whisperer_jobs.submit(await _save_upload(file), file.filename)
+    return job.snapshot()
+
+@router.get("/fed-whisperer/jobs/{job_id}")
+def get_audio_job(job_id: str, since_chunk: int = 0):
+    job = fed_whisperer_jobs.get(job_id, since_chunk)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/fed-whisperer/jobs/{job_id}/stream")
+async def stream_audio_job(job_id: str, interval: float = 0.5):
+    """
+    Server-sent events: one "chunk" event per finished chunk, then "result"
+    (or "error" if the job is evicted before the stream catches up).
+    """
+    if fed_whisperer_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        sent = 0
+        while True:
+            job = fed_whisperer_jobs.get(job_id, since_chunk=sent)
+            if job is None:
+                # Evicted from the finished-jobs window while we were streaming
+                error = {"status": "expired", "error": "Job is no longer available"}
+                yield f"event: error\ndata: {json.dumps(error)}\n\n"
+                break
+            for partial in job["partials"]:
+                payload = {**partial, "chunks_total": job["chunks_total"]}
+                yield f"event: chunk\ndata: {json.dumps(payload)}\n\n"
+            sent += len(job["partials"])
+            if job["status"] in ("completed", "failed"):
+                final = {"status": job["status"], "result": job["result"], "error": job["error"]}
+                yield f"event: result\ndata: {json.dumps(final)}\n\n"
+                break
+            await asyncio.sleep(max(interval, 0.1))
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+class MultiverseRequest(BaseModel):
+    premises: List[str]
+    paths: int = 20000
+    horizon_days: int = 21
+    seed: Optional[int] = None
 
 @router.post("/multiverse/simulate")
-def run_simulation(premise: str):
+def run_simulation(premise: Optional[str] = None, request: Optional[MultiverseRequest] = None):
+    """`?premise=` returns one scenario; a JSON body with `premises` returns one per premise."""
+    if request is not None:
+        return multiverse_simulator.run_simulations(
+            request.premises, paths=request.paths, horizon=request.horizon_days, seed=request.seed
+        )
+    if premise is None:
+        raise HTTPException(status_code=422, detail="Provide ?premise= or a JSON body with premises")
     return multiverse_simulator.run_simulation(premise)
 
+from app.agents.macro_agent import macro_agent, MACRO_HISTORY_SIZE
+
+@router.get("/macro/regime")
+def get_macro_regime():
+    snapshot = macro_agent.snapshot()
+    return {**snapshot, "age_seconds": max(time.time() - snapshot["as_of"], 0.0)}
+
+@router.get("/macro/history")
+def get_macro_history(limit: int = 500):
+    return macro_agent.history(max(1, min(limit, MACRO_HISTORY_SIZE)))
+
 from app.agents.forensic_agent import forensic_agent
 
 class ForensicScanRequest(BaseModel):
     text: str
 
+class ForensicBatchRequest(BaseModel):
+    documents: List[str]
+
+FORENSIC_CHUNK_SIZE = 64 * 1024
+
 @router.post("/forensic/scan")
 def scan_forensic_risk(request: ForensicScanRequest):
-    score = forensic_agent.scan_risk(request.text)
-    return {"risk_score": score, "details": "Scan complete"}
+    report = forensic_agent.scan(request.text)
+    return {**report, "details": "Scan complete"}
+
+@router.post("/forensic/scan/batch")
+def scan_forensic_batch(request: ForensicBatchRequest):
+    return {"results": forensic_agent.scan_batch(request.documents)}
+
+@router.post("/forensic/scan/upload")
+async def scan_forensic_upload(file: UploadFile = File(...)):
+    # Read the filing in fixed-size chunks; only one chunk is decoded at a time
+    stream = forensic_agent.stream()
+    while chunk := await file.read(FORENSIC_CHUNK_SIZE):
+        stream.feed_bytes(chunk)
+    return {**stream.result(), "filename": file.filename, "details": "Scan complete"}
 
+@router.post("/forensic/scan/stream")
+async def scan_forensic_stream(request: Request):
+    # Raw (e.g. chunked transfer-encoded) text body, scanned as it arrives
+    stream = forensic_agent.stream()
+    async for chunk in request.stream():
+        stream.feed_bytes(chunk)
+    return {**stream.result(), "details": "Scan complete"}
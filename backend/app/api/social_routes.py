@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException
-from app.core.database import get_db_connection
+from app.core.database import db_read, db_session
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
@@ -25,27 +25,20 @@ class CommentResponse(BaseModel):
 
 @router.get("/comments/{news_id}", response_model=List[CommentResponse])
 def get_comments(news_id: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM comments WHERE news_item_id = ? ORDER BY timestamp DESC", (news_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with db_read() as conn:
+        rows = conn.execute("SELECT * FROM comments WHERE news_item_id = ? ORDER BY timestamp DESC", (news_id,)).fetchall()
     return [dict(row) for row in rows]
 
 @router.post("/comments", response_model=CommentResponse)
 def create_comment(comment: CommentCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     timestamp = datetime.now().isoformat()
     
-    cursor.execute("""
-        INSERT INTO comments (news_item_id, user_id, parent_id, content, upvotes, sentiment_vote, timestamp)
-        VALUES (?, ?, ?, ?, 0, ?, ?)
-    """, (comment.news_item_id, comment.user_id, comment.parent_id, comment.content, comment.sentiment_vote, timestamp))
-    
-    comment_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    with db_session() as conn:
+        cursor = conn.execute("""
+            INSERT INTO comments (news_item_id, user_id, parent_id, content, upvotes, sentiment_vote, timestamp)
+            VALUES (?, ?, ?, ?, 0, ?, ?)
+        """, (comment.news_item_id, comment.user_id, comment.parent_id, comment.content, comment.sentiment_vote, timestamp))
+        comment_id = cursor.lastrowid
     
     return {
         "id": comment_id,
@@ -60,9 +53,6 @@ def create_comment(comment: CommentCreate):
 
 @router.post("/comments/{comment_id}/upvote")
 def upvote_comment(comment_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE comments SET upvotes = upvotes + 1 WHERE id = ?", (comment_id,))
-    conn.commit()
-    conn.close()
+    with db_session() as conn:
+        conn.execute("UPDATE comments SET upvotes = upvotes + 1 WHERE id = ?", (comment_id,))
     return {"status": "success"}
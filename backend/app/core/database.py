@@ -1,16 +1,97 @@
 import sqlite3
 import chromadb
+import json
 import os
+import threading
+from contextlib import contextmanager
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DB_PATH = os.path.join(BASE_DIR, "finai.db")
 CHROMA_PATH = os.path.join(BASE_DIR, "chroma_db")
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# Per-connection tuning. WAL lets readers proceed while a writer commits.
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-32000",       # ~32MB page cache
+    "PRAGMA mmap_size=268435456",     # 256MB memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_pool = []
+_pool_generation = 0
+
+def _connect(read_only=False):
+    if read_only:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA journal_mode=WAL")
     conn.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+def get_db_connection():
+    """Fresh, caller-owned connection. Prefer db_session()/db_read() in request paths."""
+    return _connect()
+
+def _pooled_connection(read_only):
+    """Returns this thread's cached connection, opening it on first use."""
+    key = "reader" if read_only else "writer"
+    cached = getattr(_local, key, None)
+    if cached is not None and cached[0] == _pool_generation:
+        return cached[1]
+    conn = _connect(read_only)
+    with _pool_lock:
+        _pool.append(conn)
+        setattr(_local, key, (_pool_generation, conn))
     return conn
 
+@contextmanager
+def db_session():
+    """
+    Read-write connection cached per thread. Commits when the outermost
+    session exits cleanly and rolls back on error; nested sessions join it.
+    """
+    conn = _pooled_connection(read_only=False)
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    try:
+        yield conn
+        if depth == 0:
+            conn.commit()
+    except Exception:
+        if depth == 0:
+            conn.rollback()
+        raise
+    finally:
+        _local.depth = depth
+
+@contextmanager
+def db_read():
+    """Read-only connection cached per thread, for GET endpoints."""
+    yield _pooled_connection(read_only=True)
+
+def close_db_connections():
+    """Closes every pooled connection; threads reconnect lazily on next use."""
+    global _pool_generation
+    with _pool_lock:
+        _pool_generation += 1
+        connections, _pool[:] = list(_pool), []
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
 def init_sqlite():
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -56,22 +137,198 @@ def init_sqlite():
             cash_balance REAL DEFAULT 100000.0,
             holdings_json TEXT DEFAULT '{}',
             trade_history_json TEXT DEFAULT '[]',
-            last_updated TEXT
+            last_updated TEXT,
+            last_trade_id INTEGER DEFAULT 0,
+            owner TEXT,
+            lease_expires_at REAL
+        )
+    """)
+    # Append-only trade ledger and per-ticker positions (replace the JSON blobs)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            portfolio_id INTEGER,
+            ticker TEXT,
+            action TEXT,
+            shares INTEGER,
+            price REAL,
+            reason TEXT,
+            timestamp TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_trades_portfolio_id ON trades (portfolio_id, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_trades_timestamp ON trades (timestamp)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS holdings (
+            portfolio_id INTEGER,
+            ticker TEXT,
+            shares INTEGER DEFAULT 0,
+            PRIMARY KEY (portfolio_id, ticker)
+        )
+    """)
+    # Trade decisions made by workers that don't own the portfolio, applied by the owner
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trade_decision_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticker TEXT,
+            headline TEXT,
+            sentiment_score REAL,
+            market_regime TEXT,
+            forensic_score REAL,
+            queued_at TEXT,
+            queued_by TEXT
+        )
+    """)
+    # Checkpoints of background strategy-evolution runs
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS evolution_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT,
+            population_size INTEGER,
+            generations INTEGER,
+            generation INTEGER DEFAULT 0,
+            population_json TEXT,
+            hall_of_fame_json TEXT DEFAULT '[]',
+            history_json TEXT DEFAULT '[]',
+            error TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            owner TEXT,
+            lease_expires_at REAL
+        )
+    """)
+    # Causal knowledge graph (Butterfly Effect engine)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS causal_entities (
+            id TEXT PRIMARY KEY,
+            type TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS causal_relationships (
+            source TEXT,
+            target TEXT,
+            relationship TEXT,
+            weight REAL,
+            PRIMARY KEY (source, target)
         )
     """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_causal_relationships_target ON causal_relationships (target)")
+    # Secondary indexes for the feed and comment queries; IF NOT EXISTS adds them to existing DBs too
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_news_timestamp ON news (timestamp, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_news_ticker_timestamp ON news (ticker, timestamp, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_comments_news_item_timestamp ON comments (news_item_id, timestamp)")
     # Initialize portfolio if empty
     cursor.execute("SELECT count(*) FROM portfolio")
     if cursor.fetchone()[0] == 0:
         cursor.execute("INSERT INTO portfolio (cash_balance, holdings_json, trade_history_json, last_updated) VALUES (100000.0, '{}', '[]', datetime('now'))")
+    migrate_portfolio_json(cursor)
+    migrate_portfolio_checkpoint(cursor)
+    migrate_portfolio_lease(cursor)
+    migrate_evolution_job_leases(cursor)
     conn.commit()
+    # Refresh planner statistics (it does not create indexes; the statements above do)
+    cursor.execute("PRAGMA optimize")
     conn.close()
 
+def migrate_portfolio_json(cursor):
+    """One-time move of holdings_json/trade_history_json into the holdings/trades tables."""
+    cursor.execute("""
+        SELECT id, holdings_json, trade_history_json FROM portfolio
+        WHERE holdings_json NOT IN ('', '{}') OR trade_history_json NOT IN ('', '[]')
+    """)
+    for portfolio_id, holdings_json, history_json in cursor.fetchall():
+        holdings = json.loads(holdings_json or '{}')
+        history = json.loads(history_json or '[]')
+        # History was stored newest-first; insert oldest-first so ids follow time
+        cursor.executemany("""
+            INSERT INTO trades (portfolio_id, ticker, action, shares, price, reason, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (portfolio_id, t.get("ticker"), t.get("action"), t.get("shares"), t.get("price"), t.get("reason"), t.get("timestamp"))
+            for t in reversed(history)
+        ])
+        cursor.executemany("""
+            INSERT INTO holdings (portfolio_id, ticker, shares) VALUES (?, ?, ?)
+            ON CONFLICT(portfolio_id, ticker) DO UPDATE SET shares = excluded.shares
+        """, [(portfolio_id, ticker, shares) for ticker, shares in holdings.items()])
+        cursor.execute("UPDATE portfolio SET holdings_json = '{}', trade_history_json = '[]' WHERE id = ?", (portfolio_id,))
+        print(f"Migrated portfolio {portfolio_id}: {len(history)} trades, {len(holdings)} holdings.")
+
+def migrate_portfolio_checkpoint(cursor):
+    """
+    Adds portfolio.last_trade_id: the last trade already reflected in
+    cash_balance/holdings. Trades after it are replayed at startup.
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(portfolio)").fetchall()]
+    if "last_trade_id" in columns:
+        return
+    cursor.execute("ALTER TABLE portfolio ADD COLUMN last_trade_id INTEGER DEFAULT 0")
+    # Existing balances were written together with their trades
+    cursor.execute("""
+        UPDATE portfolio SET last_trade_id = (
+            SELECT coalesce(max(id), 0) FROM trades WHERE trades.portfolio_id = portfolio.id
+        )
+    """)
+
+def migrate_portfolio_lease(cursor):
+    """Adds portfolio.owner/lease_expires_at: the worker process allowed to trade."""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(portfolio)").fetchall()]
+    if "owner" not in columns:
+        cursor.execute("ALTER TABLE portfolio ADD COLUMN owner TEXT")
+    if "lease_expires_at" not in columns:
+        cursor.execute("ALTER TABLE portfolio ADD COLUMN lease_expires_at REAL")
+
+def migrate_evolution_job_leases(cursor):
+    """
+    Adds evolution_jobs.owner/lease_expires_at: the worker process currently
+    running a job and until when (epoch seconds) its claim is valid.
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(evolution_jobs)").fetchall()]
+    if "owner" not in columns:
+        cursor.execute("ALTER TABLE evolution_jobs ADD COLUMN owner TEXT")
+    if "lease_expires_at" not in columns:
+        cursor.execute("ALTER TABLE evolution_jobs ADD COLUMN lease_expires_at REAL")
+
+_chroma_lock = threading.RLock()
+_chroma_client = None
+_chroma_collections = {}
+
 def get_chroma_client():
-    return chromadb.PersistentClient(path=CHROMA_PATH)
+    """Process-wide persistent client, created on first use."""
+    global _chroma_client
+    if _chroma_client is None:
+        with _chroma_lock:
+            if _chroma_client is None:
+                _chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return _chroma_client
+
+def get_chroma_collection(name="news_embeddings"):
+    """Cached collection handle (created if missing)."""
+    collection = _chroma_collections.get(name)
+    if collection is None:
+        with _chroma_lock:
+            collection = _chroma_collections.get(name)
+            if collection is None:
+                collection = get_chroma_client().get_or_create_collection(name=name)
+                _chroma_collections[name] = collection
+    return collection
+
+def close_chroma_client():
+    """Drops the cached client and handles (shutdown, tests)."""
+    global _chroma_client
+    with _chroma_lock:
+        client, _chroma_client = _chroma_client, None
+        _chroma_collections.clear()
+    if client is not None and hasattr(client, "clear_system_cache"):
+        client.clear_system_cache()
+
+def reopen_chroma_client():
+    close_chroma_client()
+    return get_chroma_client()
 
 def init_chroma():
-    client = get_chroma_client()
-    client.get_or_create_collection(name="news_embeddings")
+    get_chroma_collection("news_embeddings")
 
 def init_db():
     init_sqlite()
@@ -0,0 +1,28 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Blocking I/O (SQLite, Chroma) and model encoding run off the event loop so
+# ingestion never stalls the uvicorn requests sharing that loop.
+IO_WORKERS = int(os.getenv("PIPELINE_IO_WORKERS", "4"))
+# Torch releases the GIL inside encode(), so a thread pool parallelizes it
+# without duplicating the model in every worker process.
+ENCODE_WORKERS = int(os.getenv("PIPELINE_ENCODE_WORKERS", "1"))
+# Max news items in flight through the graph at once
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "4"))
+
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="pipeline-io")
+encode_executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="pipeline-encode")
+
+async def run_io(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, partial(func, *args, **kwargs))
+
+async def run_encode(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(encode_executor, partial(func, *args, **kwargs))
+
+def shutdown_executors():
+    io_executor.shutdown(wait=True, cancel_futures=True)
+    encode_executor.shutdown(wait=True, cancel_futures=True)
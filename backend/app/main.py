@@ -1,19 +1,57 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
-from app.core.database import init_db
-from app.services.scheduler import start_scheduler
+from app.core.database import init_db, db_read, get_chroma_collection, close_db_connections, close_chroma_client
+from app.services.dedup import news_deduplicator
+from app.services.scheduler import start_scheduler, scheduler
+from app.core.executors import shutdown_executors
+from app.services.evolution_jobs import evolution_jobs
+from app.services.butterfly_effect import knowledge_graph_engine
+from app.services.graph_analytics import supply_chain_graph
+from app.services.market import knowledge_graph
+from app.services.portfolio_state import portfolio_state
+from app.services.local_rag import local_rag_service
+from app.services.fed_whisperer import fed_whisperer
+from app.services.fed_whisperer_jobs import fed_whisperer_jobs
 from contextlib import asynccontextmanager
+import threading
+
+def warm_up_models():
+    # Runs in a background thread so the API binds and serves while models load
+    for name, warm_up in (("RAG", local_rag_service.warm_up), ("Whisper", fed_whisperer.warm_up)):
+        try:
+            warm_up()
+        except Exception as e:
+            print(f"{name} warm-up failed: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Initializing database...")
     init_db()
+    portfolio_state.load()
+    portfolio_state.start()
+    print("Loading causal graph...")
+    knowledge_graph_engine.load()
+    with db_read() as conn:
+        supply_chain_graph.warm_start(conn)
+        knowledge_graph.warm_start(conn)
+    print("Warming dedup index...")
+    news_deduplicator.warm_start(get_chroma_collection("news_embeddings"))
+    evolution_jobs.resume_interrupted()
     print("Starting scheduler...")
     start_scheduler()
+    print("Warming up models in the background...")
+    threading.Thread(target=warm_up_models, name="model-warmup", daemon=True).start()
     yield
     # Shutdown
+    scheduler.shutdown(wait=False)
+    shutdown_executors()
+    evolution_jobs.shutdown()
+    fed_whisperer_jobs.shutdown()
+    portfolio_state.close()
+    close_db_connections()
+    close_chroma_client()
 
 app = FastAPI(title="FinAI Lite", lifespan=lifespan)
 
@@ -23,6 +61,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursor of /api/latest-news and the knowledge-graph ETag;
+    # cross-origin JS can't read them otherwise
+    expose_headers=["X-Next-Before", "ETag"],
 )
 
 from app.api.social_routes import router as social_router
@@ -30,6 +71,19 @@ from app.api.social_routes import router as social_router
 app.include_router(router, prefix="/api")
 app.include_router(social_router, prefix="/api")
 
+@app.get("/health/ready")
+def health_ready():
+    """Per-model readiness; DB-backed endpoints serve regardless of model state."""
+    models = {
+        "embedding": local_rag_service.model_status["embedding"],
+        "generation": local_rag_service.model_status["generation"],
+        "whisper": fed_whisperer.model_status
+    }
+    return {
+        "ready": all(status == "ready" for status in models.values()),
+        "models": models
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
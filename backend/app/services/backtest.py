@@ -0,0 +1,131 @@
+import numpy as np
+
+TRADING_DAYS = 252
+RSI_PERIOD = 14
+# Cost charged on every position change, as a fraction of notional (5 bps)
+TRANSACTION_COST = 0.0005
+
+def rolling_mean(values, window):
+    """Trailing mean via cumulative sums; the first window-1 entries are NaN."""
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if window <= 0 or window > len(values):
+        return out
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    out[window - 1:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+def compute_rsi(prices, period=RSI_PERIOD):
+    """Cutler's RSI (simple-mean gains/losses) aligned with `prices`."""
+    prices = np.asarray(prices, dtype=float)
+    deltas = np.diff(prices, prepend=prices[0])
+    avg_gain = rolling_mean(np.clip(deltas, 0, None), period)
+    avg_loss = rolling_mean(np.clip(-deltas, 0, None), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    # No losses in the window -> maximally overbought
+    rsi[(avg_loss == 0) & ~np.isnan(avg_gain)] = 100.0
+    # The first bar has no prior close, so the window is only valid after it
+    rsi[:period] = np.nan
+    return rsi
+
+def sma_matrix(prices, periods):
+    """
+    Trailing SMA for many window lengths at once: row i is the SMA of
+    `prices` over periods[i]. Built from a single cumulative sum by fancy
+    indexing, so its cost does not depend on how many distinct periods there are.
+    """
+    prices = np.asarray(prices, dtype=float)
+    periods = np.asarray(periods, dtype=int)
+    n = len(prices)
+    csum = np.concatenate(([0.0], np.cumsum(prices)))
+    ends = np.arange(1, n + 1)[None, :]
+    starts = ends - periods[:, None]
+    valid = starts >= 0
+    sma = (csum[ends] - csum[np.clip(starts, 0, None)]) / periods[:, None]
+    sma[~valid] = np.nan
+    return sma
+
+def hold_positions(entry, exit_):
+    """
+    Turns entry/exit signal matrices (genomes x bars) into boolean positions:
+    long while the most recent entry signal is newer than the most recent
+    exit signal (exits win ties). Two running maxima, no per-bar loop.
+    """
+    bars = np.arange(entry.shape[1], dtype=np.int32)[None, :]
+    last_entry = np.maximum.accumulate(np.where(entry, bars, -1), axis=1)
+    last_exit = np.maximum.accumulate(np.where(exit_, bars, -1), axis=1)
+    return last_entry > last_exit
+
+def backtest_population(prices, rsi_buy, rsi_sell, sma_period, cost=TRANSACTION_COST):
+    """
+    Long-only mean-reversion backtest for a whole population at once.
+
+    Go long when RSI < RSI_Buy while price is below its SMA_Period average
+    (oversold), flat when RSI > RSI_Sell. Signals act on the next bar.
+    Returns a dict of per-genome arrays: sharpe, total_return, trades,
+    exposure.
+    """
+    prices = np.asarray(prices, dtype=float)
+    rsi_buy = np.asarray(rsi_buy, dtype=float)
+    rsi_sell = np.asarray(rsi_sell, dtype=float)
+    sma_period = np.clip(np.asarray(sma_period, dtype=int), 2, max(2, len(prices)))
+
+    rsi = compute_rsi(prices)
+    # Genomes share few distinct SMA lengths: compute each once, then broadcast
+    periods, which = np.unique(sma_period, return_inverse=True)
+    below_sma = (prices[None, :] < sma_matrix(prices, periods))[which]
+
+    # NaN warm-up values compare False, so no trades before indicators exist
+    entry = (rsi[None, :] < rsi_buy[:, None]) & below_sma
+    exit_ = rsi[None, :] > rsi_sell[:, None]
+    held = hold_positions(entry, exit_)
+
+    # Daily strategy return = held * r - cost * traded, with held/traded in {0,1}.
+    # Its moments and compounded growth reduce to matrix-vector products.
+    returns = prices[1:] / prices[:-1] - 1.0
+    position = held[:, :-1]
+    traded = position != np.concatenate((np.zeros((len(held), 1), dtype=bool), held[:, :-2]), axis=1)
+    held_quiet = (position & ~traded).astype(np.float32)
+    held_traded = (position & traded).astype(np.float32)
+    exit_trades = (~position & traded).sum(axis=1)
+    trade_count = traded.sum(axis=1)
+
+    n = len(returns)
+    held_sum = held_quiet @ returns + held_traded @ returns
+    total = held_sum - cost * trade_count
+    squares = held_quiet @ returns ** 2 + held_traded @ (returns - cost) ** 2 + exit_trades * cost ** 2
+    mean = total / n
+    std = np.sqrt(np.maximum(squares / n - mean ** 2, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > 1e-12, mean / std * np.sqrt(TRADING_DAYS), 0.0)
+
+    log_growth = (held_quiet @ np.log1p(returns) + held_traded @ np.log1p(returns - cost)
+                  + exit_trades * np.log1p(-cost))
+
+    return {
+        "sharpe": sharpe,
+        "total_return": np.expm1(log_growth),
+        "trades": (position & traded).sum(axis=1),
+        "exposure": held.mean(axis=1)
+    }
+
+def synthetic_prices(n=1260, seed=7, mu=0.07, sigma=0.2, start=100.0):
+    """Deterministic geometric Brownian motion series (fallback when no data is cached)."""
+    rng = np.random.default_rng(seed)
+    dt = 1.0 / TRADING_DAYS
+    log_returns = (mu - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * rng.standard_normal(n - 1)
+    return start * np.exp(np.concatenate(([0.0], np.cumsum(log_returns))))
+
+# --- Process-pool workers ---
+# Each worker receives the shared price series once (pool initializer) and
+# then only parameter arrays per task.
+
+_worker_prices = None
+
+def init_worker(prices):
+    global _worker_prices
+    _worker_prices = np.asarray(prices, dtype=float)
+
+def evaluate_chunk(rsi_buy, rsi_sell, sma_period):
+    return backtest_population(_worker_prices, rsi_buy, rsi_sell, sma_period)["sharpe"]
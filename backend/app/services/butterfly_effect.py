@@ -1,80 +1,366 @@
+import os
+import threading
+from collections import deque
+from itertools import islice
+
 import networkx as nx
-import json
+import numpy as np
+from scipy import sparse
+
+from app.core.database import db_read, db_session
+
+# Shock dissipates by this factor on every hop
+SHOCK_DECAY = 0.8
+# Transferred shocks at or below this magnitude stop propagating
+SHOCK_THRESHOLD = 0.05
+DEFAULT_EDGE_WEIGHT = 0.5
+# Hard cap on propagation depth (guards against weight-1 cycles)
+MAX_SHOCK_HOPS = 32
+DEFAULT_ENTITY_TYPE = "Entity"
+# Graphs up to this size get every node's reachability computed at load;
+# larger ones fill the cache on demand.
+REACHABILITY_PRECOMPUTE_LIMIT = int(os.getenv("CAUSAL_REACHABILITY_PRECOMPUTE_LIMIT", "5000"))
+MAX_EXPORT_NODES = 2000
+
+# Seed knowledge base, written to the database the first time it is empty
+SEED_ENTITIES = [
+    ("Thailand", "Country"),
+    ("Flooding", "Event"),
+    ("Hard_Drive_Sector", "Industry"),
+    ("Western_Digital", "Company"),
+    ("Seagate", "Company"),
+    ("Data_Centers", "Industry"),
+    ("Cloud_Providers", "Industry"),
+    ("AMZN", "Company"),
+    ("MSFT", "Company"),
+]
+# (Source, Target, Relationship, Weight)
+SEED_RELATIONSHIPS = [
+    ("Flooding", "Thailand", "Impacts", 0.9),
+    ("Thailand", "Hard_Drive_Sector", "Major_Producer", 0.8),
+    ("Hard_Drive_Sector", "Western_Digital", "Contains", 1.0),
+    ("Hard_Drive_Sector", "Seagate", "Contains", 1.0),
+    ("Western_Digital", "Data_Centers", "Supplies", 0.7),
+    ("Seagate", "Data_Centers", "Supplies", 0.7),
+    ("Data_Centers", "Cloud_Providers", "Critical_Infra", 0.9),
+    ("Cloud_Providers", "AMZN", "Parent", 1.0),
+    ("Cloud_Providers", "MSFT", "Parent", 1.0),
+]
+
+class CompiledCausalGraph:
+    """
+    Immutable propagation snapshot: node index plus a sparse matrix holding
+    decay * weight for every edge, transposed so that one hop of a shock
+    vector x is `matrix @ x`. Column-major (CSC) on both sides, so a hop only
+    walks the out-edges of nodes that currently carry a shock.
+    """
+
+    def __init__(self, nodes, index, matrix, decay=SHOCK_DECAY):
+        self.nodes = nodes
+        self.index = index
+        self.matrix = matrix
+        self.decay = decay
+
+    @classmethod
+    def from_graph(cls, graph, decay=SHOCK_DECAY):
+        nodes = list(graph.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        n = len(nodes)
+        rows, cols, weights = [], [], []
+        for source, target, weight in graph.edges(data="weight", default=DEFAULT_EDGE_WEIGHT):
+            rows.append(index[target])
+            cols.append(index[source])
+            weights.append(weight)
+        matrix = sparse.csc_matrix(
+            (np.asarray(weights, dtype=np.float64) * decay, (rows, cols)), shape=(n, n)
+        )
+        return cls(nodes, index, matrix, decay)
+
+    def with_edge(self, source, target, weight):
+        """
+        New snapshot with source -> target set to `weight` (None removes it).
+        Applied as a one-entry sparse delta, so readers of this snapshot are
+        never affected and no full rebuild from networkx is needed.
+        """
+        nodes, index, matrix = self.nodes, self.index, self.matrix
+        missing = [node for node in dict.fromkeys((source, target)) if node not in index]
+        if missing:
+            nodes = nodes + missing
+            index = dict(index)
+            for node in missing:
+                index[node] = len(index)
+            matrix = matrix.copy()
+            matrix.resize((len(nodes), len(nodes)))
+        row, col = index[target], index[source]
+        current = matrix[row, col]
+        new = 0.0 if weight is None else weight * self.decay
+        if new != current:
+            delta = sparse.csc_matrix(([new - current], ([row], [col])), shape=matrix.shape)
+            matrix = matrix + delta
+            matrix.eliminate_zeros()
+        return CompiledCausalGraph(nodes, index, matrix, self.decay)
+
+    def propagate(self, shocks, threshold=SHOCK_THRESHOLD, max_hops=MAX_SHOCK_HOPS):
+        """
+        Propagates a (nodes x scenarios) matrix of initial shocks. Each hop
+        transfers the previous hop's shock along every edge; contributions
+        arriving over different paths add up. The frontier stays sparse, so
+        a hop costs in proportion to the edges it actually touches. Returns
+        the accumulated impact as a sparse CSC matrix.
+        """
+        frontier = sparse.csc_matrix(shocks, dtype=np.float64)
+        total = frontier.copy()
+        for _ in range(max_hops):
+            frontier = self.matrix @ frontier
+            frontier.data[np.abs(frontier.data) <= threshold] = 0.0
+            frontier.eliminate_zeros()
+            if frontier.nnz == 0:
+                break
+            total = total + frontier
+        return total
 
 class CausalKnowledgeGraph:
+    """
+    SQLite-backed causal graph. The database is the source of truth; the
+    networkx graph, the propagation snapshot and the reachability cache are
+    in-memory views that edge updates patch in place.
+    """
+
     def __init__(self):
         self.graph = nx.DiGraph()
-        self._initialize_mock_data()
-
-    def _initialize_mock_data(self):
-        # Mock Knowledge Base (In production, load from DB)
-        # Nodes: (ID, Type)
-        self.graph.add_node("Thailand", type="Country", risk_score=0)
-        self.graph.add_node("Flooding", type="Event", risk_score=0)
-        self.graph.add_node("Hard_Drive_Sector", type="Industry", risk_score=0)
-        self.graph.add_node("Western_Digital", type="Company", risk_score=0)
-        self.graph.add_node("Seagate", type="Company", risk_score=0)
-        self.graph.add_node("Data_Centers", type="Industry", risk_score=0)
-        self.graph.add_node("Cloud_Providers", type="Industry", risk_score=0)
-        self.graph.add_node("AMZN", type="Company", risk_score=0)
-        self.graph.add_node("MSFT", type="Company", risk_score=0)
-
-        # Edges: (Source, Target, Relationship, Weight)
-        self.graph.add_edge("Flooding", "Thailand", relationship="Impacts", weight=0.9)
-        self.graph.add_edge("Thailand", "Hard_Drive_Sector", relationship="Major_Producer", weight=0.8)
-        self.graph.add_edge("Hard_Drive_Sector", "Western_Digital", relationship="Contains", weight=1.0)
-        self.graph.add_edge("Hard_Drive_Sector", "Seagate", relationship="Contains", weight=1.0)
-        self.graph.add_edge("Western_Digital", "Data_Centers", relationship="Supplies", weight=0.7)
-        self.graph.add_edge("Seagate", "Data_Centers", relationship="Supplies", weight=0.7)
-        self.graph.add_edge("Data_Centers", "Cloud_Providers", relationship="Critical_Infra", weight=0.9)
-        self.graph.add_edge("Cloud_Providers", "AMZN", relationship="Parent", weight=1.0)
-        self.graph.add_edge("Cloud_Providers", "MSFT", relationship="Parent", weight=1.0)
+        self._lock = threading.RLock()
+        self._compiled = None
+        # node -> frozenset of every node reachable downstream of it
+        self._reachability = {}
+        self._add_to_memory(SEED_ENTITIES, SEED_RELATIONSHIPS)
+
+    def _add_to_memory(self, entities, relationships):
+        self.graph.add_nodes_from((entity_id, {"type": entity_type}) for entity_id, entity_type in entities)
+        self.graph.add_edges_from((source, target, {"relationship": relationship, "weight": weight})
+                                  for source, target, relationship, weight in relationships)
+
+    def load(self):
+        """Replaces the in-memory graph with the database contents (seeding an empty DB)."""
+        with db_session() as conn:
+            if conn.execute("SELECT count(*) FROM causal_entities").fetchone()[0] == 0:
+                self._persist(conn, SEED_ENTITIES, SEED_RELATIONSHIPS)
+        with db_read() as conn:
+            entities = conn.execute("SELECT id, type FROM causal_entities").fetchall()
+            relationships = conn.execute(
+                "SELECT source, target, relationship, weight FROM causal_relationships"
+            ).fetchall()
+        with self._lock:
+            self.graph = nx.DiGraph()
+            self._add_to_memory([tuple(row) for row in entities], [tuple(row) for row in relationships])
+            self._compiled = None
+            self._reachability = {}
+            if self.graph.number_of_nodes() <= REACHABILITY_PRECOMPUTE_LIMIT:
+                self._precompute_reachability()
+        print(f"Causal graph loaded: {len(entities)} entities, {len(relationships)} relationships.")
+
+    def _persist(self, conn, entities, relationships):
+        conn.executemany("""
+            INSERT INTO causal_entities (id, type) VALUES (?, ?)
+            ON CONFLICT(id) DO UPDATE SET type = excluded.type
+        """, entities)
+        conn.executemany("""
+            INSERT INTO causal_relationships (source, target, relationship, weight) VALUES (?, ?, ?, ?)
+            ON CONFLICT(source, target) DO UPDATE SET
+                relationship = excluded.relationship, weight = excluded.weight
+        """, relationships)
+
+    def load_relationships(self, entities, relationships):
+        """
+        Bulk-loads entities [(id, type)] and relationships
+        [(source, target, relationship, weight)], then recompiles once.
+        """
+        entities, relationships = list(entities), list(relationships)
+        with db_session() as conn:
+            self._persist(conn, entities, relationships)
+        with self._lock:
+            self._add_to_memory(entities, relationships)
+            self._compiled = None
+            self._reachability = {}
+
+    # --- Incremental edge updates ---
+
+    def _ensure_entity(self, conn, entity_id, entity_type):
+        if entity_id in self.graph:
+            if entity_type is None or self.graph.nodes[entity_id].get("type") == entity_type:
+                return
+        entity_type = entity_type or DEFAULT_ENTITY_TYPE
+        conn.execute("""
+            INSERT INTO causal_entities (id, type) VALUES (?, ?)
+            ON CONFLICT(id) DO UPDATE SET type = excluded.type
+        """, (entity_id, entity_type))
+        self.graph.add_node(entity_id, type=entity_type)
+
+    def _invalidate_reachability(self, source):
+        # Changing source -> target can only alter what source, and whatever
+        # reaches source, can reach; every other cached entry stays valid.
+        stale = [node for node, reach in self._reachability.items() if node == source or source in reach]
+        for node in stale:
+            del self._reachability[node]
+
+    def add_relationship(self, source, target, relationship="Impacts", weight=DEFAULT_EDGE_WEIGHT,
+                         source_type=None, target_type=None):
+        """Adds or re-weights source -> target, creating missing entities."""
+        with self._lock:
+            with db_session() as conn:
+                self._ensure_entity(conn, source, source_type)
+                self._ensure_entity(conn, target, target_type)
+                self._persist(conn, [], [(source, target, relationship, weight)])
+            self.graph.add_edge(source, target, relationship=relationship, weight=weight)
+            if self._compiled is not None:
+                self._compiled = self._compiled.with_edge(source, target, weight)
+            self._invalidate_reachability(source)
+        return {"source": source, "target": target, "relationship": relationship, "weight": weight}
+
+    def remove_relationship(self, source, target):
+        """Deletes source -> target; returns False if there was no such edge."""
+        with self._lock:
+            if not self.graph.has_edge(source, target):
+                return False
+            with db_session() as conn:
+                conn.execute("DELETE FROM causal_relationships WHERE source = ? AND target = ?", (source, target))
+            self.graph.remove_edge(source, target)
+            if self._compiled is not None:
+                self._compiled = self._compiled.with_edge(source, target, None)
+            self._invalidate_reachability(source)
+        return True
+
+    # --- Reachability ---
+
+    def _precompute_reachability(self):
+        # Strongly connected components share their downstream set; walking the
+        # condensation DAG bottom-up builds each set from its children's.
+        condensation = nx.condensation(self.graph)
+        members = {scc: frozenset(data["members"]) for scc, data in condensation.nodes(data=True)}
+        below = {}
+        for scc in reversed(list(nx.topological_sort(condensation))):
+            reach = set()
+            for child in condensation.successors(scc):
+                reach |= members[child]
+                reach |= below[child]
+            below[scc] = frozenset(reach)
+            cyclic = len(members[scc]) > 1
+            for node in members[scc]:
+                downstream = below[scc] | members[scc] if cyclic else below[scc]
+                self._reachability[node] = downstream - {node}
+
+    def downstream(self, node):
+        """Every node the given node can reach (cached), or None if unknown."""
+        with self._lock:
+            if node not in self.graph:
+                return None
+            reach = self._reachability.get(node)
+            if reach is None:
+                reach = frozenset(nx.descendants(self.graph, node))
+                self._reachability[node] = reach
+            return reach
+
+    # --- Shock propagation ---
+
+    def compiled(self):
+        """Current propagation snapshot, rebuilt after bulk loads."""
+        compiled = self._compiled
+        if compiled is None:
+            with self._lock:
+                if self._compiled is None:
+                    self._compiled = CompiledCausalGraph.from_graph(self.graph)
+                compiled = self._compiled
+        return compiled
+
+    def propagate_shocks(self, scenarios, top=None):
+        """
+        Simulates many shocks in one pass. `scenarios` is a list of
+        {node: magnitude} dicts (several sources per scenario are allowed);
+        returns one {node: impact} dict per scenario, largest first.
+        """
+        compiled = self.compiled()
+        rows, columns, magnitudes = [], [], []
+        for column, scenario in enumerate(scenarios):
+            for node, magnitude in scenario.items():
+                if node in compiled.index:
+                    rows.append(compiled.index[node])
+                    columns.append(column)
+                    magnitudes.append(float(magnitude))
+        shocks = sparse.csc_matrix((magnitudes, (rows, columns)),
+                                   shape=(len(compiled.nodes), len(scenarios)))
+        impact = compiled.propagate(shocks)
+
+        results = []
+        for column in range(len(scenarios)):
+            start, end = impact.indptr[column], impact.indptr[column + 1]
+            hit, values = impact.indices[start:end], impact.data[start:end]
+            order = np.argsort(-np.abs(values), kind="stable")
+            if top is not None:
+                order = order[:top]
+            results.append({compiled.nodes[hit[i]]: float(values[i]) for i in order})
+        return results
 
     def propagate_shock(self, start_node, magnitude):
         """
         Simulates the 'Butterfly Effect'.
-        Traverses the graph to calculate Contagion Risk.
+        Propagates the shock through the graph to calculate Contagion Risk.
         """
         if start_node not in self.graph:
             return {}
+        if not self.downstream(start_node):
+            return {start_node: float(magnitude)}
+        return self.propagate_shocks([{start_node: magnitude}])[0]
 
-        # Reset scores
-        for n in self.graph.nodes:
-            self.graph.nodes[n]['risk_score'] = 0
-
-        # BFS Propagation
-        queue = [(start_node, magnitude)]
-        visited = {start_node}
-        impact_scores = {start_node: magnitude}
+    # --- Export ---
 
+    def _neighbourhood(self, node_id, hops, limit):
+        seen = {node_id: 0}
+        queue = deque([node_id])
         while queue:
-            current_node, current_impact = queue.pop(0)
-            
-            # Decay factor (shock dissipates over distance)
-            decay = 0.8 
-
-            for neighbor in self.graph.successors(current_node):
-                edge_data = self.graph.get_edge_data(current_node, neighbor)
-                weight = edge_data.get('weight', 0.5)
-                
-                # Calculate transferred shock
-                transferred_shock = current_impact * weight * decay
-                
-                if transferred_shock > 0.05: # Threshold to stop negligible impact
-                    if neighbor not in impact_scores:
-                        impact_scores[neighbor] = 0
-                    
-                    # Accumulate risk (simplified)
-                    impact_scores[neighbor] += transferred_shock
-                    self.graph.nodes[neighbor]['risk_score'] = impact_scores[neighbor]
-                    
-                    if neighbor not in visited:
-                        visited.add(neighbor)
-                        queue.append((neighbor, transferred_shock))
-
-        return impact_scores
-
-    def get_graph_json(self):
-        return nx.node_link_data(self.graph)
+            node = queue.popleft()
+            depth = seen[node]
+            if depth == hops:
+                continue
+            for neighbour in (*self.graph.successors(node), *self.graph.predecessors(node)):
+                if neighbour not in seen:
+                    if len(seen) >= limit:
+                        return list(seen), True
+                    seen[neighbour] = depth + 1
+                    queue.append(neighbour)
+        return list(seen), False
+
+    def get_graph_json(self, node_id=None, hops=2, offset=0, limit=MAX_EXPORT_NODES):
+        """
+        Node-link export of part of the graph: the k-hop neighbourhood
+        (either direction) around `node_id`, or a page of nodes in load
+        order. Links are the edges among the returned nodes. Returns None
+        for an unknown node_id.
+        """
+        limit = max(1, min(limit, MAX_EXPORT_NODES))
+        with self._lock:
+            total = self.graph.number_of_nodes()
+            if node_id is not None:
+                if node_id not in self.graph:
+                    return None
+                nodes, truncated = self._neighbourhood(node_id, hops, limit)
+            else:
+                nodes = list(islice(self.graph.nodes, offset, offset + limit))
+                truncated = offset + len(nodes) < total
+            selected = set(nodes)
+            node_rows = [{"id": node, **self.graph.nodes[node]} for node in nodes]
+            links = [
+                {"source": source, "target": target, **data}
+                for source in nodes
+                for target, data in self.graph.succ[source].items()
+                if target in selected
+            ]
+        return {
+            "directed": True,
+            "multigraph": False,
+            "graph": {},
+            "nodes": node_rows,
+            "links": links,
+            "total_nodes": total,
+            "truncated": truncated
+        }
 
 knowledge_graph_engine = CausalKnowledgeGraph()
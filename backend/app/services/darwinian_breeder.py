@@ -1,5 +1,13 @@
 import random
 import json
+import os
+import numpy as np
+from app.services.backtest import backtest_population, synthetic_prices
+
+# Price series the genomes are backtested on
+BACKTEST_TICKER = os.getenv("BACKTEST_TICKER", "SPY")
+BACKTEST_PERIOD = os.getenv("BACKTEST_PERIOD", "5y")
+MIN_BACKTEST_BARS = 100
 
 class StrategyGenome:
     def __init__(self, indicators=None, thresholds=None):
@@ -18,15 +26,47 @@ class StrategyGenome:
             "fitness": self.fitness
         }
 
+    @classmethod
+    def from_dict(cls, data):
+        genome = cls(indicators=list(data["indicators"]), thresholds=dict(data["thresholds"]))
+        genome.fitness = data.get("fitness", 0)
+        return genome
+
+def load_backtest_prices(ticker=BACKTEST_TICKER, period=BACKTEST_PERIOD):
+    """Daily closes from the price store; deterministic synthetic series if unavailable."""
+    try:
+        from app.services.price_store import price_store
+        closes = price_store.get_closes(ticker, period)
+        if len(closes) >= MIN_BACKTEST_BARS:
+            return closes
+    except Exception as e:
+        print(f"Error loading backtest prices: {e}")
+    print(f"Using synthetic prices for backtests ({ticker} unavailable).")
+    return synthetic_prices()
+
 class StrategyBreeder:
-    def __init__(self):
+    def __init__(self, prices=None):
         self.population = []
         self.generation = 0
+        self._prices = prices
 
-    def initialize_population(self, size=10):
+    @property
+    def prices(self):
+        if self._prices is None:
+            self._prices = load_backtest_prices()
+        return self._prices
+
+    def initialize_population(self, size=10, diverse=False):
         self.population = [StrategyGenome() for _ in range(size)]
         # Randomize initial population
         for strat in self.population:
+            if diverse:
+                # Large searches start spread over the whole parameter space
+                strat.thresholds = {
+                    "RSI_Buy": random.uniform(10, 45),
+                    "RSI_Sell": random.uniform(55, 90),
+                    "SMA_Period": random.randint(5, 200)
+                }
             self.mutate(strat)
 
     def crossover(self, parent_a, parent_b):
@@ -51,43 +91,51 @@ class StrategyBreeder:
         # Clamp values
         strategy.thresholds["RSI_Buy"] = max(10, min(45, strategy.thresholds["RSI_Buy"]))
         strategy.thresholds["RSI_Sell"] = max(55, min(90, strategy.thresholds["RSI_Sell"]))
+        strategy.thresholds["SMA_Period"] = max(5, min(200, strategy.thresholds["SMA_Period"]))
+
+    def evaluate_population(self, population):
+        """Backtests every genome in one vectorized pass; sets and returns fitness (Sharpe)."""
+        if not population:
+            return np.empty(0)
+        results = backtest_population(
+            self.prices,
+            [s.thresholds["RSI_Buy"] for s in population],
+            [s.thresholds["RSI_Sell"] for s in population],
+            [s.thresholds["SMA_Period"] for s in population]
+        )
+        for strat, sharpe in zip(population, results["sharpe"]):
+            strat.fitness = float(sharpe)
+        return results["sharpe"]
 
     def fitness_function(self, strategy):
-        """Runs a mock backtest and returns Sharpe Ratio."""
-        # In a real app, this would run backtrader/vectorbt
-        # Mocking fitness based on "reasonable" parameters
-        score = 0
-        if 25 < strategy.thresholds["RSI_Buy"] < 35: score += 0.5
-        if 65 < strategy.thresholds["RSI_Sell"] < 75: score += 0.5
-        
-        # Add random noise for simulation
-        score += random.uniform(-0.2, 0.2)
-        strategy.fitness = max(0, score)
+        """Runs a backtest and returns Sharpe Ratio."""
+        self.evaluate_population([strategy])
         return strategy.fitness
 
     def evolve(self):
         """Runs one generation of evolution."""
         self.generation += 1
         
-        # 1. Evaluate Fitness
-        for strat in self.population:
-            self.fitness_function(strat)
+        # 1. Evaluate Fitness (whole population as one array operation)
+        self.evaluate_population(self.population)
             
-        # 2. Selection (Top 50%)
+        # 2. Selection + 3. Breeding
         sorted_pop = sorted(self.population, key=lambda x: x.fitness, reverse=True)
-        survivors = sorted_pop[:len(sorted_pop)//2]
+        self.population = self.breed(sorted_pop)
+        return [s.to_dict() for s in sorted_pop[:5]] # Return top 5 of previous gen
+
+    def breed(self, ranked):
+        """Next generation from a fitness-ranked population (top 50% survive)."""
+        survivors = ranked[:max(1, len(ranked)//2)]
         
-        # 3. Breeding
         next_gen = []
-        while len(next_gen) < len(self.population):
+        while len(next_gen) < len(ranked):
             parent_a = random.choice(survivors)
             parent_b = random.choice(survivors)
             child = self.crossover(parent_a, parent_b)
             self.mutate(child)
             next_gen.append(child)
-            
-        self.population = next_gen
-        return [s.to_dict() for s in sorted_pop[:5]] # Return top 5 of previous gen
+        return next_gen
 
 strategy_breeder = StrategyBreeder()
 strategy_breeder.initialize_population()
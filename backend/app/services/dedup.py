@@ -0,0 +1,270 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Tunables (override via environment)
+SIMILARITY_THRESHOLD = float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", "0.92"))
+SIMHASH_MAX_DISTANCE = int(os.getenv("DEDUP_SIMHASH_MAX_DISTANCE", "3"))
+WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_MINUTES", "60")) * 60
+INDEX_CAPACITY = int(os.getenv("DEDUP_INDEX_CAPACITY", "20000"))
+
+SIMHASH_BITS = 64
+# 4 bands of 16 bits: by pigeonhole, any two hashes within 3 bits of each
+# other agree exactly on at least one band.
+SIMHASH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9$%]+")
+
+
+def normalize_headline(headline):
+    return " ".join(_TOKEN_RE.findall(headline.lower()))
+
+
+def _shingles(normalized, size=2):
+    tokens = normalized.split()
+    if len(tokens) < size:
+        return tokens
+    return [" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+
+def simhash(normalized):
+    """64-bit SimHash over word bigram shingles."""
+    weights = [0] * SIMHASH_BITS
+    for shingle in _shingles(normalized):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    value = 0
+    for bit, w in enumerate(weights):
+        if w > 0:
+            value |= 1 << bit
+    return value
+
+
+def parse_timestamp(ts):
+    try:
+        return datetime.fromisoformat(ts).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def headline_digest(normalized, ticker):
+    """Exact-match key; scoped per ticker like the SimHash and semantic stages."""
+    return hashlib.blake2b(f"{ticker}\0{normalized}".encode(), digest_size=16).digest()
+
+
+class NewsDeduplicator:
+    """
+    In-process duplicate detector for incoming news.
+
+    Two stages:
+      1. Exact / near-exact headline copies via a (ticker, normalized headline)
+         digest and banded SimHash lookup (no model call needed).
+      2. Semantic copies via a flat, ring-buffered cosine index over recent
+         headline embeddings, restricted to the same ticker and time window.
+    """
+
+    def __init__(self, capacity=INDEX_CAPACITY, threshold=SIMILARITY_THRESHOLD,
+                 window_seconds=WINDOW_SECONDS, max_distance=SIMHASH_MAX_DISTANCE):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.max_distance = max_distance
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._vectors = None  # allocated on first embedding (dim unknown until then)
+        self._has_vector = np.zeros(self.capacity, dtype=bool)
+        self._times = np.full(self.capacity, -np.inf)
+        self._tickers = np.full(self.capacity, -1, dtype=np.int32)
+        self._ids = [None] * self.capacity
+        self._slots = {}  # news id -> slot, for unregister()
+        self._digests = [None] * self.capacity
+        self._simhashes = [None] * self.capacity
+        self._ticker_codes = {}
+        self._exact = {}
+        self._bands = [dict() for _ in range(SIMHASH_BANDS)]
+        self._next_slot = 0
+        self.size = 0
+
+    def _ticker_code(self, ticker):
+        code = self._ticker_codes.get(ticker)
+        if code is None:
+            code = len(self._ticker_codes)
+            self._ticker_codes[ticker] = code
+        return code
+
+    def _evict(self, slot):
+        digest = self._digests[slot]
+        if digest is not None and self._exact.get(digest) == slot:
+            del self._exact[digest]
+        sh = self._simhashes[slot]
+        if sh is not None:
+            for band, buckets in enumerate(self._bands):
+                key = (sh >> (band * BAND_BITS)) & BAND_MASK
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(slot)
+                    if not bucket:
+                        del buckets[key]
+        if self._slots.get(self._ids[slot]) == slot:
+            del self._slots[self._ids[slot]]
+        self._ids[slot] = None
+        self._digests[slot] = None
+        self._simhashes[slot] = None
+        self._has_vector[slot] = False
+        self._times[slot] = -np.inf
+        self._tickers[slot] = -1
+        self.size -= 1
+
+    def match_headline(self, news_item):
+        """Returns the id of an exact/near-exact copy within the window, else None."""
+        normalized = normalize_headline(news_item["headline"])
+        ts = parse_timestamp(news_item.get("timestamp"))
+        with self.lock:
+            return self._match_headline(normalized, news_item["ticker"], ts)
+
+    def _match_headline(self, normalized, ticker, ts):
+        cutoff = ts - self.window_seconds
+        digest = headline_digest(normalized, ticker)
+        slot = self._exact.get(digest)
+        if slot is not None and self._times[slot] >= cutoff:
+            return self._ids[slot]
+
+        code = self._ticker_codes.get(ticker)
+        if code is None:
+            return None
+        sh = simhash(normalized)
+        seen = set()
+        for band, buckets in enumerate(self._bands):
+            for slot in buckets.get((sh >> (band * BAND_BITS)) & BAND_MASK, ()):
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                if self._tickers[slot] != code or self._times[slot] < cutoff:
+                    continue
+                if (self._simhashes[slot] ^ sh).bit_count() <= self.max_distance:
+                    return self._ids[slot]
+        return None
+
+    def _match_embedding(self, vector, ticker, ts):
+        if self._vectors is None:
+            return None, 0.0
+        code = self._ticker_codes.get(ticker)
+        if code is None:
+            return None, 0.0
+        mask = self._has_vector & (self._tickers == code) & (self._times >= ts - self.window_seconds)
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return None, 0.0
+        sims = self._vectors[candidates] @ vector
+        best = int(np.argmax(sims))
+        if sims[best] >= self.threshold:
+            return self._ids[candidates[best]], float(sims[best])
+        return None, float(sims[best])
+
+    @staticmethod
+    def _normalize_vector(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def check_and_register(self, news_item, embedding=None):
+        """
+        Atomically checks an item against the index and registers it if unique.
+        Returns (duplicate_of, reason); duplicate_of is None for unique items.
+        """
+        normalized = normalize_headline(news_item["headline"])
+        ticker = news_item["ticker"]
+        ts = parse_timestamp(news_item.get("timestamp"))
+        vector = self._normalize_vector(embedding) if embedding is not None else None
+
+        with self.lock:
+            dup = self._match_headline(normalized, ticker, ts)
+            if dup is not None:
+                return dup, "headline"
+            if vector is not None:
+                dup, score = self._match_embedding(vector, ticker, ts)
+                if dup is not None:
+                    return dup, f"embedding ({score:.3f})"
+            self._register(news_item["id"], normalized, ticker, ts, vector)
+        return None, None
+
+    def unregister(self, news_id):
+        """
+        Drops an item registered by check_and_register that was never stored,
+        so later copies of the story aren't rejected against a phantom original.
+        """
+        with self.lock:
+            slot = self._slots.get(news_id)
+            if slot is not None and self._ids[slot] == news_id:
+                self._evict(slot)
+
+    def _register(self, news_id, normalized, ticker, ts, vector):
+        slot = self._next_slot
+        if self._ids[slot] is not None:
+            self._evict(slot)
+        self._next_slot = (slot + 1) % self.capacity
+
+        digest = headline_digest(normalized, ticker)
+        sh = simhash(normalized)
+        self._ids[slot] = news_id
+        self._slots[news_id] = slot
+        self._digests[slot] = digest
+        self._simhashes[slot] = sh
+        self._times[slot] = ts
+        self._tickers[slot] = self._ticker_code(ticker)
+        self._exact[digest] = slot
+        for band, buckets in enumerate(self._bands):
+            buckets.setdefault((sh >> (band * BAND_BITS)) & BAND_MASK, set()).add(slot)
+
+        if vector is not None:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            self._vectors[slot] = vector
+            self._has_vector[slot] = True
+        self.size += 1
+
+    def warm_start(self, collection):
+        """Rebuilds the index from the persisted Chroma collection (recent items only)."""
+        data = collection.get(include=["embeddings", "metadatas"])
+        ids = data.get("ids") or []
+        metadatas = data.get("metadatas")
+        embeddings = data.get("embeddings")
+        if metadatas is None:
+            metadatas = [None] * len(ids)
+        if embeddings is None:
+            embeddings = [None] * len(ids)
+
+        cutoff = time.time() - self.window_seconds
+        recent = []
+        for news_id, meta, embedding in zip(ids, metadatas, embeddings):
+            if not meta or "headline" not in meta:
+                continue
+            ts = parse_timestamp(meta.get("timestamp"))
+            if ts >= cutoff:
+                recent.append((ts, news_id, meta, embedding))
+        recent.sort(key=lambda r: r[0])
+        recent = recent[-self.capacity:]
+
+        with self.lock:
+            self._reset()
+            for ts, news_id, meta, embedding in recent:
+                vector = self._normalize_vector(embedding) if embedding is not None else None
+                self._register(news_id, normalize_headline(meta["headline"]),
+                               meta.get("ticker"), ts, vector)
+        logger.info(f"Dedup index warm-started with {self.size} recent items.")
+        return self.size
+
+news_deduplicator = NewsDeduplicator()
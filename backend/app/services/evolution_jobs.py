@@ -0,0 +1,320 @@
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from app.core.database import db_read, db_session
+from app.services.backtest import backtest_population, evaluate_chunk, init_worker
+from app.services.darwinian_breeder import StrategyBreeder, StrategyGenome, load_backtest_prices
+
+EVOLUTION_WORKERS = int(os.getenv("EVOLUTION_WORKERS", str(os.cpu_count() or 2)))
+# Genomes per process-pool task; smaller populations are evaluated inline
+EVALUATION_CHUNK = int(os.getenv("EVOLUTION_CHUNK", "256"))
+HALL_OF_FAME_SIZE = 10
+MAX_POPULATION = 100000
+MAX_GENERATIONS = 1000
+# A worker's claim on a job; renewed every generation, so it must outlast one
+EVOLUTION_LEASE_SECONDS = float(os.getenv("EVOLUTION_LEASE_SECONDS", "300"))
+
+def _summary_snapshot(row):
+    """EvolutionJob.snapshot() shape from a row, without the population or prices."""
+    hall_of_fame = json.loads(row["hall_of_fame_json"] or "[]")
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "population_size": row["population_size"],
+        "generations": row["generations"],
+        "generation": row["generation"],
+        "best": hall_of_fame[0] if hall_of_fame else None,
+        "hall_of_fame": hall_of_fame,
+        "history": json.loads(row["history_json"] or "[]"),
+        "error": row["error"],
+        "created_at": row["created_at"]
+    }
+
+class EvolutionJob:
+    def __init__(self, job_id, population_size, generations, breeder):
+        self.id = job_id
+        self.population_size = population_size
+        self.generations = generations
+        self.breeder = breeder
+        self.status = "queued"
+        self.error = None
+        self.hall_of_fame = []
+        self.history = []
+        self.created_at = datetime.now().isoformat()
+        self.cancelled = threading.Event()
+
+    def snapshot(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "population_size": self.population_size,
+            "generations": self.generations,
+            "generation": self.breeder.generation,
+            "best": self.hall_of_fame[0] if self.hall_of_fame else None,
+            "hall_of_fame": self.hall_of_fame,
+            "history": self.history,
+            "error": self.error,
+            "created_at": self.created_at
+        }
+
+    def update_hall_of_fame(self, ranked):
+        entries = {
+            tuple(sorted(g["thresholds"].items())): g for g in self.hall_of_fame
+        }
+        for genome in ranked[:HALL_OF_FAME_SIZE]:
+            key = tuple(sorted(genome.thresholds.items()))
+            if key not in entries or entries[key]["fitness"] < genome.fitness:
+                entries[key] = {**genome.to_dict(), "generation": self.breeder.generation}
+        self.hall_of_fame = sorted(entries.values(), key=lambda g: g["fitness"], reverse=True)[:HALL_OF_FAME_SIZE]
+
+class EvolutionJobManager:
+    """
+    Runs multi-generation evolution jobs on background threads, fans fitness
+    evaluation out to a process pool, and checkpoints every generation to
+    SQLite so jobs survive restarts and are visible to every API worker.
+    Each running job is leased to one worker (evolution_jobs.owner), so
+    several uvicorn workers never run the same job twice.
+    """
+
+    def __init__(self, workers=EVOLUTION_WORKERS):
+        self.workers = workers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._prices = None
+        self._stopping = threading.Event()
+
+    def _get_prices(self):
+        if self._prices is None:
+            self._prices = load_backtest_prices()
+        return self._prices
+
+    def _get_pool(self):
+        with self._lock:
+            if self._stopping.is_set():
+                raise RuntimeError("Evolution job manager is shutting down")
+            if self._pool is None:
+                # spawn: forking a process that holds torch/uvicorn threads is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                    initargs=(self._get_prices(),)
+                )
+            return self._pool
+
+    def _evaluate(self, population):
+        rsi_buy = np.array([g.thresholds["RSI_Buy"] for g in population], dtype=float)
+        rsi_sell = np.array([g.thresholds["RSI_Sell"] for g in population], dtype=float)
+        sma = np.array([g.thresholds["SMA_Period"] for g in population], dtype=int)
+        if len(population) <= EVALUATION_CHUNK or self.workers <= 1:
+            fitness = backtest_population(self._get_prices(), rsi_buy, rsi_sell, sma)["sharpe"]
+        else:
+            bounds = range(0, len(population), EVALUATION_CHUNK)
+            futures = [
+                self._get_pool().submit(evaluate_chunk, rsi_buy[i:i + EVALUATION_CHUNK],
+                                        rsi_sell[i:i + EVALUATION_CHUNK], sma[i:i + EVALUATION_CHUNK])
+                for i in bounds
+            ]
+            fitness = np.concatenate([f.result() for f in futures])
+        for genome, value in zip(population, fitness):
+            genome.fitness = float(value)
+
+    def start(self, population_size=1000, generations=20):
+        population_size = max(2, min(int(population_size), MAX_POPULATION))
+        generations = max(1, min(int(generations), MAX_GENERATIONS))
+        breeder = StrategyBreeder(prices=self._get_prices())
+        breeder.initialize_population(population_size, diverse=True)
+        job = EvolutionJob(str(uuid.uuid4()), population_size, generations, breeder)
+        with self._lock:
+            self.jobs[job.id] = job
+        self._checkpoint(job)
+        self._launch(job)
+        return job.snapshot()
+
+    def _launch(self, job):
+        threading.Thread(target=self._run, args=(job,), name=f"evolution-{job.id[:8]}", daemon=True).start()
+
+    def _run(self, job):
+        job.status = "running"
+        breeder = job.breeder
+        try:
+            while breeder.generation < job.generations:
+                if self._stopping.is_set():
+                    return self._interrupt(job)
+                if job.cancelled.is_set():
+                    job.status = "cancelled"
+                    break
+                self._evaluate(breeder.population)
+                ranked = sorted(breeder.population, key=lambda g: g.fitness, reverse=True)
+                breeder.generation += 1
+                job.update_hall_of_fame(ranked)
+                fitness = np.array([g.fitness for g in ranked])
+                job.history.append({
+                    "generation": breeder.generation,
+                    "best": float(fitness[0]),
+                    "mean": float(fitness.mean()),
+                    "median": float(np.median(fitness))
+                })
+                breeder.population = breeder.breed(ranked)
+                if not self._checkpoint(job):
+                    self._abandon(job)
+                    return
+            else:
+                job.status = "completed"
+        except Exception as e:
+            if self._stopping.is_set():
+                # Pool torn down mid-generation (CancelledError/BrokenProcessPool)
+                return self._interrupt(job)
+            print(f"Evolution job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        if not self._checkpoint(job):
+            return self._abandon(job)
+        # Final state is in SQLite and get() serves it from there; drop the
+        # breeder/population (up to MAX_POPULATION genomes) from memory
+        with self._lock:
+            self.jobs.pop(job.id, None)
+
+    def _interrupt(self, job):
+        # Shutdown: the row stays 'running' at the last completed generation and
+        # the lease is released in shutdown(), so the next worker resumes it
+        print(f"Evolution job {job.id} interrupted at generation {job.breeder.generation}, will resume.")
+
+    def _abandon(self, job):
+        if self._stopping.is_set():
+            # Lease released by shutdown() while this generation was finishing
+            return self._interrupt(job)
+        # Another worker claimed the job after our lease lapsed; it owns the row now
+        print(f"Evolution job {job.id} was claimed by another worker, stopping here.")
+        with self._lock:
+            self.jobs.pop(job.id, None)
+
+    def _checkpoint(self, job):
+        """Saves the job and renews this worker's lease; False if another worker owns it."""
+        with db_session() as conn:
+            cursor = conn.execute("""
+                INSERT INTO evolution_jobs (id, status, population_size, generations, generation,
+                                            population_json, hall_of_fame_json, history_json, error,
+                                            created_at, updated_at, owner, lease_expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    status = excluded.status, generation = excluded.generation,
+                    population_json = excluded.population_json,
+                    hall_of_fame_json = excluded.hall_of_fame_json,
+                    history_json = excluded.history_json,
+                    error = excluded.error, updated_at = excluded.updated_at,
+                    lease_expires_at = excluded.lease_expires_at
+                WHERE evolution_jobs.owner = excluded.owner
+            """, (
+                job.id, job.status, job.population_size, job.generations, job.breeder.generation,
+                json.dumps([g.to_dict() for g in job.breeder.population]),
+                json.dumps(job.hall_of_fame), json.dumps(job.history), job.error,
+                job.created_at, datetime.now().isoformat(),
+                self.owner, time.time() + EVOLUTION_LEASE_SECONDS
+            ))
+            return cursor.rowcount == 1
+
+    def _claim(self, job_id):
+        """Atomically takes over an unowned or lapsed job; True if this worker got it."""
+        now = time.time()
+        with db_session() as conn:
+            cursor = conn.execute("""
+                UPDATE evolution_jobs SET owner = ?, lease_expires_at = ?
+                WHERE id = ? AND status IN ('queued', 'running')
+                  AND (owner IS NULL OR lease_expires_at IS NULL OR lease_expires_at < ?)
+            """, (self.owner, now + EVOLUTION_LEASE_SECONDS, job_id, now))
+            return cursor.rowcount == 1
+
+    def _restore(self, row):
+        breeder = StrategyBreeder(prices=self._get_prices())
+        breeder.population = [StrategyGenome.from_dict(g) for g in json.loads(row["population_json"])]
+        breeder.generation = row["generation"]
+        job = EvolutionJob(row["id"], row["population_size"], row["generations"], breeder)
+        job.status = row["status"]
+        job.error = row["error"]
+        job.hall_of_fame = json.loads(row["hall_of_fame_json"])
+        job.history = json.loads(row["history_json"])
+        job.created_at = row["created_at"]
+        return job
+
+    def resume_interrupted(self):
+        """
+        Claims and restarts queued/running jobs nobody holds a live lease on
+        (left behind by a stopped or crashed worker). Runs at startup and
+        periodically from the scheduler.
+        """
+        with db_read() as conn:
+            candidates = [row["id"] for row in conn.execute("""
+                SELECT id FROM evolution_jobs
+                WHERE status IN ('queued', 'running')
+                  AND (owner IS NULL OR lease_expires_at IS NULL OR lease_expires_at < ?)
+            """, (time.time(),)).fetchall()]
+        resumed = 0
+        for job_id in candidates:
+            if job_id in self.jobs or not self._claim(job_id):
+                continue
+            with db_read() as conn:
+                row = conn.execute("SELECT * FROM evolution_jobs WHERE id = ?", (job_id,)).fetchone()
+            job = self._restore(row)
+            with self._lock:
+                self.jobs[job.id] = job
+            print(f"Resuming evolution job {job.id} at generation {job.breeder.generation}.")
+            self._launch(job)
+            resumed += 1
+        return resumed
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        # Owned by another worker process (or finished before a restart).
+        # Polled by the SSE stream, so skip population_json and the price load.
+        with db_read() as conn:
+            row = conn.execute("""
+                SELECT id, status, population_size, generations, generation,
+                       hall_of_fame_json, history_json, error, created_at
+                FROM evolution_jobs WHERE id = ?
+            """, (job_id,)).fetchone()
+        return _summary_snapshot(row) if row else None
+
+    def list(self, limit=20):
+        with db_read() as conn:
+            rows = conn.execute("""
+                SELECT id, status, population_size, generations, generation, error, created_at, updated_at
+                FROM evolution_jobs ORDER BY created_at DESC LIMIT ?
+            """, (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancelled.set()
+        return True
+
+    def shutdown(self):
+        # Flag first, so jobs failing on the cancelled pool know they were interrupted
+        self._stopping.set()
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        # Release our leases so a restarted worker can resume immediately
+        with db_session() as conn:
+            conn.execute("""
+                UPDATE evolution_jobs SET owner = NULL, lease_expires_at = NULL
+                WHERE owner = ? AND status IN ('queued', 'running')
+            """, (self.owner,))
+
+evolution_jobs = EvolutionJobManager()
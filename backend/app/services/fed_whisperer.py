@@ -1,40 +1,178 @@
-import librosa
 import numpy as np
-import whisper
 import os
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Files are decoded once, straight to Whisper's input format (16 kHz mono
+# float32); chunks are views into that buffer.
+WHISPER_SAMPLE_RATE = 16000
+# Pitch tracking runs on a 2x-decimated copy of voiced stretches only; speech
+# F0 (C2-C7, 65-2093 Hz) stays well below the 4 kHz Nyquist limit.
+PITCH_DECIMATION = 2
+PITCH_FRAME_LENGTH = 1024
+PITCH_HOP_LENGTH = 256
+# Chunks match Whisper's 30 s context; neighbours overlap so words cut at a
+# boundary are heard whole by one of them.
+CHUNK_SECONDS = float(os.getenv("FED_WHISPER_CHUNK_SECONDS", "30"))
+CHUNK_OVERLAP_SECONDS = float(os.getenv("FED_WHISPER_CHUNK_OVERLAP_SECONDS", "2"))
+FED_WHISPER_WORKERS = int(os.getenv("FED_WHISPER_WORKERS", "2"))
+# Whisper model instances (~140 MB each for "base"). A transcribe() call
+# installs hooks on its model, so one instance decodes one chunk at a time;
+# with one instance per chunk worker, chunks are transcribed in parallel.
+FED_WHISPER_MODELS = int(os.getenv("FED_WHISPER_MODELS", str(FED_WHISPER_WORKERS)))
+
+def chunk_spans(total_samples, sr, chunk_seconds=CHUNK_SECONDS, overlap_seconds=CHUNK_OVERLAP_SECONDS):
+    """
+    Overlapping (start, end, own_start, own_end) sample ranges. Each chunk
+    "owns" the part of the overlap closest to it, so per-chunk results can
+    be merged without double counting.
+    """
+    chunk, overlap = int(chunk_seconds * sr), int(overlap_seconds * sr)
+    step = max(chunk - overlap, 1)
+    starts = list(range(0, max(total_samples - overlap, 1), step))
+    spans = []
+    for i, start in enumerate(starts):
+        end = min(start + chunk, total_samples)
+        own_start = start if i == 0 else start + overlap // 2
+        own_end = end if i == len(starts) - 1 else end - overlap // 2
+        spans.append((start, end, own_start, own_end))
+    return spans
 
 class FedWhisperer:
     def __init__(self):
         # Load small model for local efficiency
         # In a real app, load this once at startup or lazily
         self.model = None 
+        self.model_status = "pending"
+        self._model_lock = threading.Lock()
+        # Idle model instances; chunks check one out for the transcribe call.
+        # Extra instances beyond the first are loaded on demand.
+        self._idle_models = queue.Queue()
+        self._models_loaded = 0
 
     def _load_model(self):
-        if not self.model:
-            print("Loading Whisper Model...")
-            self.model = whisper.load_model("base")
+        if self.model:
+            return
+        with self._model_lock:
+            if not self.model:
+                import whisper
+                print("Loading Whisper Model...")
+                self.model_status = "loading"
+                try:
+                    self.model = whisper.load_model("base")
+                except Exception:
+                    self.model_status = "error"
+                    raise
+                self._idle_models.put(self.model)
+                self._models_loaded = 1
+                self.model_status = "ready"
 
-    def analyze_audio(self, file_path):
+    @contextmanager
+    def _checkout_model(self):
+        """Exclusive use of one model instance, loading another if under FED_WHISPER_MODELS."""
         self._load_model()
-        
-        # 1. Transcribe
-        result = self.model.transcribe(file_path)
-        transcript = result["text"]
-        
+        try:
+            model = self._idle_models.get_nowait()
+        except queue.Empty:
+            model = None
+            with self._model_lock:
+                if self._models_loaded < FED_WHISPER_MODELS:
+                    import whisper
+                    model = whisper.load_model("base")
+                    self._models_loaded += 1
+            if model is None:
+                model = self._idle_models.get()
+        try:
+            yield model
+        finally:
+            self._idle_models.put(model)
+
+    def warm_up(self):
+        self._load_model()
+
+    def load_audio(self, file_path):
+        import librosa
+        y, sr = librosa.load(file_path, sr=WHISPER_SAMPLE_RATE, mono=True, dtype=np.float32)
+        return y, sr
+
+    def _pitch(self, chunk, sr, intervals):
+        """F0 values and their sample positions (relative to chunk) for the voiced intervals."""
+        import librosa
+        from scipy.signal import decimate
+        pitch_sr = sr // PITCH_DECIMATION
+        values, positions = [], []
+        for start, end in intervals:
+            if (end - start) // PITCH_DECIMATION < PITCH_FRAME_LENGTH:
+                continue
+            segment = decimate(chunk[start:end], PITCH_DECIMATION)
+            f0, voiced_flag, voiced_probs = librosa.pyin(
+                segment, sr=pitch_sr, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'),
+                frame_length=PITCH_FRAME_LENGTH, hop_length=PITCH_HOP_LENGTH
+            )
+            values.append(f0)
+            frames = librosa.frames_to_samples(np.arange(len(f0)), hop_length=PITCH_HOP_LENGTH)
+            positions.append(start + frames * PITCH_DECIMATION)
+        if not values:
+            return np.empty(0), np.empty(0, dtype=int)
+        return np.concatenate(values), np.concatenate(positions)
+
+    def analyze_chunk(self, y, sr, span, index):
+        """Transcript segments and prosody sums for one chunk (absolute times in seconds)."""
+        import librosa
+        start, end, own_start, own_end = span
+        chunk = y[start:end]
+
+        # 1. Transcribe (the buffer is already 16 kHz mono float32)
+        with self._checkout_model() as model:
+            result = model.transcribe(chunk)
+        offset = start / sr
+        segments = result.get("segments") or [{"start": 0.0, "end": (end - start) / sr, "text": result["text"]}]
+        # Keep segments that begin inside the owned range; the neighbour has the rest
+        owned = [
+            {"start": offset + s["start"], "end": offset + s["end"], "text": s["text"].strip()}
+            for s in segments
+            if own_start / sr <= offset + s["start"] < own_end / sr
+        ]
+
         # 2. Extract Prosodic Features (Tone Analysis)
-        y, sr = librosa.load(file_path)
-        
-        # Pitch (Fundamental Frequency - F0)
-        f0, voiced_flag, voiced_probs = librosa.pyin(y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7'))
+        # Pause Duration (Silence detection), clipped to the owned range
+        intervals = librosa.effects.split(chunk, top_db=20)
+        voiced = np.clip(intervals + start, own_start, own_end)
+        silence_samples = (own_end - own_start) - int((voiced[:, 1] - voiced[:, 0]).sum())
+
+        # Pitch (Fundamental Frequency - F0), only frames inside the owned range
+        f0, positions = self._pitch(chunk, sr, intervals)
+        f0 = f0[(positions + start >= own_start) & (positions + start < own_end)]
         f0_clean = f0[~np.isnan(f0)]
-        pitch_variability = np.std(f0_clean) if len(f0_clean) > 0 else 0
-        
-        # Pause Duration (Silence detection)
-        intervals = librosa.effects.split(y, top_db=20)
-        silence_duration = (len(y) - sum([i[1] - i[0] for i in intervals])) / sr
-        total_duration = len(y) / sr
+
+        return {
+            "index": index,
+            "start": own_start / sr,
+            "end": own_end / sr,
+            "text": " ".join(s["text"] for s in owned),
+            "segments": owned,
+            "pitch": {"n": int(len(f0_clean)), "sum": float(f0_clean.sum()), "sum_sq": float((f0_clean ** 2).sum())},
+            "silence": silence_samples / sr,
+            "duration": (own_end - own_start) / sr
+        }
+
+    def combine(self, partials):
+        """Merges per-chunk results into the analyze_audio response."""
+        partials = sorted(partials, key=lambda p: p["index"])
+        transcript = " ".join(p["text"] for p in partials if p["text"])
+
+        n = sum(p["pitch"]["n"] for p in partials)
+        if n > 0:
+            mean = sum(p["pitch"]["sum"] for p in partials) / n
+            pitch_variability = np.sqrt(max(sum(p["pitch"]["sum_sq"] for p in partials) / n - mean ** 2, 0.0))
+        else:
+            pitch_variability = 0
+        total_duration = sum(p["duration"] for p in partials)
+        silence_duration = sum(p["silence"] for p in partials)
         pause_ratio = silence_duration / total_duration if total_duration > 0 else 0
-        
+
         # 3. Calculate Confidence Score
         # Heuristic: High pitch variability (expressive) + Low pause ratio (fluent) = High Confidence
         # This is a simplified "Fed Speak" decoder
@@ -55,4 +193,24 @@ class FedWhisperer:
             "confidence_score": min(max(confidence_score, 0.0), 1.0)
         }
 
+    def analyze_chunks(self, file_path, executor, on_chunk=None):
+        """
+        Decodes the file, fans its chunks out to `executor` and calls
+        on_chunk(partial, total) as each one finishes (in completion order).
+        """
+        y, sr = self.load_audio(file_path)
+        spans = chunk_spans(len(y), sr)
+        futures = [executor.submit(self.analyze_chunk, y, sr, span, i) for i, span in enumerate(spans)]
+        partials = []
+        for future in as_completed(futures):
+            partial = future.result()
+            partials.append(partial)
+            if on_chunk:
+                on_chunk(partial, len(spans))
+        return self.combine(partials)
+
+    def analyze_audio(self, file_path):
+        with ThreadPoolExecutor(max_workers=FED_WHISPER_WORKERS) as executor:
+            return self.analyze_chunks(file_path, executor)
+
 fed_whisperer = FedWhisperer()
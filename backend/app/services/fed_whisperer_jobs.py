@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+
+from app.services.fed_whisperer import FED_WHISPER_WORKERS, fed_whisperer
+
+# Whole files analyzed at once; their chunks share the chunk pool
+FED_WHISPER_MAX_JOBS = int(os.getenv("FED_WHISPER_MAX_JOBS", "2"))
+# Finished jobs kept for polling before the oldest are dropped
+FINISHED_JOBS_KEPT = 100
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+class AudioJob:
+    def __init__(self, file_path, filename):
+        self.id = str(uuid.uuid4())
+        self.file_path = file_path
+        self.filename = filename
+        self.status = "queued"
+        self.chunks_total = None
+        self.partials = []
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.future = Future()
+
+    def snapshot(self, since_chunk=0):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "filename": self.filename,
+            "chunks_total": self.chunks_total,
+            "chunks_done": len(self.partials),
+            # Partial transcripts/features in completion order
+            "partials": self.partials[since_chunk:],
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at
+        }
+
+class AudioJobManager:
+    """
+    Fed Whisperer analysis jobs. Each job decodes its file on the job pool
+    and fans fixed-size chunks out to a shared chunk pool; partial results
+    are published as chunks finish.
+    """
+
+    def __init__(self, workers=FED_WHISPER_WORKERS, max_jobs=FED_WHISPER_MAX_JOBS):
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._job_pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="fed-job")
+        self._chunk_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fed-chunk")
+        self._upload_dir = None
+
+    def _spool_dir(self):
+        # Private (0700) per-process directory instead of the working directory
+        with self._lock:
+            if self._upload_dir is None or not os.path.isdir(self._upload_dir):
+                self._upload_dir = tempfile.mkdtemp(prefix="fed-whisperer-")
+            return self._upload_dir
+
+    def spool(self, fileobj, filename):
+        """Copies an upload stream to a uniquely named file in the private spool dir."""
+        suffix = os.path.splitext(os.path.basename(filename or ""))[1][:16]
+        with tempfile.NamedTemporaryFile(dir=self._spool_dir(), suffix=suffix, delete=False) as f:
+            shutil.copyfileobj(fileobj, f, UPLOAD_CHUNK_BYTES)
+            return f.name
+
+    def submit(self, file_path, filename):
+        """Queues a saved upload; the job owns (and finally deletes) file_path."""
+        job = AudioJob(file_path, filename)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self._job_pool.submit(self._run, job)
+        return job
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job.status in ("completed", "failed")]
+        for job in finished[:max(len(finished) - FINISHED_JOBS_KEPT, 0)]:
+            del self.jobs[job.id]
+
+    def _on_chunk(self, job, partial, total):
+        job.chunks_total = total
+        job.partials.append(partial)
+
+    def _run(self, job):
+        job.status = "running"
+        try:
+            job.result = fed_whisperer.analyze_chunks(
+                job.file_path, self._chunk_pool, lambda partial, total: self._on_chunk(job, partial, total)
+            )
+            job.status = "completed"
+            job.future.set_result(job.result)
+        except Exception as e:
+            print(f"Fed Whisperer job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+            job.future.set_exception(e)
+        finally:
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+    def get(self, job_id, since_chunk=0):
+        job = self.jobs.get(job_id)
+        return job.snapshot(since_chunk) if job else None
+
+    def shutdown(self):
+        self._job_pool.shutdown(wait=False, cancel_futures=True)
+        self._chunk_pool.shutdown(wait=False, cancel_futures=True)
+        if self._upload_dir is not None:
+            shutil.rmtree(self._upload_dir, ignore_errors=True)
+
+fed_whisperer_jobs = AudioJobManager()
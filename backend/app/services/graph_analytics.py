@@ -1,88 +1,132 @@
+import os
+import re
+import threading
+from collections import deque
+
 import networkx as nx
-import json
 
-def build_supply_chain_graph(news_items):
-    G = nx.DiGraph()
-    
-    # Mock Supply Chain Relationships (Knowledge Base)
-    # In a real app, this would come from a database or NER
-    relationships = [
-        ("TSMC", "AAPL", "Supplier"),
-        ("TSMC", "NVDA", "Supplier"),
-        ("Foxconn", "AAPL", "Assembler"),
-        ("Samsung", "AAPL", "Competitor"),
-        ("Samsung", "NVDA", "Supplier"),
-        ("ASML", "TSMC", "Supplier"),
-        ("Panasonic", "TSLA", "Supplier"),
-        ("CATL", "TSLA", "Supplier"),
-        ("Rivian", "AMZN", "Partner"),
-        ("AWS", "AMZN", "Subsidiary"),
-        ("OpenAI", "MSFT", "Partner"),
-        ("Azure", "MSFT", "Subsidiary"),
-        ("Google", "GOOGL", "Subsidiary"),
-        ("DeepMind", "GOOGL", "Subsidiary"),
-        ("Waymo", "GOOGL", "Subsidiary"),
-        ("YouTube", "GOOGL", "Subsidiary"),
-    ]
-    
-    # Add nodes and edges
-    for source, target, rel_type in relationships:
-        G.add_edge(source, target, relationship=rel_type)
-        G.nodes[source]['type'] = 'company'
-        G.nodes[target]['type'] = 'company'
+# Number of most recent news items the node sentiments are averaged over
+SUPPLY_CHAIN_WINDOW = int(os.getenv("SUPPLY_CHAIN_WINDOW", "50"))
+# Share of a supplier's sentiment passed on to its buyer
+PROPAGATION_FACTOR = 0.5
+
+# Mock Supply Chain Relationships (Knowledge Base)
+# In a real app, this would come from a database or NER
+RELATIONSHIPS = [
+    ("TSMC", "AAPL", "Supplier"),
+    ("TSMC", "NVDA", "Supplier"),
+    ("Foxconn", "AAPL", "Assembler"),
+    ("Samsung", "AAPL", "Competitor"),
+    ("Samsung", "NVDA", "Supplier"),
+    ("ASML", "TSMC", "Supplier"),
+    ("Panasonic", "TSLA", "Supplier"),
+    ("CATL", "TSLA", "Supplier"),
+    ("Rivian", "AMZN", "Partner"),
+    ("AWS", "AMZN", "Subsidiary"),
+    ("OpenAI", "MSFT", "Partner"),
+    ("Azure", "MSFT", "Subsidiary"),
+    ("Google", "GOOGL", "Subsidiary"),
+    ("DeepMind", "GOOGL", "Subsidiary"),
+    ("Waymo", "GOOGL", "Subsidiary"),
+    ("YouTube", "GOOGL", "Subsidiary"),
+]
+
+class SupplyChainGraph:
+    """
+    Supply-chain graph built once, plus running per-node sentiment sums and
+    counts over a sliding window of the latest news. Items are matched to
+    nodes with one compiled word-boundary pattern as they are stored, so
+    reads only assemble the cached aggregates.
+    """
+
+    def __init__(self, relationships=RELATIONSHIPS, window=SUPPLY_CHAIN_WINDOW):
+        self.graph = nx.DiGraph()
+        for source, target, rel_type in relationships:
+            self.graph.add_edge(source, target, relationship=rel_type)
+            self.graph.nodes[source]['type'] = 'company'
+            self.graph.nodes[target]['type'] = 'company'
+        # Longest names first so e.g. "Google" wins over a shorter prefix node
+        names = sorted(self.graph.nodes, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(?:" + "|".join(re.escape(n) for n in names) + r")\b")
+        self.links = [
+            {"source": u, "target": v, "relationship": data['relationship']}
+            for u, v, data in self.graph.edges(data=True)
+        ]
+        self._window = deque(maxlen=window)
+        self._sums = dict.fromkeys(self.graph.nodes, 0.0)
+        self._counts = dict.fromkeys(self.graph.nodes, 0)
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot = None
+
+    def match_nodes(self, item):
+        """Graph nodes an item is about: its ticker plus every node named in the headline."""
+        nodes = set(self.pattern.findall(item.get('headline') or ""))
+        if item.get('ticker') in self._sums:
+            nodes.add(item['ticker'])
+        return nodes
 
-    # Analyze sentiment impact propagation
-    # If a supplier has negative news, it impacts the buyer
-    
-    # 1. Map sentiment to nodes from news
-    node_sentiments = {}
-    for item in news_items:
-        ticker = item['ticker']
-        if ticker not in node_sentiments:
-            node_sentiments[ticker] = []
-        node_sentiments[ticker].append(item['sentiment_score'])
-        
-        # Also check if entities in headline match our graph nodes
-        for node in G.nodes():
-            if node in item['headline'] or node in item['ticker']: # Simple match
-                 if node not in node_sentiments:
-                    node_sentiments[node] = []
-                 node_sentiments[node].append(item['sentiment_score'])
+    def record(self, item, sentiment_score):
+        """Adds one stored news item to the window, evicting the oldest."""
+        nodes = self.match_nodes(item)
+        with self._lock:
+            if len(self._window) == self._window.maxlen:
+                old_nodes, old_score = self._window[0]
+                for node in old_nodes:
+                    self._counts[node] -= 1
+                    # Reset exactly at zero so float drift cannot accumulate
+                    self._sums[node] = self._sums[node] - old_score if self._counts[node] else 0.0
+            self._window.append((nodes, sentiment_score))
+            for node in nodes:
+                self._sums[node] += sentiment_score
+                self._counts[node] += 1
+            self._version += 1
 
-    # Calculate average sentiment per node
-    for node in G.nodes():
-        if node in node_sentiments:
-            avg_sentiment = sum(node_sentiments[node]) / len(node_sentiments[node])
-            G.nodes[node]['sentiment'] = avg_sentiment
-        else:
-            G.nodes[node]['sentiment'] = 0.0
+    def record_many(self, items):
+        for item in items:
+            self.record(item, item['sentiment_score'])
 
-    # 2. Propagate impact (Simple Logic: Supplier Sentiment * 0.5 -> Buyer)
-    # This is a "First Order" propagation
-    for u, v, data in G.edges(data=True):
-        if G.nodes[u]['sentiment'] != 0:
-             # Impact flows from Supplier (u) to Buyer (v)
-             impact = G.nodes[u]['sentiment'] * 0.5
-             # Add to buyer's existing sentiment (simplified)
-             G.nodes[v]['propagated_impact'] = G.nodes[v].get('propagated_impact', 0) + impact
+    def warm_start(self, conn):
+        """Fills the window from the latest stored news (oldest first)."""
+        rows = conn.execute(
+            "SELECT ticker, headline, sentiment_score FROM news ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (self._window.maxlen,)
+        ).fetchall()
+        self.record_many(dict(row) for row in reversed(rows))
+
+    def _build_snapshot(self):
+        sentiment = {
+            node: (self._sums[node] / self._counts[node]) if self._counts[node] else 0.0
+            for node in self.graph.nodes
+        }
+        # First-order propagation: impact flows from supplier (u) to buyer (v)
+        propagated = dict.fromkeys(self.graph.nodes, 0)
+        for u, v in self.graph.edges():
+            if sentiment[u] != 0:
+                propagated[v] += sentiment[u] * PROPAGATION_FACTOR
+
+        nodes_data = []
+        for n, data in self.graph.nodes(data=True):
+            nodes_data.append({
+                "id": n,
+                "group": 1 if data.get('type') == 'company' else 2,
+                "sentiment": sentiment[n],
+                "propagated_impact": propagated[n],
+                "val": 10 + abs(sentiment[n]) * 10 # Size based on sentiment magnitude
+            })
+        return {"nodes": nodes_data, "links": self.links}
+
+    def snapshot(self):
+        """Frontend (react-force-graph) JSON, rebuilt only when news arrived since the last call."""
+        with self._lock:
+            if self._snapshot is None or self._snapshot[0] != self._version:
+                self._snapshot = (self._version, self._build_snapshot())
+            return self._snapshot[1]
+
+def build_supply_chain_graph(news_items):
+    """One-off graph over an explicit list of news rows (oldest first)."""
+    graph = SupplyChainGraph(window=max(1, len(news_items)))
+    graph.record_many(news_items)
+    return graph.snapshot()
 
-    # Convert to JSON for frontend (react-force-graph)
-    nodes_data = []
-    for n, data in G.nodes(data=True):
-        nodes_data.append({
-            "id": n,
-            "group": 1 if data.get('type') == 'company' else 2,
-            "sentiment": data.get('sentiment', 0),
-            "propagated_impact": data.get('propagated_impact', 0),
-            "val": 10 + abs(data.get('sentiment', 0)) * 10 # Size based on sentiment magnitude
-        })
-        
-    links_data = []
-    for u, v, data in G.edges(data=True):
-        links_data.append({
-            "source": u,
-            "target": v,
-            "relationship": data['relationship']
-        })
-        
-    return {"nodes": nodes_data, "links": links_data}
+supply_chain_graph = SupplyChainGraph()
@@ -1,12 +1,136 @@
-from sentence_transformers import SentenceTransformer
-from transformers import pipeline
-from app.core.database import get_chroma_client
+from app.core.database import get_chroma_collection
+from collections import OrderedDict
+import asyncio
 import logging
+import os
+import threading
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "1024"))
+ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256"))
+GENERATION_MAX_BATCH = int(os.getenv("RAG_GENERATION_MAX_BATCH", "8"))
+GENERATION_MAX_WAIT_MS = float(os.getenv("RAG_GENERATION_MAX_WAIT_MS", "10"))
+
+class LRUCache:
+    """Small thread-safe LRU with hit/miss counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+class GenerationBatcher:
+    """
+    Collects prompts submitted concurrently on the event loop and runs them
+    through the model as one padded batch. A batch closes when it reaches
+    max_batch_size or max_wait_ms after its first prompt arrived; prompts that
+    arrive while a batch is generating form the next one.
+    """
+
+    def __init__(self, generate_batch, max_batch_size=GENERATION_MAX_BATCH, max_wait_ms=GENERATION_MAX_WAIT_MS):
+        self._generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self.batches = 0
+        self.prompts = 0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, prompt):
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((prompt, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Callers that gave up (e.g. client disconnect) don't need generation
+        return [(prompt, future) for prompt, future in batch if not future.cancelled()]
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            try:
+                outputs = await self._loop.run_in_executor(
+                    None, self._generate_batch, [prompt for prompt, _ in batch]
+                )
+                for (_, future), output in zip(batch, outputs):
+                    if not future.done():
+                        future.set_result(output)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batches += 1
+            self.prompts += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "prompts": self.prompts,
+            "avg_batch_size": self.prompts / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0
+        }
+
+def normalize_query(query):
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
 class LocalRAG:
     _instance = None
 
@@ -17,103 +141,221 @@ class LocalRAG:
         return cls._instance
 
     def _initialize(self):
-        logger.info("Loading Local RAG models... This might take a minute.")
-        try:
-            # Load embedding model (lightweight, ~80MB)
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-            
-            # Load generation model (flan-t5-base, ~1GB)
-            # using device_map="auto" to use GPU if available, else CPU
-            self.generation_pipeline = pipeline(
-                'text2text-generation', 
-                model='google/flan-t5-base',
-                max_length=512
-            )
-            logger.info("Local RAG models loaded successfully.")
-        except Exception as e:
-            logger.error(f"Failed to load models: {e}")
-            raise e
+        self.embedding_cache = LRUCache(EMBEDDING_CACHE_SIZE)
+        # Keyed by (normalized query, retrieved ids): new news that changes the
+        # retrieval result produces a different key, so stale answers are never served.
+        self.answer_cache = LRUCache(ANSWER_CACHE_SIZE)
+        self.generation_batcher = GenerationBatcher(self.generate_batch)
+        # Models are loaded on first use or by warm_up(), not at import time
+        self._models = {}
+        self._model_locks = {"embedding": threading.Lock(), "generation": threading.Lock()}
+        self.model_status = {"embedding": "pending", "generation": "pending"}
+
+    def _load_model(self, name, loader):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._model_locks[name]:
+            if name not in self._models:
+                self.model_status[name] = "loading"
+                logger.info(f"Loading Local RAG {name} model... This might take a minute.")
+                try:
+                    self._models[name] = loader()
+                except Exception as e:
+                    self.model_status[name] = "error"
+                    logger.error(f"Failed to load {name} model: {e}")
+                    raise e
+                self.model_status[name] = "ready"
+                logger.info(f"Local RAG {name} model loaded successfully.")
+        return self._models[name]
+
+    @staticmethod
+    def _load_embedding_model():
+        from sentence_transformers import SentenceTransformer
+        # Load embedding model (lightweight, ~80MB)
+        return SentenceTransformer('all-MiniLM-L6-v2')
+
+    @staticmethod
+    def _load_generation_pipeline():
+        from transformers import pipeline
+        # Load generation model (flan-t5-base, ~1GB)
+        # using device_map="auto" to use GPU if available, else CPU
+        return pipeline(
+            'text2text-generation', 
+            model='google/flan-t5-base',
+            max_length=512
+        )
+
+    @property
+    def embedding_model(self):
+        return self._load_model("embedding", self._load_embedding_model)
+
+    @embedding_model.setter
+    def embedding_model(self, model):
+        self._models["embedding"] = model
+        self.model_status["embedding"] = "ready"
+
+    @property
+    def generation_pipeline(self):
+        return self._load_model("generation", self._load_generation_pipeline)
+
+    @generation_pipeline.setter
+    def generation_pipeline(self, model):
+        self._models["generation"] = model
+        self.model_status["generation"] = "ready"
+
+    def warm_up(self):
+        # Embedding first: the ingestion pipeline needs it, chat needs both
+        self.embedding_model
+        self.generation_pipeline
 
     def embed_text(self, text):
         # Returns a list of floats
         return self.embedding_model.encode(text).tolist()
 
-    def store_news(self, news_item):
+    def embed_texts(self, texts, batch_size=64):
+        # Single encode call for a whole batch; returns a list of float lists
+        if not texts:
+            return []
+        return self.embedding_model.encode(texts, batch_size=batch_size).tolist()
+
+    def build_document(self, news_item):
+        # Construct summary/blob
+        text_blob = f"{news_item['headline']} - {news_item['source']}"
+        if 'summary' in news_item and news_item['summary']:
+            text_blob += f": {news_item['summary']}"
+        return text_blob
+
+    def store_news(self, news_item, embedding=None):
+        self.store_news_batch([news_item], embeddings=[embedding])
+
+    def store_news_batch(self, news_items, embeddings=None):
+        if not news_items:
+            return
         try:
-            client = get_chroma_client()
-            collection = client.get_or_create_collection(name="news_embeddings")
+            collection = get_chroma_collection("news_embeddings")
             
-            # Construct summary/blob
-            text_blob = f"{news_item['headline']} - {news_item['source']}"
-            if 'summary' in news_item and news_item['summary']:
-                text_blob += f": {news_item['summary']}"
+            documents = [self.build_document(item) for item in news_items]
             
-            # Generate embedding
-            embedding = self.embed_text(text_blob)
+            # Generate embeddings the dedup stage didn't already compute, in one call
+            embeddings = list(embeddings) if embeddings else [None] * len(news_items)
+            missing = [i for i, emb in enumerate(embeddings) if emb is None]
+            if missing:
+                for i, emb in zip(missing, self.embed_texts([documents[i] for i in missing])):
+                    embeddings[i] = emb
             
             collection.add(
-                ids=[news_item["id"]],
-                embeddings=[embedding],
+                ids=[item["id"] for item in news_items],
+                embeddings=embeddings,
                 metadatas=[{
-                    "ticker": news_item["ticker"],
-                    "headline": news_item["headline"],
-                    "source": news_item["source"],
-                    "timestamp": news_item["timestamp"]
-                }],
-                documents=[text_blob]
+                    "ticker": item["ticker"],
+                    "headline": item["headline"],
+                    "source": item["source"],
+                    "timestamp": item["timestamp"]
+                } for item in news_items],
+                documents=documents
             )
-            logger.info(f"Stored news item {news_item['id']} locally.")
+            logger.info(f"Stored {len(news_items)} news item(s) locally.")
         except Exception as e:
             logger.error(f"Error storing news locally: {e}")
 
+    def embed_query(self, query):
+        # The normalized form is only the cache key; the model sees the query as
+        # typed, since case and punctuation can change its embedding
+        key = normalize_query(query)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.embed_text(query)
+            self.embedding_cache.put(key, embedding)
+        return embedding
+
+    def retrieve(self, query, n_results=3):
+        collection = get_chroma_collection("news_embeddings")
+        return collection.query(
+            query_embeddings=[self.embed_query(query)],
+            n_results=n_results
+        )
+
+    def build_prompt(self, query, results):
+        context_str = "\n".join(results['documents'][0])
+        return f"Answer the question based on the context.\n\nContext: {context_str}\n\nQuestion: {query}"
+
+    def build_citations(self, results):
+        # Extract citations from metadata
+        citations = []
+        if results['metadatas'] and results['metadatas'][0]:
+            for meta in results['metadatas'][0]:
+                citations.append({
+                    "headline": meta.get("headline", "Unknown"),
+                    "source": meta.get("source", "Unknown"),
+                    "ticker": meta.get("ticker", "Unknown")
+                })
+        return citations
+
+    def answer_cache_key(self, query, results):
+        return (normalize_query(query), tuple(results['ids'][0]))
+
     def answer_query(self, query):
         try:
             # Step 1: Retrieve
-            query_embedding = self.embed_text(query)
-            
-            client = get_chroma_client()
-            collection = client.get_collection("news_embeddings")
-            
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=3
-            )
-            
-            retrieved_docs = []
-            if results['documents']:
-                retrieved_docs = results['documents'][0]
-            
-            if not retrieved_docs:
+            results = self.retrieve(query)
+            if not results['documents'] or not results['documents'][0]:
                 return "No relevant news found to answer your question."
 
-            # Step 2: Contextualize
-            context_str = "\n".join(retrieved_docs)
-            
-            # Step 3: Generate
-            prompt = f"Answer the question based on the context.\n\nContext: {context_str}\n\nQuestion: {query}"
-            
-            # Generate response
-            output = self.generation_pipeline(prompt)
+            cache_key = self.answer_cache_key(query, results)
+            cached = self.answer_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            # Step 2: Contextualize + Step 3: Generate
+            output = self.generation_pipeline(self.build_prompt(query, results))
             # output is a list of dicts: [{'generated_text': '...'}]
-            answer_text = output[0]['generated_text']
-            
-            # Extract citations from metadata
-            citations = []
-            if results['metadatas'] and results['metadatas'][0]:
-                for meta in results['metadatas'][0]:
-                    citations.append({
-                        "headline": meta.get("headline", "Unknown"),
-                        "source": meta.get("source", "Unknown"),
-                        "ticker": meta.get("ticker", "Unknown")
-                    })
+            answer = {
+                "answer": output[0]['generated_text'],
+                "citations": self.build_citations(results)
+            }
+            self.answer_cache.put(cache_key, answer)
+            return answer
+        except Exception as e:
+            logger.error(f"Error answering query locally: {e}")
+            return "I encountered an error processing your request locally."
 
-            return {
-                "answer": answer_text,
-                "citations": citations
+    def generate_batch(self, prompts):
+        # One padded forward pass for all prompts; returns one string per prompt
+        outputs = self.generation_pipeline(prompts, batch_size=len(prompts))
+        return [
+            (out[0] if isinstance(out, list) else out)['generated_text']
+            for out in outputs
+        ]
+
+    async def answer_query_async(self, query):
+        """Async answer_query: retrieval in a worker thread, generation micro-batched."""
+        try:
+            results = await asyncio.to_thread(self.retrieve, query)
+            if not results['documents'] or not results['documents'][0]:
+                return "No relevant news found to answer your question."
+
+            cache_key = self.answer_cache_key(query, results)
+            cached = self.answer_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            answer = {
+                "answer": await self.generation_batcher.submit(self.build_prompt(query, results)),
+                "citations": self.build_citations(results)
             }
+            self.answer_cache.put(cache_key, answer)
+            return answer
         except Exception as e:
             logger.error(f"Error answering query locally: {e}")
             return "I encountered an error processing your request locally."
 
+    def cache_stats(self):
+        return {
+            "embeddings": self.embedding_cache.stats(),
+            "answers": self.answer_cache.stats(),
+            "generation": self.generation_batcher.stats()
+        }
+
 # Create a global instance to be imported
 local_rag_service = LocalRAG()
@@ -1,58 +1,147 @@
-import yfinance as yf
-import pandas as pd
+from app.services.price_store import price_store
+from collections import Counter, deque
+import os
 import random
+import threading
+import time
+
+# Number of most recent news items the knowledge graph is built from
+KNOWLEDGE_GRAPH_WINDOW = int(os.getenv("KNOWLEDGE_GRAPH_WINDOW", "20"))
+# Deltas kept for `since=` polling; older clients get the full graph
+KNOWLEDGE_GRAPH_DELTA_LOG = 256
+
+# Add some related entities (Mock)
+# In a real app, this would use NER to find relationships
+RELATED_ENTITIES = {
+    "AAPL": ["TSMC", "Foxconn", "Samsung"],
+    "TSLA": ["Panasonic", "CATL", "SpaceX"],
+    "NVDA": ["TSMC", "Microsoft", "Google"],
+    "AMZN": ["Rivian", "AWS", "Whole Foods"],
+    "GOOGL": ["DeepMind", "Waymo", "YouTube"],
+    "MSFT": ["OpenAI", "LinkedIn", "GitHub"],
+    "JPM": ["Chase", "Bear Stearns", "Goldman Sachs"],
+    "GS": ["JPM", "Morgan Stanley", "Apple"]
+}
 
 def fetch_price_history(ticker: str, period="1mo"):
     try:
-        # Fetch data
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period=period)
-        
-        # Format for frontend
-        data = []
-        for date, row in hist.iterrows():
-            data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "price": round(row["Close"], 2)
-            })
-        return data
+        # Served from the local price store; only stale/new bars hit the network
+        return price_store.history(ticker, period)
     except Exception as e:
         print(f"Error fetching stock data: {e}")
         return []
 
-def generate_knowledge_graph(news_items):
-    # Mock knowledge graph generation based on recent news
-    # In a real app, this would use NER to find relationships
-    
-    nodes = []
-    links = []
-    
-    # Extract unique tickers from news
-    tickers = list(set(item['ticker'] for item in news_items))
-    
-    # Add nodes
-    for ticker in tickers:
-        nodes.append({"id": ticker, "type": "company", "val": 10})
-        
-    # Add some related entities (Mock)
-    related_entities = {
-        "AAPL": ["TSMC", "Foxconn", "Samsung"],
-        "TSLA": ["Panasonic", "CATL", "SpaceX"],
-        "NVDA": ["TSMC", "Microsoft", "Google"],
-        "AMZN": ["Rivian", "AWS", "Whole Foods"],
-        "GOOGL": ["DeepMind", "Waymo", "YouTube"],
-        "MSFT": ["OpenAI", "LinkedIn", "GitHub"],
-        "JPM": ["Chase", "Bear Stearns", "Goldman Sachs"],
-        "GS": ["JPM", "Morgan Stanley", "Apple"]
-    }
-    
+def _graph_for(tickers):
+    """Nodes (dict keyed by id) and link set for a set of active tickers."""
+    nodes = {ticker: {"id": ticker, "type": "company", "val": 10} for ticker in tickers}
+    links = set()
     for ticker in tickers:
-        if ticker in related_entities:
-            for entity in related_entities[ticker]:
-                # Add node if not exists
-                if not any(n['id'] == entity for n in nodes):
-                    nodes.append({"id": entity, "type": "partner", "val": 5})
-                # Add link
-                links.append({"source": ticker, "target": entity})
-                
-    return {"nodes": nodes, "links": links}
+        for entity in RELATED_ENTITIES.get(ticker, ()):
+            nodes.setdefault(entity, {"id": entity, "type": "partner", "val": 5})
+            links.add((ticker, entity))
+    return nodes, links
+
+def _links_json(links):
+    return [{"source": source, "target": target} for source, target in sorted(links)]
+
+def generate_knowledge_graph(news_items):
+    nodes, links = _graph_for({item['ticker'] for item in news_items})
+    return {"nodes": list(nodes.values()), "links": _links_json(links)}
+
+class KnowledgeGraph:
+    """
+    Knowledge graph over the latest news, maintained as news is stored.
+    Nodes are keyed by id and links kept as a set; every change bumps the
+    version and is logged as a delta, so pollers can ask for the changes
+    since the version they hold.
+    """
+
+    def __init__(self, window=KNOWLEDGE_GRAPH_WINDOW):
+        self._window = deque(maxlen=window)
+        self._tickers = Counter()
+        self.nodes = {}
+        self.links = set()
+        self._lock = threading.Lock()
+        # Millisecond base so versions from an earlier process never look current
+        self.version = int(time.time() * 1000)
+        self._deltas = deque(maxlen=KNOWLEDGE_GRAPH_DELTA_LOG)
+        self._full = None
+
+    def record(self, ticker):
+        """Adds one stored news item's ticker, evicting the oldest item."""
+        with self._lock:
+            if len(self._window) == self._window.maxlen:
+                evicted = self._window[0]
+                self._tickers[evicted] -= 1
+                if not self._tickers[evicted]:
+                    del self._tickers[evicted]
+            self._window.append(ticker)
+            self._tickers[ticker] += 1
+            self._apply()
+
+    def warm_start(self, conn):
+        """Fills the window from the latest stored news (oldest first)."""
+        rows = conn.execute(
+            "SELECT ticker FROM news ORDER BY timestamp DESC, id DESC LIMIT ?", (self._window.maxlen,)
+        ).fetchall()
+        for row in reversed(rows):
+            self.record(row["ticker"])
+
+    def _apply(self):
+        # Only the set of distinct tickers matters; most stored items leave it unchanged
+        nodes, links = _graph_for(set(self._tickers))
+        upserted = {node_id: node for node_id, node in nodes.items() if self.nodes.get(node_id) != node}
+        removed = [node_id for node_id in self.nodes if node_id not in nodes]
+        added_links, removed_links = links - self.links, self.links - links
+        if not (upserted or removed or added_links or removed_links):
+            return
+        self.nodes, self.links = nodes, links
+        self._deltas.append((self.version, upserted, removed, added_links, removed_links))
+        self.version += 1
+        self._full = None
+
+    def _snapshot(self):
+        if self._full is None:
+            self._full = {
+                "version": self.version,
+                "nodes": list(self.nodes.values()),
+                "links": _links_json(self.links)
+            }
+        return self._full
+
+    def snapshot(self):
+        with self._lock:
+            return self._snapshot()
+
+    def delta(self, since):
+        """
+        Changes between version `since` and now: nodes to add or replace,
+        node ids to drop, links to add and drop (apply removals first).
+        Falls back to the full
+        graph ("full": true) when `since` is unknown or no longer logged.
+        """
+        with self._lock:
+            log = [entry for entry in self._deltas if entry[0] >= since]
+            if since > self.version or (since < self.version and (not log or log[0][0] != since)):
+                return {**self._snapshot(), "full": True}
+            nodes, removed, added_links, removed_links = {}, set(), set(), set()
+            for _, upserted, dropped, links_in, links_out in log:
+                for node_id in dropped:
+                    nodes.pop(node_id, None)
+                    removed.add(node_id)
+                for node_id, node in upserted.items():
+                    removed.discard(node_id)
+                    nodes[node_id] = node
+                added_links = (added_links - links_out) | links_in
+                removed_links = (removed_links - links_in) | links_out
+            return {
+                "version": self.version,
+                "since": since,
+                "full": False,
+                "added_nodes": list(nodes.values()),
+                "removed_nodes": sorted(removed),
+                "added_links": _links_json(added_links),
+                "removed_links": _links_json(removed_links)
+            }
+
+knowledge_graph = KnowledgeGraph()
@@ -1,57 +1,236 @@
-from app.agents.macro_agent import macro_agent
-from app.agents.trader_agent import trader_agent
-import random
+from app.agents.forensic_agent import forensic_agent
+from app.agents.trader_agent import trader_agent, describe_reason, ACTION_NAMES
+from app.services.portfolio_state import portfolio_state
+from app.services.price_store import price_store
+import os
+import re
+import numpy as np
+
+# Monte Carlo settings
+DEFAULT_PATHS = int(os.getenv("MULTIVERSE_PATHS", "20000"))
+MAX_PATHS = 100000
+HORIZON_DAYS = 21 # ~one trading month
+HISTORY_PERIOD = "1y"
+MIN_HISTORY_DAYS = 30
+TRADING_DAYS = 252
+# Used for holdings without usable price history
+FALLBACK_PRICE = 100.0 # Same mock price the trader sizes with
+FALLBACK_ANNUAL_VOL = 0.30
+FALLBACK_CORRELATION = 0.3
+
+# Premise keyword -> shock. "market" rules move every holding; "ticker"
+# rules only move holdings whose symbol is named in the premise.
+# drift: extra horizon log-return; vol: multiplier; correlation: blend
+# towards perfect correlation (crises make everything move together).
+SHOCK_RULES = [
+    {"keywords": ["crash", "crisis", "war", "collapse", "default"], "scope": "market",
+     "drift": -0.15, "vol": 2.0, "correlation": 0.4, "regime": "Risk-Off"},
+    {"keywords": ["hike", "inflation", "oil hits", "recession", "tariff"], "scope": "market",
+     "drift": -0.05, "vol": 1.4, "correlation": 0.2, "regime": "Risk-Off"},
+    {"keywords": ["rate cut", "stimulus", "soft landing", "rally"], "scope": "market",
+     "drift": 0.04, "vol": 0.9, "correlation": 0.0, "regime": "Risk-On"},
+    {"keywords": ["miss", "downgrade", "probe", "fraud", "recall", "lawsuit"], "scope": "ticker",
+     "drift": -0.12, "vol": 1.5},
+    {"keywords": ["beat", "upgrade", "acquire", "breakthrough"], "scope": "ticker",
+     "drift": 0.08, "vol": 1.2},
+]
+
+def parse_premise(premise, tickers=()):
+    """Premise text -> shock spec (regime, market and per-ticker drift/vol shifts)."""
+    text = premise.lower()
+    mentioned = [t for t in tickers if re.search(rf"\b{re.escape(t)}\b", premise, re.IGNORECASE)]
+    spec = {
+        "regime": "Risk-On",
+        "market_drift": 0.0,
+        "vol_multiplier": 1.0,
+        "correlation_blend": 0.0,
+        "ticker_drift": {},
+        "ticker_vol": {}
+    }
+    for rule in SHOCK_RULES:
+        if not any(k in text for k in rule["keywords"]):
+            continue
+        if rule["scope"] == "market":
+            spec["market_drift"] += rule["drift"]
+            spec["vol_multiplier"] *= rule["vol"]
+            spec["correlation_blend"] = max(spec["correlation_blend"], rule["correlation"])
+            if rule["regime"] == "Risk-Off":
+                spec["regime"] = "Risk-Off"
+        else:
+            for ticker in mentioned:
+                spec["ticker_drift"][ticker] = spec["ticker_drift"].get(ticker, 0.0) + rule["drift"]
+                spec["ticker_vol"][ticker] = spec["ticker_vol"].get(ticker, 1.0) * rule["vol"]
+    return spec
+
+def load_positions():
+    """Cash plus non-zero holdings of the live portfolio."""
+    snapshot = portfolio_state.snapshot()
+    return snapshot["cash_balance"], snapshot["holdings"]
+
+def estimate_market(tickers, period=HISTORY_PERIOD):
+    """
+    Last price, daily log-return mean/vol and correlation matrix per ticker,
+    from the cached price history (dates aligned across tickers).
+    """
+    n = len(tickers)
+    prices = np.full(n, FALLBACK_PRICE)
+    mu = np.zeros(n)
+    sigma = np.full(n, FALLBACK_ANNUAL_VOL / np.sqrt(TRADING_DAYS))
+    estimated = np.zeros(n, dtype=bool)
+    series = {}
+    for i, ticker in enumerate(tickers):
+        try:
+            bars = price_store.get_bars(ticker, period)
+        except Exception as e:
+            print(f"No price history for {ticker}: {e}")
+            continue
+        if len(bars) > MIN_HISTORY_DAYS:
+            prices[i] = float(bars["close"][-1])
+            series[i] = bars
+            returns = np.diff(np.log(np.asarray(bars["close"], dtype=float)))
+            mu[i], sigma[i] = returns.mean(), returns.std(ddof=1)
+            estimated[i] = True
+
+    correlation = np.full((n, n), FALLBACK_CORRELATION)
+    np.fill_diagonal(correlation, 1.0)
+    if len(series) > 1:
+        # Pairwise-complete estimate over the dates every estimated ticker shares
+        common = series[next(iter(series))]["date"]
+        for bars in series.values():
+            common = np.intersect1d(common, bars["date"])
+        if len(common) > MIN_HISTORY_DAYS:
+            idx = np.array(sorted(series))
+            closes = np.stack([
+                np.asarray(series[i]["close"], dtype=float)[np.isin(series[i]["date"], common)] for i in idx
+            ])
+            sample = np.corrcoef(np.diff(np.log(closes), axis=1))
+            correlation[np.ix_(idx, idx)] = np.nan_to_num(sample, nan=FALLBACK_CORRELATION)
+            np.fill_diagonal(correlation, 1.0)
+    return {"prices": prices, "mu": mu, "sigma": sigma, "correlation": correlation, "estimated": estimated}
+
+def _cholesky(correlation):
+    try:
+        return np.linalg.cholesky(correlation)
+    except np.linalg.LinAlgError:
+        # Clip negative eigenvalues (pairwise estimates need not be PSD), rescale to unit diagonal
+        values, vectors = np.linalg.eigh(correlation)
+        fixed = (vectors * np.clip(values, 1e-8, None)) @ vectors.T
+        d = np.sqrt(np.diag(fixed))
+        return np.linalg.cholesky(fixed / np.outer(d, d) + 1e-10 * np.eye(len(d)))
+
+def simulate_pnl(values, mu, sigma, correlation, normals, horizon=HORIZON_DAYS):
+    """
+    Horizon P&L per path and holding. With i.i.d. Gaussian daily log
+    returns the horizon return is Gaussian too, so each path needs one
+    correlated draw per holding: normals @ L.T, scaled and shifted.
+    """
+    L = _cholesky(correlation)
+    log_returns = mu * horizon + (normals @ L.T) * (sigma * np.sqrt(horizon))
+    return np.expm1(log_returns) * values
+
+def risk_summary(pnl_by_holding, equity, tickers, confidence_levels=(0.95, 0.99)):
+    pnl = pnl_by_holding.sum(axis=1)
+    summary = {
+        "expected_pnl": float(pnl.mean()),
+        "std_pnl": float(pnl.std()),
+        "prob_loss": float((pnl < 0).mean()),
+        "percentiles": {f"p{q}": float(v) for q, v in zip((1, 5, 25, 50, 75, 95, 99), np.percentile(pnl, (1, 5, 25, 50, 75, 95, 99)))}
+    }
+    tail_95 = None
+    for level in confidence_levels:
+        var = -np.percentile(pnl, (1 - level) * 100)
+        tail = pnl <= -var
+        key = int(round(level * 100))
+        summary[f"var_{key}"] = float(var)
+        summary[f"cvar_{key}"] = float(-pnl[tail].mean())
+        if level == 0.95:
+            tail_95 = tail
+    # Per-holding contributions: expected P&L and the holding's share of the
+    # 95% tail loss (these sum to CVaR95). Mat-vec products, not per-column means.
+    expected = np.full(len(pnl), 1.0 / len(pnl)) @ pnl_by_holding
+    tail_share = -(tail_95 / tail_95.sum()) @ pnl_by_holding
+    summary["contributions"] = [
+        {"ticker": ticker, "expected_pnl": float(expected[i]), "cvar_95_contribution": float(tail_share[i])}
+        for i, ticker in enumerate(tickers)
+    ]
+    summary["expected_return_pct"] = 100 * summary["expected_pnl"] / equity if equity else 0.0
+    return summary
 
 class MultiverseSimulator:
-    def run_simulation(self, premise):
+    def run_simulations(self, premises, paths=DEFAULT_PATHS, horizon=HORIZON_DAYS, seed=None):
         """
-        Simulates portfolio reaction to a hypothetical premise.
-        Does NOT execute real trades.
+        Simulates portfolio reaction to hypothetical premises.
+        Does NOT execute real trades. Holdings, market estimates and the
+        random draws are shared by all premises, so they differ only by
+        their shock (common random numbers).
         """
-        
-        # 1. Parse Premise to determine Simulated Market Regime
-        # Simple keyword matching for the mock
-        simulated_regime = "Risk-On"
-        if any(x in premise.lower() for x in ["crash", "hike", "war", "crisis", "inflation", "oil hits"]):
-            simulated_regime = "Risk-Off"
-            
-        # 2. Simulate Trader Reaction
-        # We'll create a mock news item based on the premise
-        mock_news = {
-            "ticker": "SPY", # General market
-            "headline": premise,
-            "source": "Multiverse Simulator"
-        }
-        
+        paths = max(100, min(int(paths), MAX_PATHS))
+        cash, holdings = load_positions()
+        tickers = sorted(holdings)
+        shares = np.array([holdings[t] for t in tickers], dtype=float)
+        market = estimate_market(tickers)
+        values = shares * market["prices"]
+        equity = cash + values.sum()
+        normals = np.random.default_rng(seed).standard_normal((paths, len(tickers)))
+
+        results = []
+        for premise in premises:
+            spec = parse_premise(premise, tickers)
+            drift = np.array([spec["ticker_drift"].get(t, 0.0) for t in tickers]) + spec["market_drift"]
+            vol = np.array([spec["ticker_vol"].get(t, 1.0) for t in tickers]) * spec["vol_multiplier"]
+            blend = spec["correlation_blend"]
+            correlation = (1 - blend) * market["correlation"] + blend * np.ones_like(market["correlation"])
+
+            if tickers:
+                pnl = simulate_pnl(values, market["mu"] + drift / horizon, market["sigma"] * vol,
+                                   correlation, normals, horizon)
+            else:
+                pnl = np.zeros((paths, 0))
+            distribution = risk_summary(pnl, equity, tickers)
+            results.append(self._report(premise, spec, distribution, {
+                "cash": cash,
+                "holdings_value": float(values.sum()),
+                "equity": float(equity),
+                "positions": [
+                    {"ticker": t, "shares": int(s), "price": float(p), "value": float(v), "estimated": bool(e)}
+                    for t, s, p, v, e in zip(tickers, shares, market["prices"], values, market["estimated"])
+                ]
+            }, paths, horizon))
+        return results
+
+    def run_simulation(self, premise, **kwargs):
+        return self.run_simulations([premise], **kwargs)[0]
+
+    def _recommend(self, premise, regime, cash):
+        """Runs the trader's own decision kernel on the premise as if it were news."""
         # Mock sentiment based on premise keywords
-        sentiment = -0.8 if simulated_regime == "Risk-Off" else 0.8
-        
-        # Reuse Trader Logic but don't commit to DB (we'd need to refactor TraderAgent to separate logic from execution, 
-        # but for now we will simulate the decision logic here)
-        
-        decision = {
-            "action": "HOLD",
-            "reason": "Uncertainty in multiverse."
-        }
-        
-        if simulated_regime == "Risk-Off":
-            decision = {
-                "action": "SELL_ALL",
-                "reason": f"Premise '{premise}' triggered Risk-Off regime. Liquidation recommended."
-            }
+        sentiment = -0.8 if regime == "Risk-Off" else 0.8
+        forensic_score = forensic_agent.scan_risk(premise)
+        decision = trader_agent.replay([sentiment], [regime], [forensic_score], cash)
+        action = ACTION_NAMES[int(decision["action"][0])]
+        if action == "SKIP":
+            reason = describe_reason(decision["reason"][0], forensic_score)
+        elif action == "SELL":
+            reason = f"Premise '{premise}' triggered Risk-Off regime. Reduce exposure."
         else:
-             decision = {
-                "action": "BUY_AGGRESSIVE",
-                "reason": f"Premise '{premise}' suggests bullish continuation."
-            }
-            
+            reason = f"Premise '{premise}' suggests bullish continuation."
+        return {"action": action, "shares": int(decision["shares"][0]), "reason": reason}
+
+    def _report(self, premise, spec, distribution, portfolio, paths, horizon):
+        simulated_regime = spec["regime"]
+        decision = self._recommend(premise, simulated_regime, portfolio["cash"])
         return {
             "premise": premise,
             "simulated_regime": simulated_regime,
             "projected_impact": {
-                "portfolio_value_change": "-15%" if simulated_regime == "Risk-Off" else "+5%",
+                "portfolio_value_change": f"{distribution['expected_return_pct']:+.1f}%",
                 "recommended_action": decision
-            }
+            },
+            "shock": spec,
+            "distribution": distribution,
+            "portfolio": portfolio,
+            "paths": paths,
+            "horizon_days": horizon
         }
 
 multiverse_simulator = MultiverseSimulator()
@@ -0,0 +1,340 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from app.core.database import db_read, db_session
+
+# Journal flush triggers: whichever comes first
+PORTFOLIO_FLUSH_MS = float(os.getenv("PORTFOLIO_FLUSH_MS", "50"))
+PORTFOLIO_FLUSH_TRADES = int(os.getenv("PORTFOLIO_FLUSH_TRADES", "100"))
+# Cash/holdings snapshot interval; trades after it are replayed on startup
+PORTFOLIO_CHECKPOINT_SECONDS = float(os.getenv("PORTFOLIO_CHECKPOINT_SECONDS", "5"))
+# Ownership lease on the portfolio row; renewed by the owner's writer thread
+PORTFOLIO_LEASE_SECONDS = float(os.getenv("PORTFOLIO_LEASE_SECONDS", "30"))
+DEAD_LETTER_LIMIT = 1000
+
+ACTION_SIGN = {"BUY": 1, "SELL": -1}
+TRADE_INSERT_SQL = """
+    INSERT INTO trades (id, portfolio_id, ticker, action, shares, price, reason, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+class PortfolioState:
+    """
+    Authoritative in-memory portfolio (cash, holdings). Trades are applied
+    under one lock and appended to a write-behind journal; the trades table
+    is the durable journal and the portfolio/holdings rows are a periodic
+    checkpoint recording the last trade id they include.
+
+    One worker process owns the state, enforced by a lease on the portfolio
+    row (owner, lease_expires_at); only the owner trades and assigns trade
+    ids. Other workers are read-only: they serve snapshots from SQLite,
+    forward their trade decisions to the owner (trade_decision_queue) and
+    take over when the owner's lease lapses.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.owned = False
+        self._last_lease = 0.0
+        # Trades the journal rejected permanently (constraint violations), newest last
+        self.dead_letters = deque(maxlen=DEAD_LETTER_LIMIT)
+        self.portfolio_id = None
+        self.cash = 0.0
+        self.holdings = {}
+        self.last_updated = None
+        self._next_trade_id = 1
+        self._pending = []           # journal entries not yet in SQLite
+        self._flushed_id = 0         # highest trade id written to the journal
+        self._checkpoint_id = 0      # highest trade id included in the snapshot
+        self._dirty = set()          # tickers changed since the last checkpoint
+        self._last_checkpoint = time.monotonic()
+        self._wakeup = threading.Condition(self.lock)
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._writer = None
+
+    # --- Startup / shutdown ---
+
+    @staticmethod
+    def _read_journal(conn):
+        """Checkpoint row, its holdings and the journaled trades written after it."""
+        row = conn.execute(
+            "SELECT id, cash_balance, last_updated, last_trade_id FROM portfolio LIMIT 1"
+        ).fetchone()
+        holdings = conn.execute(
+            "SELECT ticker, shares FROM holdings WHERE portfolio_id = ?", (row["id"],)
+        ).fetchall()
+        replay = conn.execute("""
+            SELECT id, ticker, action, shares, price, timestamp FROM trades
+            WHERE portfolio_id = ? AND id > ? ORDER BY id
+        """, (row["id"], row["last_trade_id"] or 0)).fetchall()
+        return row, holdings, replay
+
+    def _claim(self):
+        """Takes (or renews) the ownership lease; True if this process owns the portfolio."""
+        now = time.time()
+        with db_session() as conn:
+            cursor = conn.execute("""
+                UPDATE portfolio SET owner = ?, lease_expires_at = ?
+                WHERE id = (SELECT id FROM portfolio LIMIT 1)
+                  AND (owner IS NULL OR owner = ? OR lease_expires_at IS NULL OR lease_expires_at < ?)
+            """, (self.owner, now + PORTFOLIO_LEASE_SECONDS, self.owner, now))
+            claimed = cursor.rowcount == 1
+        self._last_lease = time.monotonic()
+        return claimed
+
+    def _release(self):
+        with db_session() as conn:
+            conn.execute("UPDATE portfolio SET owner = NULL, lease_expires_at = NULL WHERE owner = ?",
+                         (self.owner,))
+
+    def load(self):
+        """
+        Claims ownership, then loads the last checkpoint and replays the
+        journal written after it. Without the lease the state stays read-only.
+        """
+        if not self._claim():
+            with db_read() as conn:
+                row = conn.execute("SELECT id, owner FROM portfolio LIMIT 1").fetchone()
+            with self.lock:
+                self.owned = False
+                self.portfolio_id = row["id"]
+            print(f"Portfolio is owned by {row['owner']}; this worker serves it read-only.")
+            return
+        with db_read() as conn:
+            row, holdings, replay = self._read_journal(conn)
+            max_id = conn.execute("SELECT coalesce(max(id), 0) FROM trades").fetchone()[0]
+
+        with self.lock:
+            self.owned = True
+            self.portfolio_id = row["id"]
+            self.cash = row["cash_balance"]
+            self.last_updated = row["last_updated"]
+            self.holdings = {h["ticker"]: h["shares"] for h in holdings}
+            self._pending = []
+            self._dirty = set()
+            for trade in replay:
+                self._apply(trade["ticker"], ACTION_SIGN.get(trade["action"], 0) * trade["shares"],
+                            trade["price"], trade["timestamp"])
+            self._checkpoint_id = row["last_trade_id"] or 0
+            self._flushed_id = max_id
+            self._next_trade_id = max_id + 1
+        if replay:
+            print(f"Replayed {len(replay)} journaled trades into the portfolio.")
+            self.checkpoint()
+
+    def start(self):
+        with self.lock:
+            self._stopping = False
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._writer_loop, name="portfolio-journal", daemon=True)
+                self._writer.start()
+
+    def close(self):
+        """Stops the writer, persists everything (journal + checkpoint) and releases the lease."""
+        with self.lock:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._writer is not None:
+            self._writer.join(timeout=10)
+            self._writer = None
+        if self.owned:
+            self.flush()
+            self.checkpoint()
+            self._release()
+            self.owned = False
+
+    # --- Trading ---
+
+    @contextmanager
+    def transaction(self):
+        """Holds the portfolio lock: read cash, decide and record trades atomically."""
+        with self.lock:
+            yield self
+
+    def _apply(self, ticker, signed_shares, price, timestamp):
+        self.cash -= signed_shares * price
+        shares = self.holdings.get(ticker, 0) + signed_shares
+        self.holdings[ticker] = shares
+        self._dirty.add(ticker)
+        self.last_updated = timestamp
+
+    def record_trade(self, ticker, action, shares, price, reason, timestamp=None):
+        """O(1): applies the trade in memory and queues its journal entry. Call inside transaction()."""
+        if not self.owned:
+            raise RuntimeError("Portfolio is owned by another worker")
+        timestamp = timestamp or datetime.now().isoformat()
+        trade = {
+            "id": self._next_trade_id,
+            "ticker": ticker,
+            "action": action,
+            "shares": shares,
+            "price": price,
+            "reason": reason,
+            "timestamp": timestamp
+        }
+        self._next_trade_id += 1
+        self._apply(ticker, ACTION_SIGN[action] * shares, price, timestamp)
+        self._pending.append(trade)
+        if len(self._pending) >= PORTFOLIO_FLUSH_TRADES:
+            self._wakeup.notify()
+        return trade
+
+    # --- Persistence ---
+
+    def _writer_loop(self):
+        while True:
+            with self.lock:
+                if not self._stopping and len(self._pending) < PORTFOLIO_FLUSH_TRADES:
+                    self._wakeup.wait(PORTFOLIO_FLUSH_MS / 1000)
+                if self._stopping:
+                    return
+            try:
+                if time.monotonic() - self._last_lease >= PORTFOLIO_LEASE_SECONDS / 3:
+                    self._maintain_lease()
+                if not self.owned:
+                    continue
+                self.flush()
+                if time.monotonic() - self._last_checkpoint >= PORTFOLIO_CHECKPOINT_SECONDS:
+                    self.checkpoint()
+            except Exception as e:
+                # Entries stay queued and are retried on the next tick
+                print(f"Portfolio journal flush failed: {e}")
+                time.sleep(PORTFOLIO_FLUSH_MS / 1000)
+
+    def _maintain_lease(self):
+        was_owner = self.owned
+        claimed = self._claim()
+        if claimed and not was_owner:
+            print("Portfolio lease acquired; taking over the portfolio.")
+            self.load()
+        elif was_owner and not claimed:
+            # Lease lapsed and another worker took over: our queued trades can't be journaled
+            with self.lock:
+                self.owned = False
+                for trade in self._pending:
+                    self.dead_letters.append({**trade, "error": "portfolio lease lost"})
+                self._pending = []
+            print("Portfolio lease lost to another worker; switching to read-only.")
+
+    def flush(self):
+        """Appends queued trades to the journal in one transaction."""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self.lock:
+            batch = list(self._pending)
+        if not batch:
+            return 0
+        try:
+            with db_session() as conn:
+                conn.executemany(TRADE_INSERT_SQL, [self._trade_row(t) for t in batch])
+        except sqlite3.IntegrityError:
+            # Not transient: retrying the batch would block the journal forever
+            self._flush_one_by_one(batch)
+        with self.lock:
+            # New trades may have been queued meanwhile; drop only what was written
+            del self._pending[:len(batch)]
+            self._flushed_id = batch[-1]["id"]
+        return len(batch)
+
+    def _trade_row(self, t):
+        return (t["id"], self.portfolio_id, t["ticker"], t["action"], t["shares"], t["price"],
+                t["reason"], t["timestamp"])
+
+    def _flush_one_by_one(self, batch):
+        """Journals the batch row by row; rows violating a constraint are dead-lettered."""
+        for trade in batch:
+            try:
+                with db_session() as conn:
+                    conn.execute(TRADE_INSERT_SQL, self._trade_row(trade))
+            except sqlite3.IntegrityError as e:
+                with self.lock:
+                    # Back the trade out so memory matches the journal replayed at startup
+                    signed = ACTION_SIGN[trade["action"]] * trade["shares"]
+                    self._apply(trade["ticker"], -signed, trade["price"], self.last_updated)
+                    self.dead_letters.append({**trade, "error": str(e)})
+                print(f"Trade {trade['id']} rejected by the journal ({e}); moved to dead letters.")
+
+    def checkpoint(self):
+        """Writes cash/holdings as of the last flushed trade (queued trades are backed out)."""
+        with self.lock:
+            cash, holdings = self.cash, {}
+            for trade in self._pending:
+                signed = ACTION_SIGN[trade["action"]] * trade["shares"]
+                cash += signed * trade["price"]
+                holdings[trade["ticker"]] = holdings.get(trade["ticker"], 0) - signed
+            last_id = self._flushed_id
+            last_updated = self._pending[0]["timestamp"] if self._pending else self.last_updated
+            changed = [(self.portfolio_id, ticker, self.holdings[ticker] + holdings.get(ticker, 0))
+                       for ticker in self._dirty]
+            if last_id == self._checkpoint_id and not changed:
+                self._last_checkpoint = time.monotonic()
+                return
+            # Tickers touched by queued trades stay dirty for the next checkpoint
+            self._dirty = set(holdings)
+        try:
+            with db_session() as conn:
+                conn.executemany("""
+                    INSERT INTO holdings (portfolio_id, ticker, shares) VALUES (?, ?, ?)
+                    ON CONFLICT(portfolio_id, ticker) DO UPDATE SET shares = excluded.shares
+                """, changed)
+                conn.execute(
+                    "UPDATE portfolio SET cash_balance = ?, last_updated = ?, last_trade_id = ? WHERE id = ?",
+                    (cash, last_updated, last_id, self.portfolio_id)
+                )
+        except Exception:
+            with self.lock:
+                self._dirty.update(ticker for _, ticker, _ in changed)
+            raise
+        with self.lock:
+            self._checkpoint_id = last_id
+            self._last_checkpoint = time.monotonic()
+
+    # --- Reads ---
+
+    def snapshot(self):
+        if not self.owned:
+            return self._snapshot_from_db()
+        with self.lock:
+            return {
+                "id": self.portfolio_id,
+                "cash_balance": self.cash,
+                "last_updated": self.last_updated,
+                "holdings": {t: s for t, s in self.holdings.items() if s != 0}
+            }
+
+    def _snapshot_from_db(self):
+        # Read-only workers: owner's checkpoint plus the journal written since
+        with db_read() as conn:
+            row, holdings, replay = self._read_journal(conn)
+        cash, last_updated = row["cash_balance"], row["last_updated"]
+        positions = {h["ticker"]: h["shares"] for h in holdings}
+        for trade in replay:
+            signed = ACTION_SIGN.get(trade["action"], 0) * trade["shares"]
+            cash -= signed * trade["price"]
+            positions[trade["ticker"]] = positions.get(trade["ticker"], 0) + signed
+            last_updated = trade["timestamp"]
+        return {
+            "id": row["id"],
+            "cash_balance": cash,
+            "last_updated": last_updated,
+            "holdings": {t: s for t, s in positions.items() if s != 0}
+        }
+
+    def pending_trades(self, before=None, limit=50):
+        """Queued trades not yet in SQLite, newest first (for trade-history reads)."""
+        with self.lock:
+            trades = [t for t in reversed(self._pending) if before is None or t["id"] < before]
+        return [dict(t) for t in trades[:limit]]
+
+portfolio_state = PortfolioState()
@@ -0,0 +1,249 @@
+import csv
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.core.database import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+PRICE_CACHE_DIR = os.getenv("PRICE_CACHE_DIR", os.path.join(BASE_DIR, "price_cache"))
+PRICE_TTL_SECONDS = float(os.getenv("PRICE_CACHE_TTL_SECONDS", "900"))
+PRICE_SOURCE = os.getenv("PRICE_SOURCE", "yfinance")
+PRICE_FIXTURE_DIR = os.getenv("PRICE_FIXTURE_DIR", os.path.join(BASE_DIR, "price_fixtures"))
+
+# yfinance period strings -> calendar days (None = full history)
+PERIOD_DAYS = {
+    "5d": 5, "1mo": 31, "3mo": 92, "6mo": 183,
+    "1y": 366, "2y": 731, "5y": 1827, "10y": 3653, "max": None
+}
+# Weekends/holidays: a series starting this many days after the requested
+# start still counts as covering the period.
+COVERAGE_SLACK_DAYS = 7
+
+BAR_DTYPE = np.dtype([("date", "datetime64[D]"), ("close", "f8")])
+EMPTY_BARS = np.empty(0, dtype=BAR_DTYPE)
+
+def _today():
+    return np.datetime64("today", "D")
+
+def _period_start(period):
+    days = PERIOD_DAYS.get(period, 31)
+    return None if days is None else _today() - np.timedelta64(days, "D")
+
+class YFinanceSource:
+    """Daily closes from Yahoo Finance."""
+
+    def fetch(self, ticker, start=None, period="1mo"):
+        import yfinance as yf
+        stock = yf.Ticker(ticker)
+        if start is not None:
+            hist = stock.history(start=str(start))
+        else:
+            hist = stock.history(period=period)
+        if hist.empty:
+            return EMPTY_BARS
+        bars = np.empty(len(hist), dtype=BAR_DTYPE)
+        bars["date"] = np.asarray(hist.index.strftime("%Y-%m-%d"), dtype="datetime64[D]")
+        bars["close"] = hist["Close"].to_numpy(dtype=float)
+        return bars
+
+class CSVSource:
+    """Offline stand-in: reads <directory>/<TICKER>.csv with Date,Close columns."""
+
+    def __init__(self, directory=PRICE_FIXTURE_DIR):
+        self.directory = directory
+
+    def fetch(self, ticker, start=None, period="1mo"):
+        path = os.path.join(self.directory, f"{ticker}.csv")
+        if not os.path.exists(path):
+            return EMPTY_BARS
+        with open(path, newline="") as f:
+            rows = [(row["Date"][:10], float(row["Close"])) for row in csv.DictReader(f)]
+        bars = np.array(rows, dtype=BAR_DTYPE) if rows else EMPTY_BARS
+        bars = np.sort(bars, order="date")
+        if start is None:
+            start = _period_start(period)
+        if start is not None:
+            bars = bars[bars["date"] >= np.datetime64(start, "D")]
+        return bars
+
+def default_price_source():
+    if PRICE_SOURCE == "csv":
+        return CSVSource()
+    return YFinanceSource()
+
+def _replace(src, dst, attempts=5):
+    # On Windows the rename fails while another thread/process has dst open
+    # for reading; those opens are brief, so retry a few times
+    for attempt in range(attempts):
+        try:
+            return os.replace(src, dst)
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.01 * (attempt + 1))
+
+class PriceStore:
+    """
+    On-disk daily price cache. Each ticker is a structured numpy file
+    (date, close) opened memory-mapped, plus a small JSON sidecar with the
+    fetch time, covered range and the name of the current bars file. Within the TTL requests are served from
+    memory; after it only bars newer than the last stored date are fetched.
+    """
+
+    def __init__(self, source=None, cache_dir=PRICE_CACHE_DIR, ttl=PRICE_TTL_SECONDS):
+        self.source = source or default_price_source()
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._bars = {}
+        self._meta = {}
+        self._versions = {}
+        self._responses = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, ticker):
+        with self._locks_guard:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    @staticmethod
+    def _safe_name(ticker):
+        return "".join(c for c in ticker.upper() if c.isalnum() or c in "-_.^=")
+
+    def _meta_path(self, ticker):
+        return os.path.join(self.cache_dir, f"{self._safe_name(ticker)}.json")
+
+    def _bars_path(self, ticker, meta):
+        # Caches written before versioned files used a fixed <TICKER>.npy
+        name = meta.get("bars_file") or f"{self._safe_name(ticker)}.npy"
+        return os.path.join(self.cache_dir, name)
+
+    def _load(self, ticker):
+        if ticker in self._bars:
+            return
+        meta_path = self._meta_path(ticker)
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                self._bars[ticker] = np.load(self._bars_path(ticker, meta), mmap_mode="r")
+                self._meta[ticker] = meta
+                self._versions[ticker] = self._versions.get(ticker, 0) + 1
+                return
+            except (OSError, ValueError) as e:
+                logger.warning(f"Discarding unreadable price cache for {ticker}: {e}")
+        self._bars[ticker] = EMPTY_BARS
+        self._meta[ticker] = {"fetched_at": 0, "covered_from": None, "full": False}
+
+    def _save(self, ticker, bars, meta):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Each refresh writes a new versioned bars file and then repoints the
+        # sidecar at it: the previous file may still be memory-mapped by
+        # readers, and Windows refuses to replace or delete a mapped file.
+        safe = self._safe_name(ticker)
+        bars_file = f"{safe}.{time.time_ns()}.npy"
+        with open(os.path.join(self.cache_dir, bars_file), "wb") as f:
+            np.save(f, bars)
+        meta = {**meta, "bars_file": bars_file}
+        meta_path = self._meta_path(ticker)
+        tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump(meta, f)
+        _replace(tmp_meta, meta_path)
+        self._bars[ticker] = np.load(os.path.join(self.cache_dir, bars_file), mmap_mode="r")
+        self._meta[ticker] = meta
+        self._versions[ticker] = self._versions.get(ticker, 0) + 1
+        self._remove_stale(safe, keep=bars_file)
+
+    def _remove_stale(self, safe, keep):
+        """Deletes older bars files of a ticker; ones still mapped (Windows) go on a later save."""
+        prefix = f"{safe}."
+        for name in os.listdir(self.cache_dir):
+            if name == keep or not (name.startswith(prefix) and name.endswith(".npy")):
+                continue
+            # "" is the legacy <TICKER>.npy; non-digits are another ticker (BRK vs BRK.B)
+            version = name[len(prefix):-len(".npy")]
+            if version and not version.isdigit():
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _covers(self, meta, period):
+        if meta.get("full"):
+            return True
+        start = _period_start(period)
+        if start is None or meta.get("covered_from") is None:
+            return False
+        covered = np.datetime64(meta["covered_from"], "D")
+        return covered <= start + np.timedelta64(COVERAGE_SLACK_DAYS, "D")
+
+    def _refresh(self, ticker, period):
+        bars, meta = self._bars[ticker], self._meta[ticker]
+        fresh = time.time() - meta.get("fetched_at", 0) < self.ttl
+        covers = self._covers(meta, period)
+        if fresh and covers:
+            return
+
+        if covers and len(bars):
+            # Incremental: refetch from the last stored bar (it may have been partial)
+            last = bars["date"][-1]
+            new = self.source.fetch(ticker, start=last)
+            merged = np.concatenate([bars[bars["date"] < last], new]) if len(new) else np.array(bars)
+            covered_from, full = meta.get("covered_from"), meta.get("full", False)
+        else:
+            merged = self.source.fetch(ticker, period=period)
+            start = _period_start(period)
+            covered_from = str(start) if start is not None else None
+            full = start is None
+
+        self._save(ticker, merged, {
+            "fetched_at": time.time(),
+            "covered_from": covered_from,
+            "full": full
+        })
+
+    def _get_versioned(self, ticker, period):
+        """(bars, version) for the period; both read under the ticker lock so they match."""
+        with self._lock(ticker):
+            self._load(ticker)
+            try:
+                self._refresh(ticker, period)
+            except Exception as e:
+                # Serve whatever is stored rather than failing the chart
+                logger.error(f"Error refreshing prices for {ticker}: {e}")
+            bars = self._bars[ticker]
+            version = self._versions.get(ticker, 0)
+        start = _period_start(period)
+        if start is not None:
+            bars = bars[bars["date"] >= start]
+        return bars, version
+
+    def get_bars(self, ticker, period="1mo"):
+        """Daily (date, close) bars for the period, refreshed per the TTL."""
+        return self._get_versioned(ticker, period)[0]
+
+    def get_closes(self, ticker, period="1y"):
+        return np.asarray(self.get_bars(ticker, period)["close"], dtype=float)
+
+    def history(self, ticker, period="1mo"):
+        """Frontend format: [{"date": "YYYY-MM-DD", "price": 123.45}, ...]."""
+        bars, version = self._get_versioned(ticker, period)
+        key = (ticker, period, _period_start(period))
+        cached = self._responses.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # Column-wise conversion instead of per-row pandas access
+        dates = np.datetime_as_string(bars["date"], unit="D").tolist()
+        prices = np.round(bars["close"], 2).tolist()
+        data = [{"date": d, "price": p} for d, p in zip(dates, prices)]
+        self._responses[key] = (version, data)
+        return data
+
+price_store = PriceStore()
@@ -1,19 +1,58 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from app.services.feed import fetch_mock_news
-from app.agents.graph import create_graph
+from app.agents.graph import create_graph, create_batch_graph
+from app.core.executors import PIPELINE_CONCURRENCY
+from app.agents.macro_agent import macro_agent, MACRO_REFRESH_SECONDS
+from app.services.evolution_jobs import evolution_jobs, EVOLUTION_LEASE_SECONDS
+from app.agents.trader_agent import trader_agent
 import asyncio
+import os
+
+# Items fetched per poll; >1 routes them through the batched pipeline
+NEWS_POLL_BATCH_SIZE = int(os.getenv("NEWS_POLL_BATCH_SIZE", "1"))
+# 0: run a poll's items as separate graph runs, up to PIPELINE_CONCURRENCY at once
+NEWS_POLL_BATCHED = os.getenv("NEWS_POLL_BATCHED", "1") == "1"
+TRADE_FORWARD_DRAIN_SECONDS = float(os.getenv("TRADE_FORWARD_DRAIN_SECONDS", "1"))
 
 scheduler = AsyncIOScheduler()
 graph = create_graph()
+batch_graph = create_batch_graph()
+# Caps graph runs in flight so ingestion can't monopolize the worker pools
+pipeline_slots = asyncio.Semaphore(PIPELINE_CONCURRENCY)
+
+async def process_news_item(news_item):
+    async with pipeline_slots:
+        return await graph.ainvoke({"news_item": news_item})
+
+async def process_news_batch(news_items):
+    """Runs several news items through the pipeline together; returns one state per item."""
+    if not news_items:
+        return []
+    async with pipeline_slots:
+        result = await batch_graph.ainvoke({"items": [{"news_item": item} for item in news_items]})
+    return result["items"]
 
 async def poll_news():
     print("Polling for news...")
-    news_items = fetch_mock_news(count=1)
+    news_items = fetch_mock_news(count=NEWS_POLL_BATCH_SIZE)
+    if len(news_items) > 1 and NEWS_POLL_BATCHED:
+        print(f"Processing batch of {len(news_items)} news items")
+        await process_news_batch(news_items)
+        return
     for item in news_items:
         print(f"Processing news: {item['headline']}")
-        # Run the graph
-        await graph.ainvoke({"news_item": item})
+    # Run the graphs concurrently; pipeline_slots caps how many are in flight
+    results = await asyncio.gather(*(process_news_item(item) for item in news_items), return_exceptions=True)
+    for item, result in zip(news_items, results):
+        if isinstance(result, Exception):
+            print(f"Error processing news {item['id']}: {result}")
 
 def start_scheduler():
     scheduler.add_job(poll_news, "interval", seconds=10)
+    # Sync job: APScheduler runs it on a worker thread, off the event loop
+    scheduler.add_job(macro_agent.refresh, "interval", seconds=MACRO_REFRESH_SECONDS)
+    # Portfolio owner applies decisions forwarded by the other workers (no-op elsewhere)
+    scheduler.add_job(trader_agent.drain_forwarded, "interval", seconds=TRADE_FORWARD_DRAIN_SECONDS)
+    # Picks up evolution jobs orphaned by a worker that died holding them
+    scheduler.add_job(evolution_jobs.resume_interrupted, "interval", seconds=EVOLUTION_LEASE_SECONDS)
     scheduler.start()
@@ -0,0 +1,376 @@
+"""
+Load generator / replay harness for the ingestion pipeline.
+
+Streams synthetic items from feed.generate_news_item at a target rate, or a
+recorded JSONL archive, through the compiled graph and reports throughput,
+per-node latency percentiles, queue lag and SQLite/Chroma write rates.
+
+    python -m app.tools.loadgen --rate 50 --duration 30 --stub-models
+    python -m app.tools.loadgen --replay news.jsonl --speed 10 --batch-size 16
+
+Runs against a scratch database/Chroma directory unless --use-live-db.
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from app.core import database
+from app.core.executors import PIPELINE_CONCURRENCY
+from app.services.dedup import parse_timestamp
+
+STUB_EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+PERCENTILES = (50, 95, 99)
+# Extra words appended by --unique so the headline pass doesn't collapse the
+# ten feed templates into a handful of stories
+UNIQUE_VOCABULARY = (
+    "guidance", "margin", "filing", "analyst", "supplier", "contract", "europe", "asia",
+    "quarter", "board", "outlook", "segment", "cloud", "retail", "pricing", "volume",
+    "capex", "buyback", "dividend", "forecast", "demand", "inventory", "shipments", "lawsuit"
+)
+
+# --- Stubs for the heavy dependencies ---
+
+class StubEmbedder:
+    """
+    Deterministic stand-in for SentenceTransformer.encode: a unit vector
+    seeded by the text's hash, so identical documents embed identically and
+    distinct ones are (nearly) orthogonal.
+    """
+
+    def __init__(self, dim=STUB_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return np.stack([self._vector(t) for t in texts]) if texts else np.empty((0, self.dim), np.float32)
+
+class SyntheticPriceSource:
+    """Offline price source: a per-ticker deterministic random walk (replaces yfinance)."""
+
+    def fetch(self, ticker, start=None, period="1mo"):
+        from app.services.backtest import synthetic_prices
+        from app.services.price_store import BAR_DTYPE, _period_start
+        today = np.datetime64("today", "D")
+        if start is None:
+            start = _period_start(period)
+        start = np.datetime64(start, "D") if start is not None else today - np.timedelta64(3653, "D")
+        days = int((today - start) / np.timedelta64(1, "D")) + 1
+        seed = int.from_bytes(hashlib.blake2b(ticker.encode(), digest_size=4).digest(), "big")
+        bars = np.empty(days, dtype=BAR_DTYPE)
+        bars["date"] = start + np.arange(days)
+        bars["close"] = synthetic_prices(n=max(days, 2), seed=seed)[-days:]
+        return bars
+
+def stub_dependencies(workdir):
+    """Swaps in the stub embedder and price source (no model or network I/O)."""
+    from app.services.local_rag import local_rag_service
+    from app.services.price_store import price_store
+    local_rag_service.embedding_model = StubEmbedder()
+    price_store.source = SyntheticPriceSource()
+    price_store.cache_dir = os.path.join(workdir, "price_cache")
+
+# --- Item sources ---
+
+def synthetic_items(count, unique=False):
+    from app.services.feed import generate_news_item
+    for _ in range(count):
+        item = generate_news_item()
+        if unique:
+            item["headline"] += " - " + " ".join(random.sample(UNIQUE_VOCABULARY, 4))
+        yield item
+
+def load_archive(path):
+    """Reads a JSONL archive of news items; missing id/source/timestamp are filled in."""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault("id", str(uuid.uuid4()))
+            item.setdefault("source", "replay")
+            item.setdefault("timestamp", datetime.now().isoformat())
+            yield item
+
+def rate_schedule(items, rate):
+    """(offset_seconds, item) at a fixed arrival rate; rate <= 0 means all at once."""
+    interval = 1.0 / rate if rate > 0 else 0.0
+    for i, item in enumerate(items):
+        yield i * interval, item
+
+def recorded_schedule(items, speed):
+    """(offset_seconds, item) following the archive's own timestamps, sped up `speed`x."""
+    first = None
+    for item in items:
+        ts = parse_timestamp(item["timestamp"])
+        if first is None:
+            first = ts
+        yield max(ts - first, 0.0) / speed, item
+
+# --- Instrumentation ---
+
+class NodeTimer:
+    """Pass as create_graph(wrap=...) to record wall time per node call."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def _record(self, name, elapsed):
+        self.samples.setdefault(name, []).append(elapsed)
+
+    def __call__(self, name, fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(state):
+                start = time.perf_counter()
+                try:
+                    return await fn(state)
+                finally:
+                    self._record(name, time.perf_counter() - start)
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed(state):
+            start = time.perf_counter()
+            try:
+                return fn(state)
+            finally:
+                self._record(name, time.perf_counter() - start)
+        return timed
+
+def summarize(samples):
+    """Count, mean, p50/p95/p99 and max of a list of seconds, in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000.0
+    summary = {"count": len(ms), "mean_ms": round(float(ms.mean()), 3)}
+    for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(value), 3)
+    summary["max_ms"] = round(float(ms.max()), 3)
+    return summary
+
+def write_counts():
+    """Rows in news/trades and vectors in Chroma (trades are flushed first)."""
+    from app.services.portfolio_state import portfolio_state
+    portfolio_state.flush()
+    with database.db_read() as conn:
+        news = conn.execute("SELECT COUNT(*) FROM news").fetchone()[0]
+        trades = conn.execute("SELECT COUNT(*) FROM trades").fetchone()[0]
+    vectors = database.get_chroma_collection("news_embeddings").count()
+    return {"news_rows": news, "trades": trades, "chroma_vectors": vectors}
+
+# --- Runner ---
+
+async def run_load(schedule, graph, concurrency, batch_size=1):
+    """
+    Feeds the schedule into a queue drained by `concurrency` workers, each
+    running the graph on up to `batch_size` queued items. Queue lag is the
+    time an item waited past its scheduled arrival before a worker took it.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stats = {"lag": [], "e2e": [], "items": 0, "duplicates": 0, "trades": 0,
+             "errors": 0, "max_queue_depth": 0, "last_error": None}
+    start = loop.time()
+
+    async def produce():
+        for offset, item in schedule:
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queue.put_nowait((start + offset, item))
+            stats["max_queue_depth"] = max(stats["max_queue_depth"], queue.qsize())
+        for _ in range(concurrency):
+            queue.put_nowait(None)
+
+    async def consume():
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            entries = [entry]
+            while len(entries) < batch_size and not queue.empty():
+                extra = queue.get_nowait()
+                if extra is None:
+                    # Hand the stop marker back for another worker, finish this batch
+                    queue.put_nowait(None)
+                    break
+                entries.append(extra)
+            picked = loop.time()
+            stats["lag"].extend(picked - scheduled for scheduled, _ in entries)
+            try:
+                if batch_size > 1:
+                    result = await graph.ainvoke({"items": [{"news_item": item} for _, item in entries]})
+                    states = result["items"]
+                else:
+                    states = [await graph.ainvoke({"news_item": entries[0][1]})]
+            except Exception as e:
+                stats["errors"] += len(entries)
+                stats["last_error"] = repr(e)
+                continue
+            done = loop.time()
+            stats["e2e"].extend(done - scheduled for scheduled, _ in entries)
+            stats["items"] += len(states)
+            for state in states:
+                if state.get("is_duplicate"):
+                    stats["duplicates"] += 1
+                elif state.get("trade_result", {}).get("action", "SKIP") != "SKIP":
+                    stats["trades"] += 1
+
+    await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+    stats["elapsed"] = loop.time() - start
+    return stats
+
+def offered_rate(schedule):
+    """Arrival rate the schedule asks for (None when everything arrives at once)."""
+    span = schedule[-1][0] if schedule else 0.0
+    return round((len(schedule) - 1) / span, 2) if span > 0 else None
+
+def build_report(stats, timer, before, after, offered):
+    elapsed = max(stats["elapsed"], 1e-9)
+    writes = {key: after[key] - before[key] for key in after}
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "items": stats["items"],
+        "errors": stats["errors"],
+        "last_error": stats["last_error"],
+        "offered_rate": offered,
+        "throughput_per_second": round(stats["items"] / elapsed, 2),
+        "duplicates": stats["duplicates"],
+        "trades_executed": stats["trades"],
+        "max_queue_depth": stats["max_queue_depth"],
+        "queue_lag": summarize(stats["lag"]),
+        "end_to_end": summarize(stats["e2e"]),
+        "nodes": {name: summarize(samples) for name, samples in timer.samples.items()},
+        "writes": {
+            **writes,
+            **{f"{key}_per_second": round(value / elapsed, 2) for key, value in writes.items()}
+        }
+    }
+
+def print_report(report):
+    offered = "unthrottled" if report["offered_rate"] is None else f"{report['offered_rate']}/s"
+    print(f"Items: {report['items']} in {report['elapsed_seconds']}s "
+          f"({report['throughput_per_second']}/s, offered {offered}), "
+          f"{report['duplicates']} duplicates, {report['errors']} errors")
+    if report["last_error"]:
+        print(f"Last error: {report['last_error']}")
+    print(f"Max queue depth: {report['max_queue_depth']}")
+    header = f"{'stage':<12}{'calls':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"
+    print(header)
+    rows = [(name, s) for name, s in report["nodes"].items()]
+    rows += [("queue lag", report["queue_lag"]), ("end-to-end", report["end_to_end"])]
+    for name, s in rows:
+        if not s["count"]:
+            continue
+        print(f"{name:<12}{s['count']:>8}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}"
+              f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    w = report["writes"]
+    print(f"Writes: {w['news_rows']} news rows ({w['news_rows_per_second']}/s), "
+          f"{w['chroma_vectors']} Chroma vectors ({w['chroma_vectors_per_second']}/s), "
+          f"{w['trades']} trades ({w['trades_per_second']}/s)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.tools.loadgen", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--replay", metavar="JSONL", help="replay a recorded archive instead of synthetic items")
+    parser.add_argument("--rate", type=float,
+                        help="arrivals per second, 0 = all at once (default 10; --replay defaults to 0)")
+    parser.add_argument("--speed", type=float,
+                        help="with --replay and no --rate: follow recorded timestamps sped up this many times")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of synthetic load")
+    parser.add_argument("--count", type=int, help="synthetic items to send (overrides --duration)")
+    parser.add_argument("--unique", action="store_true", help="make synthetic headlines distinct so dedup passes them")
+    parser.add_argument("--concurrency", type=int, default=PIPELINE_CONCURRENCY, help="graph runs in flight")
+    parser.add_argument("--batch-size", type=int, default=1, help=">1 uses the batched graph")
+    parser.add_argument("--stub-models", action="store_true", help="stub the embedding model and yfinance")
+    parser.add_argument("--use-live-db", action="store_true", help="write to the real finai.db / chroma_db")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--seed", type=int, help="seed for synthetic items")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline prints")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+def build_schedule(args):
+    if args.replay:
+        items = load_archive(args.replay)
+        if args.rate is None and args.speed:
+            return list(recorded_schedule(items, args.speed))
+        # Plain replay: as fast as the pipeline takes it
+        return list(rate_schedule(items, args.rate or 0.0))
+    rate = 10.0 if args.rate is None else args.rate
+    count = args.count if args.count is not None else max(1, int(args.duration * rate))
+    return list(rate_schedule(synthetic_items(count, args.unique), rate))
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="finai-loadgen-")
+    if not args.use_live_db:
+        # Connections and the Chroma client are opened lazily, so this must
+        # happen before anything touches the database
+        database.DB_PATH = os.path.join(workdir, "finai.db")
+        database.CHROMA_PATH = os.path.join(workdir, "chroma_db")
+    if args.stub_models:
+        stub_dependencies(workdir)
+
+    from app.agents.graph import create_graph, create_batch_graph
+    from app.core.executors import shutdown_executors
+    from app.services.dedup import news_deduplicator
+    from app.services.portfolio_state import portfolio_state
+
+    schedule = build_schedule(args)
+    timer = NodeTimer()
+    graph = create_batch_graph(wrap=timer) if args.batch_size > 1 else create_graph(wrap=timer)
+
+    database.init_db()
+    portfolio_state.load()
+    portfolio_state.start()
+    news_deduplicator.warm_start(database.get_chroma_collection("news_embeddings"))
+    try:
+        before = write_counts()
+        print(f"Sending {len(schedule)} items (concurrency {args.concurrency}, "
+              f"batch size {args.batch_size})...", file=sys.stderr)
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+        with quiet:
+            stats = asyncio.run(run_load(schedule, graph, args.concurrency, max(1, args.batch_size)))
+        after = write_counts()
+    finally:
+        portfolio_state.close()
+        shutdown_executors()
+        database.close_db_connections()
+        database.close_chroma_client()
+        if args.keep:
+            print(f"Scratch data kept in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = build_report(stats, timer, before, after, offered_rate(schedule))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return report
+
+if __name__ == "__main__":
+    main()
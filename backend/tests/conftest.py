@@ -0,0 +1,12 @@
+import pytest
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+    """Points SQLite/Chroma at a temporary directory and creates the schema."""
+    from app.core import database
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "finai.db"))
+    monkeypatch.setattr(database, "CHROMA_PATH", str(tmp_path / "chroma_db"))
+    database.close_db_connections()
+    database.init_sqlite()
+    yield database
+    database.close_db_connections()
@@ -0,0 +1,33 @@
+import numpy as np
+
+from app.services.dedup import NewsDeduplicator
+
+def _item(news_id, headline, ticker="AAPL", timestamp="2026-01-01T12:00:00"):
+    return {"id": news_id, "headline": headline, "ticker": ticker, "timestamp": timestamp}
+
+def test_unregister_releases_an_unstored_original():
+    dedup = NewsDeduplicator(capacity=8)
+    vector = np.ones(4)
+    assert dedup.check_and_register(_item("a", "Apple beats earnings"), vector) == (None, None)
+    assert dedup.check_and_register(_item("b", "Apple beats earnings"), vector)[0] == "a"
+
+    # "a" failed to store: its copy is now the original
+    dedup.unregister("a")
+    assert dedup.match_headline(_item("b", "Apple beats earnings")) is None
+    assert dedup.check_and_register(_item("b", "Apple beats earnings"), vector) == (None, None)
+    assert dedup.size == 1
+
+def test_unregister_ignores_evicted_slots():
+    dedup = NewsDeduplicator(capacity=2)
+    for i, headline in enumerate(["one story here", "two story there", "three more words"]):
+        dedup.check_and_register(_item(str(i), headline))
+    dedup.unregister("0")  # already evicted by the ring buffer
+    assert dedup.size == 2
+    assert dedup.match_headline(_item("x", "three more words")) == "2"
+
+def test_exact_matches_are_scoped_per_ticker():
+    dedup = NewsDeduplicator(capacity=8)
+    assert dedup.check_and_register(_item("a", "Chip stocks rally", ticker="NVDA")) == (None, None)
+    assert dedup.check_and_register(_item("b", "Chip stocks rally", ticker="AMD")) == (None, None)
+    assert dedup.check_and_register(_item("c", "Chip stocks rally!", ticker="NVDA")) == ("a", "headline")
+    assert dedup.check_and_register(_item("d", "chip stocks rally", ticker="AMD")) == ("b", "headline")
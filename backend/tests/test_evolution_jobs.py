@@ -0,0 +1,30 @@
+import time
+
+from app.services.backtest import synthetic_prices
+from app.services.evolution_jobs import EvolutionJobManager
+
+def _wait_finished(manager, job_ids, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if all(manager.get(job_id)["status"] == "completed" for job_id in job_ids):
+            return
+        time.sleep(0.05)
+    raise AssertionError("evolution jobs did not finish")
+
+def test_finished_jobs_are_not_retained_in_memory(scratch_db):
+    manager = EvolutionJobManager(workers=1)
+    manager._prices = synthetic_prices(n=300)
+    job_ids = [manager.start(population_size=20, generations=2)["id"] for _ in range(5)]
+    _wait_finished(manager, job_ids)
+    # The entry is dropped right after the final checkpoint
+    deadline = time.time() + 5
+    while manager.jobs and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert manager.jobs == {}
+    # Still readable from the summary columns
+    job = manager.get(job_ids[0])
+    assert job["generation"] == 2
+    assert len(job["history"]) == 2
+    assert job["best"] is not None
+    manager.shutdown()
@@ -0,0 +1,45 @@
+import time
+
+from app.agents.macro_agent import MacroAgent
+
+class FlakyProvider:
+    name = "flaky"
+
+    def __init__(self):
+        self.calls = 0
+        self.failing = False
+
+    def fetch(self):
+        self.calls += 1
+        if self.failing:
+            raise ConnectionError("provider down")
+        return {"VIX": 18.0, "10Y_Yield": 4.0, "Oil": 80.0}
+
+def test_failed_refresh_backs_off_and_serves_stale_snapshot():
+    provider = FlakyProvider()
+    agent = MacroAgent(provider=provider, ttl=0.01, backoff=60, max_backoff=600)
+    first = agent.snapshot()
+    time.sleep(0.02)
+
+    provider.failing = True
+    for _ in range(50):
+        assert agent.snapshot() is first
+    # One fetch for the initial snapshot, one failed retry; the rest hit the backoff window
+    assert provider.calls == 2
+    assert agent.analyze_regime() == "Risk-On"
+
+def test_backoff_grows_and_is_capped():
+    provider = FlakyProvider()
+    agent = MacroAgent(provider=provider, ttl=0.01, backoff=10, max_backoff=25)
+    agent.snapshot()
+    provider.failing = True
+    delays = []
+    for _ in range(4):
+        start = time.time()
+        agent.refresh()
+        delays.append(round(agent._expires_at - start))
+    assert delays == [10, 20, 25, 25]
+
+    provider.failing = False
+    agent.refresh()
+    assert agent._failures == 0
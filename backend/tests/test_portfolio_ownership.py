@@ -0,0 +1,40 @@
+from app.agents.trader_agent import TraderAgent
+from app.services.portfolio_state import PortfolioState
+
+def _items(n):
+    return [{"ticker": f"T{i}", "headline": f"headline {i}"} for i in range(n)]
+
+def _count(database, table):
+    with database.db_read() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_non_owner_decisions_are_forwarded_and_applied_by_owner(scratch_db):
+    owner, reader = PortfolioState(), PortfolioState()
+    owner.load()
+    reader.load()
+    assert owner.owned and not reader.owned
+
+    sentiments = [0.9, -0.8, 0.1, 0.7]
+    results = TraderAgent(reader).evaluate_trades(
+        _items(4), sentiments, ["Risk-On"] * 4, [0] * 4
+    )
+    # Nothing is traded locally, and nothing is silently skipped either
+    assert all(r["forwarded"] for r in results)
+    assert _count(scratch_db, "trade_decision_queue") == 4
+
+    applied = TraderAgent(owner).drain_forwarded()
+    assert applied == 4
+    assert _count(scratch_db, "trade_decision_queue") == 0
+    # 0.1 is below the confidence threshold; the other three trade
+    assert _count(scratch_db, "trades") == 3
+    assert reader.snapshot()["holdings"] == {"T0": 20, "T1": -19, "T3": 19}
+    owner.close()
+
+def test_drain_is_a_no_op_outside_the_owner(scratch_db):
+    owner, reader = PortfolioState(), PortfolioState()
+    owner.load()
+    reader.load()
+    TraderAgent(reader).evaluate_trades(_items(1), [0.9], ["Risk-On"], [0])
+    assert TraderAgent(reader).drain_forwarded() == 0
+    assert _count(scratch_db, "trade_decision_queue") == 1
+    owner.close()
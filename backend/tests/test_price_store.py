@@ -0,0 +1,41 @@
+import numpy as np
+
+from app.services.price_store import BAR_DTYPE, PriceStore
+
+class CountingSource:
+    """Each fetch ends in a new close, so every refresh is observable."""
+
+    def __init__(self):
+        self.fetches = 0
+
+    def fetch(self, ticker, start=None, period="1mo"):
+        self.fetches += 1
+        today = np.datetime64("today", "D")
+        return np.array([(today - np.timedelta64(1, "D"), 1.0), (today, float(self.fetches))],
+                        dtype=BAR_DTYPE)
+
+def test_history_cache_is_keyed_on_the_version_of_the_bars_it_built(tmp_path):
+    source = CountingSource()
+    store = PriceStore(source=source, cache_dir=str(tmp_path), ttl=3600)
+    first = store.history("AAPL", "5d")
+    assert first[-1]["price"] == 1.0
+    assert store.history("AAPL", "5d") is first
+
+    # Another request refreshes the ticker right after history() read its bars
+    get_versioned = store._get_versioned
+
+    def racing_get_versioned(ticker, period):
+        result = get_versioned(ticker, period)
+        store.ttl = 0
+        get_versioned(ticker, period)
+        store.ttl = 3600
+        return result
+
+    store._responses.clear()
+    store.ttl = 0
+    store._get_versioned = racing_get_versioned
+    assert store.history("AAPL", "5d")[-1]["price"] == 2.0
+    store._get_versioned = get_versioned
+
+    # The refreshed bars must not be shadowed by the response built from older ones
+    assert store.history("AAPL", "5d")[-1]["price"] == 3.0
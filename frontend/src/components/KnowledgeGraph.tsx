@@ -1,11 +1,20 @@
 import React, { useEffect, useState } from 'react';
-import { fetchKnowledgeGraph } from '../lib/api';
+import { fetchKnowledgeGraph, KnowledgeGraphData } from '../lib/api';
 
 const KnowledgeGraph: React.FC = () => {
-    const [graph, setGraph] = useState<{ nodes: any[], links: any[] } | null>(null);
+    const [graph, setGraph] = useState<KnowledgeGraphData | null>(null);
 
     useEffect(() => {
-        fetchKnowledgeGraph().then(setGraph);
+        const loadGraph = async () => {
+            try {
+                setGraph(await fetchKnowledgeGraph());
+            } catch (error) {
+                console.error("Failed to fetch knowledge graph", error);
+            }
+        };
+        loadGraph();
+        const interval = setInterval(loadGraph, 5000); // Unchanged graphs come back as 304, changes as deltas
+        return () => clearInterval(interval);
     }, []);
 
     if (!graph) return <div>Loading Graph...</div>;
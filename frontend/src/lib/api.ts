@@ -30,6 +30,17 @@ export const fetchLatestNews = async (limit: number = 50): Promise<NewsItem[]> =
     return response.data;
 };
 
+export interface NewsPage {
+    items: NewsItem[];
+    next_before: string | null;
+}
+
+// Pass the previous page's next_before to continue; null means no more pages
+export const fetchNewsPage = async (limit: number = 50, before?: string, ticker?: string): Promise<NewsPage> => {
+    const response = await axios.get(`${API_URL}/latest-news/page`, { params: { limit, before, ticker } });
+    return response.data;
+};
+
 export const chatWithBot = async (query: string): Promise<any> => {
     const response = await axios.post(`${API_URL}/chat`, { query });
     return response.data;
@@ -40,9 +51,56 @@ export const fetchMarketData = async (ticker: string) => {
     return response.data;
 };
 
-export const fetchKnowledgeGraph = async () => {
-    const response = await axios.get(`${API_URL}/knowledge-graph`);
-    return response.data;
+export interface GraphNode {
+    id: string;
+    type: string;
+    val: number;
+}
+
+export interface GraphLink {
+    source: string;
+    target: string;
+}
+
+export interface KnowledgeGraphData {
+    version: number;
+    nodes: GraphNode[];
+    links: GraphLink[];
+}
+
+// Last graph received and its ETag; later polls ask only for the changes since it
+let knowledgeGraph: KnowledgeGraphData | null = null;
+let knowledgeGraphEtag: string | null = null;
+
+const linkKey = (link: GraphLink) => `${link.source}\u0000${link.target}`;
+
+const mergeGraphDelta = (graph: KnowledgeGraphData, delta: any): KnowledgeGraphData => {
+    // Removals first, then additions (upserts), as the server's delta expects
+    const nodes = new Map(graph.nodes.map(node => [node.id, node]));
+    delta.removed_nodes.forEach((id: string) => nodes.delete(id));
+    delta.added_nodes.forEach((node: GraphNode) => nodes.set(node.id, node));
+    const links = new Map(graph.links.map(link => [linkKey(link), link]));
+    delta.removed_links.forEach((link: GraphLink) => links.delete(linkKey(link)));
+    delta.added_links.forEach((link: GraphLink) => links.set(linkKey(link), link));
+    return { version: delta.version, nodes: [...nodes.values()], links: [...links.values()] };
+};
+
+export const fetchKnowledgeGraph = async (): Promise<KnowledgeGraphData> => {
+    const headers: Record<string, string> = {};
+    if (knowledgeGraph && knowledgeGraphEtag) headers['If-None-Match'] = knowledgeGraphEtag;
+    const response = await axios.get(`${API_URL}/knowledge-graph`, {
+        params: knowledgeGraph ? { since: knowledgeGraph.version } : {},
+        headers,
+        validateStatus: status => (status >= 200 && status < 300) || status === 304
+    });
+    if (response.status === 304 && knowledgeGraph) return knowledgeGraph;
+
+    const data = response.data;
+    knowledgeGraph = data.full === false && knowledgeGraph
+        ? mergeGraphDelta(knowledgeGraph, data)
+        : { version: data.version, nodes: data.nodes, links: data.links };
+    knowledgeGraphEtag = response.headers['etag'] ?? null;
+    return knowledgeGraph;
 };
 
 export const fetchComments = async (newsId: string): Promise<Comment[]> => {